@@ -0,0 +1,320 @@
+#######################################################################################################
+#
+# Persistent on-disk cache of NOAA ACIS station daily data
+#
+#######################################################################################################
+
+import os, time, zlib, sqlite3
+import numpy as np
+import pandas as pd
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_stream as stream
+
+#######################################################################################################
+#
+# CACHE SETTINGS
+#
+#######################################################################################################
+
+# Location of the SQLite file holding all cached stations
+cache_path = os.path.join(os.path.expanduser('~'),'.cache','ClimateDataVisualizer','acis_stndata.sqlite')
+
+# Seconds before the most recent days of a cached station are checked again with NOAA ACIS
+cache_ttl = 86400
+
+# Number of most recent days of a cached station that are re-queried once 'cache_ttl' has passed
+cache_settle_days = 30
+
+# Maximum size of all cached data in bytes, least recently used stations are removed beyond this
+cache_max_bytes = 500*1024**2
+
+# Version of the layout of cached data, caches written with an older layout are emptied when opened
+cache_schema = 2
+
+#======================================================================================================
+# Change cache settings
+#======================================================================================================
+
+def configure_cache(path: str = None, ttl: int = None, settle_days: int = None, max_bytes: int = None):
+
+    '''
+    Changes the settings of the station data cache. Any parameter left as None keeps its current value.
+
+    Parameters
+    -------------
+    path
+     class: 'string', Path to the SQLite file holding all cached stations.
+                      Default is '~/.cache/ClimateDataVisualizer/acis_stndata.sqlite'.
+
+    ttl
+     class: 'integer', Seconds after which the most recent days of a cached station are checked again
+                       with NOAA ACIS. Historical days are never queried again. Default is 86400.
+
+    settle_days
+     class: 'integer', Number of most recent days of a cached station that are re-queried once 'ttl'
+                       has passed, to pick up values that were reported late. Default is 30.
+
+    max_bytes
+     class: 'integer', Maximum size of all cached data in bytes. Least recently used stations are
+                       removed once this size is exceeded. Default is 500 MB.
+    '''
+
+    global cache_path, cache_ttl, cache_settle_days, cache_max_bytes
+
+    if path is not None: cache_path = path
+    if ttl is not None: cache_ttl = ttl
+    if settle_days is not None: cache_settle_days = settle_days
+    if max_bytes is not None: cache_max_bytes = max_bytes
+
+#######################################################################################################
+#
+# CACHE FUNCTIONS
+#
+#######################################################################################################
+
+#======================================================================================================
+# Open connection to cache file, create table if it does not exist yet
+#======================================================================================================
+
+def connect():
+
+    '''
+    Opens a new connection to the SQLite cache file. A new connection is opened for every call so the
+    cache can be used from several threads at once.
+
+    Returns
+    ---------------------
+    output: class: 'sqlite3.Connection'
+    '''
+
+    if os.path.dirname(cache_path) != '':
+     os.makedirs(os.path.dirname(cache_path),exist_ok=True)
+
+    con = sqlite3.connect(cache_path,timeout=60)
+    con.execute('PRAGMA journal_mode=WAL')
+    if con.execute('PRAGMA user_version').fetchone()[0] != cache_schema:
+     con.execute('DROP TABLE IF EXISTS stndata')
+     con.execute('PRAGMA user_version='+str(int(cache_schema)))
+    con.execute('CREATE TABLE IF NOT EXISTS stndata (elem TEXT, sid TEXT, sdate TEXT, edate TEXT, '+
+                'updated REAL, accessed REAL, nbytes INTEGER, data BLOB, PRIMARY KEY (elem, sid))')
+
+    return con
+
+#======================================================================================================
+# Find which dates of a station must still be queried from NOAA ACIS
+#======================================================================================================
+
+def cache_plan(elem: str, sid: str, sdate: str, edate: str):
+
+    '''
+    Compares the requested date range of a station with its cached date range and returns the range
+    of dates that must still be queried from NOAA ACIS. Only days after the cached 'edate' are
+    queried, along with the most recent 'cache_settle_days' days of the cache once 'cache_ttl' has
+    passed. If the requested 'sdate' is before the cached 'sdate', the whole range is queried again.
+
+    Parameters
+    -------------
+    elem, sid, sdate, edate
+     class: 'string', Element, station ID, and requested starting and ending dates ('YYYY-MM-DD').
+
+    Returns
+    ---------------------
+    output: class: 'tuple', (sdate, edate) strings of the dates to query, or None if the requested
+                            date range is fully served by the cache.
+    '''
+
+    with connect() as con:
+     row = con.execute('SELECT sdate, edate, updated FROM stndata WHERE elem=? AND sid=?',
+                       (elem,sid)).fetchone()
+    con.close()
+
+    # Station not cached, or requested dates begin before the cached dates
+    if row is None or pd.Timestamp(sdate) < pd.Timestamp(row[0]):
+     return (sdate, edate)
+
+    c_sdate, c_edate, updated = pd.Timestamp(row[0]), pd.Timestamp(row[1]), row[2]
+
+    # Query days after the cached 'edate'
+    q_sdate = c_edate + pd.Timedelta(days=1) if pd.Timestamp(edate) > c_edate else None
+
+    # Re-query most recent days of the cache once the ttl has passed
+    if time.time() - updated > cache_ttl:
+     recent = max(c_sdate, c_edate - pd.Timedelta(days=cache_settle_days-1))
+     q_sdate = recent if q_sdate is None else min(q_sdate, recent)
+
+    if q_sdate is None:
+     return None
+
+    return (str(q_sdate.date()), str(max(pd.Timestamp(edate), c_edate).date()))
+
+#======================================================================================================
+# Store queried daily values of a station in the cache
+#======================================================================================================
+
+def cache_store(elem: str, sid: str, sdate: str, edate: str, values: np.ndarray):
+
+    '''
+    Stores raw daily values of a station queried from NOAA ACIS. If the values continue or overlap
+    the cached date range they are appended to it, replacing any overlapping days, otherwise they
+    replace the cached station. Least recently used stations are then removed until the cache is
+    smaller than 'cache_max_bytes'.
+
+    Parameters
+    -------------
+    elem, sid, sdate, edate
+     class: 'string', Element, station ID, and starting and ending dates ('YYYY-MM-DD') of 'values'.
+
+    values
+     class: 'numpy.ndarray', Raw daily values of 'NOAA_ACIS_stream.raw_dtype', one per day from 'sdate'
+                             to 'edate'.
+    '''
+
+    with connect() as con:
+
+     row = con.execute('SELECT sdate, edate, data FROM stndata WHERE elem=? AND sid=?',
+                       (elem,sid)).fetchone()
+
+     # Append to cached values if new values begin inside or right after the cached date range
+     if row is not None and pd.Timestamp(row[0]) <= pd.Timestamp(sdate) <= \
+                                                   pd.Timestamp(row[1]) + pd.Timedelta(days=1):
+      keep = (pd.Timestamp(sdate) - pd.Timestamp(row[0])).days
+      values = np.concatenate([np.frombuffer(zlib.decompress(row[2]),dtype=stream.raw_dtype)[:keep],values])
+      sdate = row[0]
+
+     data = zlib.compress(np.ascontiguousarray(values,dtype=stream.raw_dtype).tobytes())
+     now = time.time()
+     con.execute('INSERT OR REPLACE INTO stndata VALUES (?,?,?,?,?,?,?,?)',
+                 (elem,sid,sdate,edate,now,now,len(data),data))
+
+     # Remove least recently used stations if cache is too large
+     total = con.execute('SELECT COALESCE(SUM(nbytes),0) FROM stndata').fetchone()[0]
+     if total > cache_max_bytes:
+      for r_elem, r_sid, nbytes in con.execute('SELECT elem, sid, nbytes FROM stndata WHERE NOT '+
+                                               '(elem=? AND sid=?) ORDER BY accessed ASC',
+                                               (elem,sid)).fetchall():
+       if total <= cache_max_bytes:
+        break
+       con.execute('DELETE FROM stndata WHERE elem=? AND sid=?',(r_elem,r_sid))
+       total -= nbytes
+
+    con.close()
+
+#======================================================================================================
+# Read daily values of a station from the cache
+#======================================================================================================
+
+def cache_read(elem: str, sid: str, sdate: str, edate: str):
+
+    '''
+    Reads raw daily values of a station from the cache between 'sdate' and 'edate'.
+
+    Parameters
+    -------------
+    elem, sid, sdate, edate
+     class: 'string', Element, station ID, and requested starting and ending dates ('YYYY-MM-DD').
+
+    Returns
+    ---------------------
+    output: class: 'numpy.ndarray', Raw daily values of 'NOAA_ACIS_stream.raw_dtype', or None if the 
+                                    requested date range is not fully cached.
+    '''
+
+    with connect() as con:
+     row = con.execute('SELECT sdate, edate, data FROM stndata WHERE elem=? AND sid=?',
+                       (elem,sid)).fetchone()
+     if row is not None:
+      con.execute('UPDATE stndata SET accessed=? WHERE elem=? AND sid=?',(time.time(),elem,sid))
+    con.close()
+
+    if row is None or pd.Timestamp(sdate) < pd.Timestamp(row[0]) or pd.Timestamp(edate) > pd.Timestamp(row[1]):
+     return None
+
+    sdate_ind = (pd.Timestamp(sdate) - pd.Timestamp(row[0])).days
+    edate_ind = (pd.Timestamp(edate) - pd.Timestamp(row[0])).days
+
+    return np.frombuffer(zlib.decompress(row[2]),dtype=stream.raw_dtype)[sdate_ind:edate_ind+1].copy()
+
+#======================================================================================================
+# Store values queried for a cache plan and return the requested daily values of a station
+#======================================================================================================
+
+def cache_update(elem: str, sid: str, sdate: str, edate: str, plan: tuple, values: np.ndarray):
+
+    '''
+    Stores the raw daily values queried from NOAA ACIS for the dates returned by cache_plan() and
+    returns the raw daily values of the station between 'sdate' and 'edate'.
+
+    Parameters
+    -------------
+    elem, sid, sdate, edate
+     class: 'string', Element, station ID, and requested starting and ending dates ('YYYY-MM-DD').
+
+    plan
+     class: 'tuple', Output of cache_plan() for the same station and dates.
+
+    values
+     class: 'numpy.ndarray', Raw daily values queried for the dates in 'plan', or None if 'plan' is None.
+
+    Returns
+    ---------------------
+    output: class: 'numpy.ndarray', Raw daily values of 'NOAA_ACIS_stream.raw_dtype', one per day from 
+                                    'sdate' to 'edate', or None if the station was removed from the 
+                                    cache in the meantime.
+    '''
+
+    if plan is not None:
+     cache_store(elem,sid,plan[0],plan[1],values)
+     # Queried values already cover the requested dates
+     if pd.Timestamp(plan[0]) <= pd.Timestamp(sdate):
+      sdate_ind = (pd.Timestamp(sdate) - pd.Timestamp(plan[0])).days
+      edate_ind = (pd.Timestamp(edate) - pd.Timestamp(plan[0])).days
+      return values[sdate_ind:edate_ind+1]
+
+    return cache_read(elem,sid,sdate,edate)
+
+#======================================================================================================
+# Serve daily values of a station from the cache, querying NOAA ACIS only for dates not yet cached
+#======================================================================================================
+
+def cached_values(elem: str, sid: str, sdate: str, edate: str, fetch):
+
+    '''
+    Returns raw daily values of a station between 'sdate' and 'edate', querying NOAA ACIS with
+    'fetch' only for the dates returned by cache_plan() and storing them in the cache.
+
+    Parameters
+    -------------
+    elem, sid, sdate, edate
+     class: 'string', Element, station ID, and requested starting and ending dates ('YYYY-MM-DD').
+
+    fetch
+     class: 'function', Called as fetch(sdate, edate) and returns the raw daily values of 
+                        'NOAA_ACIS_stream.raw_dtype' for that date range.
+
+    Returns
+    ---------------------
+    output: class: 'numpy.ndarray', Raw daily values of 'NOAA_ACIS_stream.raw_dtype', one per day from 
+                                    'sdate' to 'edate'.
+    '''
+
+    plan = cache_plan(elem,sid,sdate,edate)
+    values = cache_update(elem,sid,sdate,edate,plan,fetch(*plan) if plan is not None else None)
+
+    # Query the whole date range if the station was removed from the cache in the meantime
+    if values is None:
+     values = fetch(sdate,edate)
+
+    return values
+
+#======================================================================================================
+# Remove all stations from the cache
+#======================================================================================================
+
+def clear_cache():
+
+    '''
+    Removes all stations from the cache.
+    '''
+
+    with connect() as con:
+     con.execute('DELETE FROM stndata')
+    con.close()
@@ -0,0 +1,697 @@
+#######################################################################################################
+#
+# Local catalog of NOAA ACIS station metadata with a spatial and date index
+#
+#######################################################################################################
+
+import os, zlib, threading, argparse, http.client
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_stnmeta as stnmeta
+
+#######################################################################################################
+#
+# CATALOG SETTINGS
+#
+#######################################################################################################
+
+# Folder holding the station catalogs, one '{elem}.npz' or '{elem}.csv' per element (see Extras/Metadata)
+catalog_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','..','Extras','Metadata')
+
+# Size in degrees of the latitude/longitude grid cells of the spatial index
+cell_deg = 1.0
+
+# Days after which a catalog snapshot is too old to answer metadata queries with source='auto'. The csv
+# catalogs shipped in Extras/Metadata are a snapshot from October 2023, so source='auto' only uses the
+# catalog once it is rebuilt with build_catalog() (see the command line at the end of this file)
+catalog_max_age = 30
+
+# Days NOAA ACIS data usually lags behind today. Stations still reporting when the snapshot was taken
+# have their 'edate' checked again with NOAA ACIS once it is older than this
+catalog_lag_days = 3
+
+# Metadata items held by the catalogs, other items are always queried from NOAA ACIS
+catalog_items = ('name','state','sids','ll','valid_daterange')
+
+# Catalogs already loaded for each (folder, elem)
+catalogs = {}
+catalogs_lock = threading.Lock()
+
+# Catalogs (folder, elem) already reported as too old for source='auto', reported once per session
+stale_noted = set()
+
+#======================================================================================================
+# Change catalog settings
+#======================================================================================================
+
+def configure_catalog(folder: str = None, max_age: int = None, lag_days: int = None, cell: float = None):
+
+    '''
+    Changes the settings of the station catalogs. Any parameter left as None keeps its current value.
+    Loaded catalogs are dropped so the new settings apply to every following lookup.
+
+    Parameters
+    -------------
+    folder
+     class: 'string', Folder holding the catalogs, one '{elem}.npz' or '{elem}.csv' per element.
+                      Default is 'Extras/Metadata' of this repository.
+
+    max_age
+     class: 'integer', Days after which a catalog snapshot is too old to answer metadata queries with
+                       source='auto' and NOAA ACIS is queried instead. Default is 30.
+
+    lag_days
+     class: 'integer', Days NOAA ACIS data usually lags behind today. Stations that were still
+                       reporting when the snapshot was taken are checked again with NOAA ACIS once
+                       their 'edate' is older than this. Default is 3.
+
+    cell
+     class: 'float', Size in degrees of the grid cells of the spatial index. Default is 1.
+    '''
+
+    global catalog_folder, catalog_max_age, catalog_lag_days, cell_deg
+
+    if folder is not None: catalog_folder = folder
+    if max_age is not None: catalog_max_age = max_age
+    if lag_days is not None: catalog_lag_days = lag_days
+    if cell is not None: cell_deg = cell
+
+    with catalogs_lock:
+     catalogs.clear()
+     stale_noted.clear()
+
+#######################################################################################################
+#
+# STATION CATALOG
+#
+#######################################################################################################
+
+class StationCatalog:
+
+    '''
+    Station metadata of one element held in NumPy arrays, with a grid index over latitude/longitude and
+    an index of start dates. Bounding box and date queries only visit the grid cells overlapping the
+    box and return the rows of the matching stations.
+
+    Parameters
+    -------------
+    elem
+     class: 'string', Element of the catalog. Example: 'maxt'
+
+    columns
+     class: 'dict', Arrays of equal length with at least 'name', 'state', 'sids', 'sids_code',
+                    'sids_type', 'lat', 'lon', 'sdate' and 'edate' (dates as 'YYYY-MM-DD' strings).
+
+    snapshot
+     class: 'string', Date when the catalog was taken from NOAA ACIS, saved with the catalogs built by
+                      build_catalog(). Default is the latest 'edate' of all stations, the last day with
+                      data when the catalog was taken, as csv catalogs do not hold the date.
+
+    index
+     class: 'dict', Prebuilt index arrays 'by_cell', 'cells' and 'by_sdate' as saved by save_npz().
+                    Default is None, the index is built from 'lat', 'lon' and 'sdate'.
+    '''
+
+    def __init__(self, elem: str, columns: dict, snapshot: str = None, index: dict = None):
+        self.elem = elem
+        self.columns = {key: np.asarray(value) for key, value in columns.items()}
+        self.lat = self.columns['lat'].astype(np.float64)
+        self.lon = self.columns['lon'].astype(np.float64)
+        self.sdate = self.columns['sdate'].astype('datetime64[D]')
+        self.edate = self.columns['edate'].astype('datetime64[D]')
+        self.snapshot = pd.Timestamp(snapshot if snapshot is not None else
+                                     (self.edate.max() if len(self.edate) > 0 else '1970-01-01'))
+        self.row_of = None
+
+        # Spatial index: stations sorted by grid cell, cells numbered row by row from (-90, -180). The
+        # cell size is kept with the index, so later changes of 'cell_deg' do not apply to this catalog
+        self.cell_deg = cell_deg
+        self.ncols = int(np.ceil(360/self.cell_deg))
+        if index is not None:
+         self.by_cell, self.cells, self.by_sdate = index['by_cell'], index['cells'], index['by_sdate']
+        else:
+         cell = self.cell_row(self.lat)*self.ncols + self.cell_col(self.lon)
+         self.by_cell = np.argsort(cell,kind='stable')
+         self.cells = cell[self.by_cell]
+         # Date index: stations sorted by start date
+         self.by_sdate = np.argsort(self.sdate,kind='stable')
+        self.sdates = self.sdate[self.by_sdate]
+
+    #==================================================================================================
+    # Load catalog from a csv file
+    #==================================================================================================
+
+    @classmethod
+    def from_csv(cls, path: str, elem: str):
+
+        '''
+        Reads a station catalog saved as csv with columns 'elem', 'name', 'state', 'sids', 'sids_code',
+        'sids_type', 'lat', 'lon', 'sdate' and 'edate', as in Extras/Metadata. Its snapshot date is the
+        latest 'edate', so the shipped csv catalogs are older than 'catalog_max_age' and are only read
+        with source='catalog' until build_catalog() saves a current '{elem}.npz' next to them.
+
+        Returns
+        ---------------------
+        output: class: 'StationCatalog'
+        '''
+
+        meta = pd.read_csv(path)
+
+        return cls(elem, {c: meta[c].values for c in meta.columns})
+
+    #==================================================================================================
+    # Load and save catalog as a binary NumPy file
+    #==================================================================================================
+
+    @classmethod
+    def from_npz(cls, path: str, elem: str):
+
+        '''
+        Reads a station catalog saved by save_npz(). Text columns are stored as fixed width arrays and
+        dates as days since 1970-01-01, and the spatial and date index is read as saved if it was built
+        with the current 'cell_deg'.
+
+        Returns
+        ---------------------
+        output: class: 'StationCatalog'
+        '''
+
+        with np.load(path,allow_pickle=False) as npz:
+         columns = {c: npz['col_'+c] for c in npz['columns']}
+         for c in ('sdate','edate'):
+          columns[c] = np.datetime_as_string(columns[c].astype('datetime64[D]'))
+         # Missing text is saved as '' and read back as NaN, as from the csv catalogs
+         for c in columns:
+          if columns[c].dtype.kind == 'U' and c not in ('sdate','edate'):
+           columns[c] = np.where(columns[c] == '',np.nan,columns[c].astype(object))
+         index = {k: npz[k] for k in ('by_cell','cells','by_sdate')} if float(npz['cell_deg']) == cell_deg else None
+         snapshot = str(npz['snapshot'])
+
+        return cls(elem, columns, snapshot=snapshot, index=index)
+
+    def save_npz(self, path: str, extra: dict = {}):
+
+        '''
+        Saves the catalog to a compressed NumPy file with one array per column, the spatial and date
+        index, and the snapshot date. Arrays in 'extra' are saved along with them. The file is written
+        next to 'path' first and then moved in place, so readers never see a partial file.
+        '''
+
+        arrays = {'columns': np.array(list(self.columns)), 'snapshot': np.array(str(self.snapshot.date())),
+                  'cell_deg': np.array(self.cell_deg), 'by_cell': self.by_cell, 'cells': self.cells,
+                  'by_sdate': self.by_sdate}
+        for c, values in self.columns.items():
+         if c == 'sdate' or c == 'edate':
+          values = values.astype('datetime64[D]').astype(np.int32)
+         elif values.dtype == object:
+          values = np.where(pd.isna(values),'',values).astype(str)
+         arrays['col_'+c] = values
+        arrays.update(extra)
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)),exist_ok=True)
+        np.savez_compressed(path+'.tmp.npz',**arrays)
+        os.replace(path+'.tmp.npz',path)
+
+    def cell_row(self, lat):
+        return np.clip(np.floor((np.asarray(lat)+90)/self.cell_deg),0,np.ceil(180/self.cell_deg)-1).astype(np.int64)
+
+    def cell_col(self, lon):
+        return np.clip(np.floor((np.asarray(lon)+180)/self.cell_deg),0,self.ncols-1).astype(np.int64)
+
+    #==================================================================================================
+    # Query stations by bounding box and dates
+    #==================================================================================================
+
+    def query(self, slat: float = -90, nlat: float = 90, wlon: float = -180, elon: float = 180,
+              sdate: str = None, edate: str = None, date_match: str = 'covers'):
+
+        '''
+        Returns the rows of the stations within a bounding box (edges included) whose period of record
+        matches the dates. Only the grid cells overlapping the box are visited, and without a box only
+        the stations starting before 'sdate' are.
+
+        Parameters
+        -------------
+        slat, nlat, wlon, elon
+         class: 'float', Bounding latitude and longitude coordinates. Default is the whole globe.
+
+        sdate, edate
+         class: 'string', Dates as 'YYYY-MM-DD'. Either may be None to leave that end open.
+
+        date_match
+         class: 'string', 'covers' keeps stations with a record starting on or before 'sdate' and
+                          ending on or after 'edate'. 'overlaps' keeps stations with any day of record
+                          between 'sdate' and 'edate'. Default is 'covers'.
+
+        Returns
+        ---------------------
+        output: class: 'numpy.ndarray', Rows of the matching stations in catalog order.
+        '''
+
+        sdate = None if sdate is None else np.datetime64(pd.Timestamp(sdate).date(),'D')
+        edate = None if edate is None else np.datetime64(pd.Timestamp(edate).date(),'D')
+        first, last = (edate, sdate) if date_match == 'overlaps' else (sdate, edate)
+
+        if (slat, nlat, wlon, elon) == (-90, 90, -180, 180):
+         # Stations starting on or before 'first' are a prefix of the start date index
+         rows = self.by_sdate[:np.searchsorted(self.sdates,first,'right')] if first is not None else \
+                np.arange(len(self.lat))
+        else:
+         # Cells of one grid row that overlap the box are contiguous in the spatial index
+         lat_rows = np.arange(self.cell_row(slat),self.cell_row(nlat)+1)
+         lo = np.searchsorted(self.cells,lat_rows*self.ncols+self.cell_col(wlon),'left')
+         hi = np.searchsorted(self.cells,lat_rows*self.ncols+self.cell_col(elon),'right')
+         rows = np.concatenate([self.by_cell[a:b] for a, b in zip(lo,hi)]+[np.zeros(0,dtype=np.int64)])
+         rows = rows[(self.lat[rows] >= slat) & (self.lat[rows] <= nlat) &
+                     (self.lon[rows] >= wlon) & (self.lon[rows] <= elon)]
+         if first is not None:
+          rows = rows[self.sdate[rows] <= first]
+
+        if last is not None:
+         rows = rows[self.edate[rows] >= last]
+
+        return np.sort(rows)
+
+    #==================================================================================================
+    # Output of queried stations
+    #==================================================================================================
+
+    def lookup_sids(self, sids: list):
+
+        '''
+        Returns the rows of the stations with the given station ids, in the order of 'sids', along
+        with the station ids that are not in the catalog.
+
+        Returns
+        ---------------------
+        output: class: 'numpy.ndarray', 'list'
+        '''
+
+        # Station id index, built on first use
+        if self.row_of is None:
+         self.row_of = {str(sid): r for r, sid in enumerate(self.columns['sids'])}
+
+        rows = [self.row_of[str(sid)] for sid in sids if str(sid) in self.row_of]
+        missing = [sid for sid in sids if str(sid) not in self.row_of]
+
+        return np.array(rows,dtype=np.int64), missing
+
+    def stale_rows(self, rows: np.ndarray, today: str = None):
+
+        '''
+        Returns the rows (out of 'rows') of stations that were still reporting when the catalog was
+        taken and whose 'edate' is now older than 'catalog_lag_days', so their period of record may
+        have grown since.
+
+        Returns
+        ---------------------
+        output: class: 'numpy.ndarray'
+        '''
+
+        today = pd.Timestamp.today() if today is None else pd.Timestamp(today)
+        active = np.datetime64((self.snapshot - pd.Timedelta(days=catalog_lag_days)).date(),'D')
+        behind = np.datetime64((today - pd.Timedelta(days=catalog_lag_days)).date(),'D')
+
+        return rows[(self.edate[rows] >= active) & (self.edate[rows] < behind)]
+
+    @property
+    def age(self):
+        # Days since the catalog was taken
+        return (pd.Timestamp.today().normalize() - self.snapshot.normalize()).days
+
+    def metadata(self, rows: np.ndarray, items: str):
+
+        '''
+        Returns the stations in 'rows' as a metadata DataFrame with the same columns and dtypes as
+        NOAA_ACIS_stnmeta.json_req_metadata() for the given 'items'. Only the items in
+        'catalog_items' are available.
+
+        Returns
+        ---------------------
+        output: class: 'pandas.DataFrame'
+        '''
+
+        c = self.columns
+
+        metadata = pd.DataFrame({'elem': pd.Series([self.elem]*len(rows))})
+
+        if ('name' in items) == True:
+         metadata = metadata.assign(name=pd.Series(c['name'][rows]))
+        if ('state' in items) == True:
+         metadata = metadata.assign(state=pd.Series(c['state'][rows]))
+        if ('sids' in items) == True:
+         metadata = metadata.assign(sids=pd.Series(c['sids'][rows],dtype='string'),
+                                    sids_code=pd.Series(c['sids_code'][rows]).astype(int),
+                                    sids_type=pd.Series(c['sids_type'][rows],dtype='string'))
+        if ('ll' in items) == True:
+         metadata = metadata.assign(lat=np.float32(self.lat[rows]),lon=np.float32(self.lon[rows]))
+        if ('valid_daterange' in items) == True:
+         metadata = metadata.assign(sdate=pd.Series(c['sdate'][rows],dtype='string'),
+                                    edate=pd.Series(c['edate'][rows],dtype='string'))
+
+        return metadata
+
+    def tooltips(self, rows: np.ndarray):
+
+        '''
+        Returns the map tooltip of each station in 'rows': 'sids: name, state (sids_type)', the element
+        with its start and end dates, and the latitude and longitude.
+
+        Returns
+        ---------------------
+        output: class: 'list'
+        '''
+
+        c = self.columns
+
+        return [f"{c['sids'][r]}: {c['name'][r]}, {c['state'][r]} ({c['sids_type'][r]})\n"+
+                f"{self.elem}: {c['sdate'][r]}, {c['edate'][r]}\n(lat) {self.lat[r]} (lon) {self.lon[r]}"
+                for r in rows]
+
+    def frame(self, rows: np.ndarray = None):
+
+        '''
+        Returns the stations in 'rows' (all stations if None) as a DataFrame with the catalog columns.
+
+        Returns
+        ---------------------
+        output: class: 'pandas.DataFrame'
+        '''
+
+        rows = np.arange(len(self.lat)) if rows is None else rows
+
+        return pd.DataFrame({key: value[rows] for key, value in self.columns.items()})
+
+    def __len__(self):
+        return len(self.lat)
+
+    def __repr__(self):
+        return ('StationCatalog('+self.elem+', '+str(len(self.lat))+' stations, snapshot '+
+                str(self.snapshot.date())+')')
+
+#======================================================================================================
+# Return the catalog of an element, loading it on first use
+#======================================================================================================
+
+def get_catalog(elem: str, folder: str = None):
+
+    '''
+    Returns the station catalog of an element, read from '{folder}/{elem}.npz' (see build_catalog()) or
+    else '{folder}/{elem}.csv' the first time it is requested and kept in memory for every following
+    request.
+
+    Parameters
+    -------------
+    elem
+     class: 'string', Element of the catalog. Example: 'maxt'
+
+    folder
+     class: 'string', Folder holding the catalogs. Default is 'catalog_folder' (Extras/Metadata).
+
+    Returns
+    ---------------------
+    output: class: 'StationCatalog'
+    '''
+
+    folder = catalog_folder if folder is None else folder
+    key = (os.path.abspath(folder), elem)
+
+    with catalogs_lock:
+     if key not in catalogs:
+      if os.path.exists(os.path.join(folder,elem+'.npz')):
+       catalogs[key] = StationCatalog.from_npz(os.path.join(folder,elem+'.npz'),elem)
+      else:
+       catalogs[key] = StationCatalog.from_csv(os.path.join(folder,elem+'.csv'),elem)
+     return catalogs[key]
+
+#======================================================================================================
+# Check whether the catalog of an element is recent enough for metadata queries with source='auto'
+#======================================================================================================
+
+def is_current(elem: str, folder: str = None):
+
+    '''
+    Returns True if the station catalog of an element exists and is at most 'catalog_max_age' days
+    old, so metadata queries with source='auto' are answered by it. The csv catalogs shipped in
+    Extras/Metadata are not current until build_catalog() saves a new one.
+
+    Returns
+    ---------------------
+    output: class: 'bool'
+    '''
+
+    try:
+     catalog = get_catalog(elem,folder)
+    except FileNotFoundError:
+     return False
+
+    return catalog.age <= catalog_max_age
+
+#######################################################################################################
+#
+# CATALOG BUILDER
+#
+#######################################################################################################
+
+# Elements with a catalog built by default
+catalog_elems = ('maxt','mint','avgt','pcpn','snow','snwd')
+
+#======================================================================================================
+# Query the stations of one tile from NOAA ACIS
+#======================================================================================================
+
+def tile_stations(elem: str, bbox: tuple, items: str):
+
+    '''
+    Queries the metadata of the stations of an element within one tile 'bbox' = (slat, nlat, wlon, elon)
+    along with the fingerprint of the tile, a checksum of the sorted station 'uid's. Tiles without
+    stations return an empty DataFrame.
+
+    Returns
+    ---------------------
+    output: class: 'pandas.DataFrame', 'integer'
+    '''
+
+    slat, nlat, wlon, elon = bbox
+    metadata = stnmeta.json_req_metadata({'bbox': f'{wlon},{slat},{elon},{nlat}', 'elems': elem,
+                                          'meta': items})
+
+    # If no data available, the tile is empty
+    if isinstance(metadata,ValueError):
+     return pd.DataFrame(), zlib.crc32(b'')
+
+    fingerprint = zlib.crc32('\n'.join(sorted(metadata['uid'].astype(str))).encode())
+
+    return metadata, fingerprint
+
+def tile_fingerprint(elem: str, bbox: tuple):
+    # Fingerprint of a tile from a query of station 'uid's only, see tile_stations()
+    return tile_stations(elem,bbox,'uid')[1]
+
+#======================================================================================================
+# Build the catalog of an element from tiled NOAA ACIS metadata queries
+#======================================================================================================
+
+def build_element(elem: str, path: str, tiles: np.ndarray, incremental: bool = True,
+                  refresh_days: int = 30, max_workers: int = 4, print_results: bool = True):
+
+    '''
+    Builds the catalog of one element from the stations of each tile and saves it to 'path', see
+    build_catalog(). With incremental=True the tiles of the catalog already at 'path' are first
+    checked with a query of station 'uid's only, and the full metadata is queried again only for
+    tiles whose fingerprint changed or that are older than 'refresh_days'.
+
+    Returns
+    ---------------------
+    output: class: 'StationCatalog'
+    '''
+
+    today = np.datetime64(pd.Timestamp.today().date(),'D')
+    ntiles = len(tiles)
+
+    #-------------------------------------------------------------------------------------------------
+    # Read the previous build: its stations, the tile of each station, and when each tile was queried
+    #-------------------------------------------------------------------------------------------------
+
+    previous = {}
+    tile_time = np.full(ntiles,np.datetime64('NaT'),dtype='datetime64[D]')
+    tile_fp = np.full(ntiles,-1,dtype=np.int64)
+
+    if incremental == True and os.path.exists(path):
+     with np.load(path,allow_pickle=False) as npz:
+      if 'tile_bbox' in npz and np.array_equal(npz['tile_bbox'],tiles):
+       old = StationCatalog.from_npz(path,elem).frame()
+       old = old.assign(uid=npz['station_uid'])
+       station_tile = npz['station_tile']
+       previous = {t: old[station_tile == t] for t in np.unique(station_tile)}
+       tile_time = npz['tile_time'].astype('datetime64[D]')
+       tile_fp = npz['tile_fp']
+
+    #-------------------------------------------------------------------------------------------------
+    # Tiles to query again: new or failed tiles, tiles older than 'refresh_days', and tiles whose
+    # station list changed since they were queried
+    #-------------------------------------------------------------------------------------------------
+
+    requery = np.isnat(tile_time) | (tile_time < today-np.timedelta64(refresh_days,'D'))
+
+    def check(t):
+     return t, tile_fingerprint(elem,tiles[t])
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+     for future in as_completed([pool.submit(check,t) for t in np.flatnonzero(~requery)]):
+      try:
+       t, fingerprint = future.result()
+      except (OSError, http.client.HTTPException):
+       continue # keep the previous stations of the tile
+      requery[t] = fingerprint != tile_fp[t]
+
+    #-------------------------------------------------------------------------------------------------
+    # Query the full metadata of each tile to query again
+    #-------------------------------------------------------------------------------------------------
+
+    items = ','.join(catalog_items)+',uid'
+    failed = 0
+
+    def fetch(t):
+     return t, tile_stations(elem,tiles[t],items)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+     for future in as_completed([pool.submit(fetch,t) for t in np.flatnonzero(requery)]):
+      try:
+       t, (metadata, fingerprint) = future.result()
+      except (OSError, http.client.HTTPException):
+       failed += 1 # keep the previous stations of the tile, queried again on the next build
+       continue
+      # Drop stations without a period of record
+      if len(metadata) > 0:
+       metadata = metadata[metadata['sdate'].notna() & metadata['edate'].notna()]
+      previous[t] = metadata
+      tile_time[t], tile_fp[t] = today, fingerprint
+
+    if print_results == True:
+     print(elem+': '+str(int(requery.sum()))+' of '+str(ntiles)+' tiles queried'+
+           (', '+str(failed)+' failed and kept from the previous build' if failed > 0 else ''))
+
+    #-------------------------------------------------------------------------------------------------
+    # Combine tiles, keeping each station in the first tile it was found in (tiles share their edges)
+    #-------------------------------------------------------------------------------------------------
+
+    # NOTE: Stations are told apart by 'uid', as a few distinct stations share their first 'sids'
+    columns = ['name','state','sids','sids_code','sids_type','lat','lon','sdate','edate']
+    frames = [previous[t][columns+['uid']].assign(tile=t) for t in sorted(previous) if len(previous[t]) > 0]
+    if len(frames) == 0:
+     raise ValueError('No stations found for '+elem)
+    meta = pd.concat(frames,ignore_index=True)
+    meta = meta.assign(uid=meta['uid'].astype(str))
+    meta = meta.drop_duplicates(subset='uid',keep='first',ignore_index=True)
+
+    # Coordinates as written by NOAA ACIS, as in the csv catalogs
+    meta['lat'] = np.float32(meta['lat']).astype(str).astype(np.float64)
+    meta['lon'] = np.float32(meta['lon']).astype(str).astype(np.float64)
+
+    text = ('name','state','sids','sids_type','sdate','edate')
+    catalog = StationCatalog(elem, {'elem': np.full(len(meta),elem,dtype=object),
+                                    **{c: meta[c].to_numpy(dtype=object,na_value=np.nan) if c in text else
+                                          meta[c].values for c in columns}},
+                             # Stations of the oldest tile were last checked at its query date
+                             snapshot=str(tile_time[~np.isnat(tile_time)].min()))
+
+    catalog.save_npz(path,extra={'station_tile': meta['tile'].values.astype(np.int32),
+                                 'station_uid': meta['uid'].values.astype(str), 'tile_bbox': tiles,
+                                 'tile_time': tile_time.astype(np.int64), 'tile_fp': tile_fp})
+
+    return catalog
+
+#======================================================================================================
+# Build the catalogs of all elements
+#======================================================================================================
+
+def build_catalog(elems: tuple = catalog_elems, folder: str = None, tile_deg: float = 10,
+                  region: tuple = (-90, 90, -180, 180), incremental: bool = True, refresh_days: int = 30,
+                  max_workers: int = 4, print_results: bool = True):
+
+    '''
+    Takes a snapshot of the NOAA ACIS station metadata of each element and saves it as '{elem}.npz',
+    read by get_catalog() in place of the csv catalogs. The region is queried in tiles of 'tile_deg'
+    degrees, stations found in more than one tile are kept once, and the file holds the catalog
+    columns, the spatial and date index, the 'uid' and tile of every station, and the query date and
+    fingerprint of every tile.
+
+    Parameters
+    -------------
+    elems
+     class: 'tuple', Elements to build. Default is ('maxt','mint','avgt','pcpn','snow','snwd').
+
+    folder
+     class: 'string', Folder to save the catalogs in. Default is 'catalog_folder' (Extras/Metadata).
+
+    tile_deg
+     class: 'float', Size in degrees of the tiles queried from NOAA ACIS. Default is 10.
+
+    region
+     class: 'tuple', Bounding (slat, nlat, wlon, elon) coordinates to cover. Default is the globe.
+
+    incremental
+     class: 'boolean', If True, only tiles that are new, failed on the last build, older than
+                       'refresh_days', or whose list of stations changed are queried in full. Other
+                       tiles keep their stations from the catalog already in 'folder'. Default is True.
+
+    refresh_days
+     class: 'integer', Days after which a tile is queried in full again. Default is 30, the
+                       'catalog_max_age' after which metadata queries with source='auto' stop using
+                       the catalog.
+
+    max_workers
+     class: 'integer', Number of tiles queried at the same time. Default is 4.
+
+    print_results
+     class: 'boolean', If True, prints the number of tiles queried for each element. Default is True.
+
+    Returns
+    ---------------------
+    output: class: 'dict', Built 'StationCatalog' of each element.
+    '''
+
+    folder = catalog_folder if folder is None else folder
+
+    # Tiles as rows of (slat, nlat, wlon, elon), numbered row by row from the south west corner
+    slat, nlat, wlon, elon = region
+    lats = np.append(np.arange(slat,nlat,tile_deg),nlat)
+    lons = np.append(np.arange(wlon,elon,tile_deg),elon)
+    tiles = np.array([(s, n, w, e) for s, n in zip(lats[:-1],lats[1:]) for w, e in zip(lons[:-1],lons[1:])],
+                     dtype=np.float64)
+
+    built = {}
+    for elem in elems:
+     built[elem] = build_element(elem=elem,path=os.path.join(folder,elem+'.npz'),tiles=tiles,
+                                 incremental=incremental,refresh_days=refresh_days,
+                                 max_workers=max_workers,print_results=print_results)
+
+    # Drop loaded catalogs of this folder so they are read again
+    with catalogs_lock:
+     for elem in elems:
+      catalogs.pop((os.path.abspath(folder), elem),None)
+
+    return built
+
+#######################################################################################################
+#
+# Build catalogs from the command line:
+#   python -m ClimateDataVisualizer.dataquery.NOAA_ACIS_catalog [--elems maxt mint] [--full]
+#
+#######################################################################################################
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Build the NOAA ACIS station catalogs')
+    parser.add_argument('--elems',nargs='+',default=list(catalog_elems),help='elements to build')
+    parser.add_argument('--folder',default=None,help='folder to save the catalogs in')
+    parser.add_argument('--tile-deg',type=float,default=10,help='size in degrees of the queried tiles')
+    parser.add_argument('--refresh-days',type=int,default=30,help='days after which a tile is queried again')
+    parser.add_argument('--workers',type=int,default=4,help='tiles queried at the same time')
+    parser.add_argument('--full',action='store_true',help='query every tile again')
+    args = parser.parse_args()
+
+    build_catalog(elems=tuple(args.elems),folder=args.folder,tile_deg=args.tile_deg,
+                  incremental=not args.full,refresh_days=args.refresh_days,max_workers=args.workers)
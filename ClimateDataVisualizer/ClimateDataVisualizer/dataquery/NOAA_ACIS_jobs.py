@@ -0,0 +1,274 @@
+#######################################################################################################
+#
+# Background query jobs with progress reporting and cooperative cancellation
+#
+#######################################################################################################
+
+import time, queue, threading
+
+#######################################################################################################
+#
+# QUERY JOB
+#
+#######################################################################################################
+
+class QueryJob:
+
+    '''
+    Query running in a background thread, so the caller (e.g. the widget page) is not blocked while it
+    runs. The query function is called with two more keyword arguments: 'progress', which it calls as
+    progress(stations_done, stations_total, nbytes), and 'cancel', a 'threading.Event' it checks
+    between requests (see stndata.bbox_multielem_daily()). A cancelled query stops sending requests
+    and returns the stations queried so far, which are kept as partial results.
+
+    Every change of state or progress is passed to the listeners added with on_event(), called as
+    listener(job) from the thread running the query.
+
+    Parameters
+    -------------
+    func
+     class: 'function', Query function, must accept 'progress' and 'cancel' keyword arguments.
+
+    kwargs
+     class: 'dict', Keyword arguments of the query function.
+
+    name
+     class: 'string', Name of the job shown in progress messages. Default is the function name.
+    '''
+
+    def __init__(self, func, kwargs: dict, name: str = None):
+        self.func, self.kwargs = func, dict(kwargs)
+        self.name = name if name is not None else func.__name__
+        # 'queued', 'running', 'done', 'cancelled' or 'failed'
+        self.state = 'queued'
+        self.stations_done, self.stations_total, self.nbytes = 0, 0, 0
+        self.started, self.finished = None, None
+        self.result, self.error = None, None
+        self.cancel_event, self.done_event = threading.Event(), threading.Event()
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    #==================================================================================================
+    # Listen to progress and state changes
+    #==================================================================================================
+
+    def on_event(self, listener):
+
+        '''
+        Adds a listener called as listener(job) on every progress report and change of state. A
+        listener added after the job is finished is called once right away.
+        '''
+
+        with self.lock:
+         self.listeners.append(listener)
+         finished = self.done_event.is_set()
+        if finished:
+         listener(self)
+
+    def notify(self):
+        # Listener errors must not stop the query
+        for listener in list(self.listeners):
+         try:
+          listener(self)
+         except Exception as error:
+          print('ERROR: Job listener failed ('+str(error)+')')
+
+    def report(self, stations_done: int, stations_total: int, nbytes: int):
+        # Progress callback handed to the query function
+        with self.lock:
+         self.stations_done, self.stations_total, self.nbytes = stations_done, stations_total, nbytes
+        self.notify()
+
+    #==================================================================================================
+    # Run, cancel and wait for the job
+    #==================================================================================================
+
+    def run(self):
+
+        '''
+        Runs the query in the calling thread, see JobQueue for running it in the background. A job
+        cancelled while queued is not run.
+        '''
+
+        with self.lock:
+         if self.state != 'queued':
+          return
+         self.state, self.started = 'running', time.monotonic()
+        self.notify()
+
+        try:
+         self.result = self.func(**self.kwargs, progress=self.report, cancel=self.cancel_event)
+         state = 'cancelled' if self.cancel_event.is_set() else 'done'
+        except BaseException as error:
+         # SystemExit is raised by the query functions for too many stations
+         self.error, state = error, 'failed'
+
+        with self.lock:
+         self.state, self.finished = state, time.monotonic()
+         self.done_event.set()
+        self.notify()
+
+    def cancel(self):
+
+        '''
+        Asks the job to stop. A queued job is cancelled right away, a running job stops after the
+        requests already sent and keeps the stations queried so far as partial results.
+        '''
+
+        self.cancel_event.set()
+        with self.lock:
+         if self.state != 'queued':
+          return
+         self.state, self.finished = 'cancelled', time.monotonic()
+         self.done_event.set()
+        self.notify()
+
+    def wait(self, timeout: float = None):
+
+        '''
+        Waits until the job is finished and returns the query result, which is partial for a cancelled
+        job. Raises the error of a failed job, and TimeoutError if the job is still running after
+        'timeout' seconds.
+
+        Returns
+        ---------------------
+        output: Result of the query function, None for a job cancelled before it started.
+        '''
+
+        if not self.done_event.wait(timeout):
+         raise TimeoutError('Job '+self.name+' is still '+self.state)
+        if self.error is not None:
+         raise self.error
+        return self.result
+
+    #==================================================================================================
+    # Progress summary
+    #==================================================================================================
+
+    @property
+    def elapsed(self):
+        # Seconds since the job started
+        if self.started is None:
+         return 0.
+        return (self.finished if self.finished is not None else time.monotonic()) - self.started
+
+    @property
+    def fraction(self):
+        # Fraction of stations done, 0 until the first chunk is done
+        if self.stations_total == 0:
+         return 1. if self.state == 'done' else 0.
+        return self.stations_done/self.stations_total
+
+    @property
+    def eta(self):
+        # Seconds left at the average rate so far, None before any station is done
+        if self.state != 'running' or self.stations_done == 0:
+         return None
+        return self.elapsed*(self.stations_total - self.stations_done)/self.stations_done
+
+    def status(self):
+
+        '''
+        Returns a one line summary of the state and progress of the job.
+
+        Returns
+        ---------------------
+        output: class: 'string'
+        '''
+
+        text = self.name+': '+self.state
+        if self.stations_total > 0:
+         text += (', '+str(self.stations_done)+'/'+str(self.stations_total)+' stations, '+
+                  str(round(self.nbytes/1024**2,1))+' MB')
+        if self.eta is not None:
+         text += ', about '+str(int(round(self.eta)))+' s left'
+        elif self.finished is not None and self.started is not None:
+         text += ' in '+str(round(self.elapsed,1))+' s'
+        if self.error is not None and str(self.error) != '':
+         text += ' ('+str(self.error)+')'
+        return text
+
+    def __repr__(self):
+        return 'QueryJob('+self.status()+')'
+
+#######################################################################################################
+#
+# JOB QUEUE
+#
+#######################################################################################################
+
+class JobQueue:
+
+    '''
+    Runs submitted query jobs one after another in a background thread, in the order they were
+    submitted. Requests of a single job are already sent concurrently, so jobs are not run at the same
+    time by default.
+
+    Parameters
+    -------------
+    max_running
+     class: 'integer', Number of jobs run at the same time. Default is 1.
+    '''
+
+    def __init__(self, max_running: int = 1):
+        self.jobs = queue.Queue()
+        self.pending, self.running = [], []
+        self.lock = threading.Lock()
+        for _ in range(max(1,int(max_running))):
+         threading.Thread(target=self.worker,daemon=True).start()
+
+    def worker(self):
+        while True:
+         job = self.jobs.get()
+         with self.lock:
+          if job in self.pending:
+           self.pending.remove(job)
+          self.running.append(job)
+         job.run()
+         with self.lock:
+          self.running.remove(job)
+
+    #==================================================================================================
+    # Submit and cancel jobs
+    #==================================================================================================
+
+    def submit(self, func, name: str = None, listener = None, **kwargs):
+
+        '''
+        Queues the query func(**kwargs) as a new job, see QueryJob.
+
+        Parameters
+        -------------
+        func
+         class: 'function', Query function, must accept 'progress' and 'cancel' keyword arguments.
+
+        name
+         class: 'string', Name of the job shown in progress messages. Default is the function name.
+
+        listener
+         class: 'function', Added with QueryJob.on_event() before the job is queued. Default is None.
+
+        Returns
+        ---------------------
+        output: class: 'QueryJob'
+        '''
+
+        job = QueryJob(func, kwargs, name=name)
+        if listener is not None:
+         job.on_event(listener)
+        with self.lock:
+         self.pending.append(job)
+        self.jobs.put(job)
+        return job
+
+    def queued(self):
+        # Jobs waiting for their turn, in the order they will run
+        with self.lock:
+         return [job for job in self.pending if job.state == 'queued']
+
+    def cancel_all(self):
+        # Cancels queued jobs and the running ones
+        with self.lock:
+         jobs = self.running+self.pending
+        for job in jobs:
+         job.cancel()
@@ -6,10 +6,15 @@
 
 import numpy as np
 import pandas as pd
-import json, urllib
+import json, urllib, threading
 from warnings import simplefilter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from ClimateDataVisualizer.dataquery import NOAA_ACIS_stnmeta as stnmeta
 from ClimateDataVisualizer.dataquery import NOAA_ACIS_stndata as stndata
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_cache as stncache
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_transport as transport
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_stream as stream
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_stnmatrix as stnmatrix
 
 ######################################################################################################
 #
@@ -31,7 +36,10 @@ def singlestn_daily(elem: str, sid: str, sdate: str, edate: str,
                     mdr_A: str = 'equal', mdr_S: str = '0',
 
                     # Optional parameters for printing results
-                    print_results: bool = True, print_md: bool = True
+                    print_results: bool = True, print_md: bool = True,
+
+                    # Optional parameters for on-disk cache
+                    use_cache: bool = False
 
                     ):
 
@@ -96,33 +104,95 @@ def singlestn_daily(elem: str, sid: str, sdate: str, edate: str,
     print_md        Default = True
      class: 'bool', Print information about multi-day event processing if found while querying data.
 
+    Optional parameters for on-disk cache
+    -------------------------------------
+    use_cache       Default = False
+     class: 'bool', If True, raw daily values are read from the on-disk cache in 'NOAA_ACIS_cache.py' 
+                    and only the days that are not cached yet are queried from NOAA ACIS.
+
     Returns
     ---------------------
     output: class: 'numpy.ndarray'
     '''
 
     #-------------------------------------------------------------------------------------------------
-    # Query raw data from json request    
+    # Query raw data from json request, or from the on-disk cache if permitted
     #-------------------------------------------------------------------------------------------------
 
-    # Input dictionary of station id, start date, and end date 
-    input_dict = {'sid': sid,'elems': elem,'sdate':sdate,'edate':edate}
+    if use_cache == True:
+     values = stncache.cached_values(elem=elem, sid=sid, sdate=sdate, edate=edate,
+                                     fetch=lambda s, e: stndata.json_req_stndata(elem=elem, sid=sid,
+                                                                                 sdate=s, edate=e))
+    else:
+     values = stndata.json_req_stndata(elem=elem, sid=sid, sdate=sdate, edate=edate)
+
+    #-------------------------------------------------------------------------------------------------
+    # Process missing, trace, and multi-day values and output final array as a float array
+    #-------------------------------------------------------------------------------------------------
+
+    return stndata.singlestn_decode(elem=elem, sid=sid, sdate=sdate, edate=edate, values=values,
+                                    M=M, T=T, mdr=mdr, mdr_opt=mdr_opt, mdr_A=mdr_A, mdr_S=mdr_S,
+                                    print_md=print_md)
+
+#======================================================================================================
+# Process raw NOAA ACIS daily values from a single station and return as float array
+#======================================================================================================
+
+def singlestn_decode(elem: str, sid: str, sdate: str, edate: str, values: np.ndarray,
+
+                     # Optional parameters for all elems
+                     M: float = float('NaN'),
+
+                     # Optional parameters for elems 'pcpn' and 'snow'
+                     T: float = 0.00001, mdr: int = 50, mdr_opt: str = 'avg', 
+                     mdr_A: str = 'equal', mdr_S: str = '0',
+
+                     # Optional parameters for printing results
+                     print_md: bool = True
+
+                     ):
+
+    '''
+    Converts the raw daily values returned by NOAA ACIS for a single station (values and flags of
+    strings such as '45', 'M', 'T', 'S' or '2.0A', see 'NOAA_ACIS_stream.py') into a float array. 
+    Missing and trace values are converted and multi-day events are processed the same way for every 
+    query function (StnData or MultiStnData).
+
+    Required Parameters
+    --------------------
+    elem
+     class: 'string', Single variable element to include. Example: 'maxt'
+                      Possible options are 'maxt','mint','avgt','pcpn','snow','snwd'.
+
+    sid
+     class: 'string', Station ID, also known as sids. Only used when printing multi-day events.
+
+    sdate, edate
+     class: 'string', Starting and ending dates of 'values' in form 'YYYY-MM-DD'. Only used when 
+                      printing multi-day events.
 
-    # Get json data from url
-    json_response = urllib.request.urlopen(urllib.request.Request('http://data.rcc-acis.org/StnData',
-                                           urllib.parse.urlencode({'params':json.dumps(input_dict)}
-                                           ).encode('utf-8'),{'Accept':'application/json'})).read()
-    raw = json.loads(json_response)
+    values
+     class: 'numpy.ndarray', Raw daily values of 'NOAA_ACIS_stream.raw_dtype', one per day from 'sdate'
+                             to 'edate'.
+
+    Optional parameters
+    --------------------
+    See singlestn_daily().
+
+    Returns
+    ---------------------
+    output: class: 'numpy.ndarray'
+    '''
 
     #-------------------------------------------------------------------------------------------------
-    # Read in data to pd DataFrame and process missing and trace values
+    # Read in values and flags and process missing and trace values
     #-------------------------------------------------------------------------------------------------
     
-    # pd.DataFrame named 'Station' contains raw data 
-    Station = pd.DataFrame(raw['data'],columns=['Date',elem])
+    # Copies of raw values and flags, flags of processed multi-day events are set to plain values
+    Values, Flags = values['value'].copy(), values['flag'].copy()
     
     # Set M to specified value 
-    Station[elem] = np.where(Station[elem] == 'M', M, Station[elem])
+    Values[Flags == stream.FLAG_M] = M
 
     #-------------------------------------------------------------------------------------------------
     # Further processing if elem is 'pcpn' or 'snow' or 'snwd' 
@@ -131,68 +201,86 @@ def singlestn_daily(elem: str, sid: str, sdate: str, edate: str,
     if elem == 'pcpn' or elem == 'snow' or elem == 'snwd':
 
      # Set T to specified value
-     Station[elem] = np.where(Station[elem] == 'T', T, Station[elem])
+     Values[Flags == stream.FLAG_T] = T
 
      #-------------------------------------------------------------------------------------------------
      # Process multi-day events (i.e., when data shows a value like 'S' ... '2.0A') 
      #-------------------------------------------------------------------------------------------------
 
-     # Process normal multi-day events, where data shows S->A
-
-     for sa in range(len(Station[elem])):
-      if Station[elem].iloc[sa] == 'S':
-       # First, control for multi-day range (mdr) extending beyond bounds of record
-       if (len(Station[elem]) - Station[elem].index[sa]) < mdr:
-        for x in range(len(Station[elem]) - Station[elem].index[sa]):
-         if ('A' in str(Station[elem].iloc[sa+x])) == True:
-          if mdr_opt == 'avg':
-           # Set pcpn/snow values from S->A as average of A value across all relevant days
-           Station[elem].iloc[sa:sa+x+1] = float(Station[elem].iloc[sa+x].replace('A','')) / (x+1)
-          break
-       # Next, calculate all other multi-day range (mdr) events 
-       else:
-        for x in range(mdr):                          # check next n days for the A
-         if ('A' in str(Station[elem].iloc[sa+x])) == True:
-          if mdr_opt == 'avg':
-           # Set pcpn/snow values from S->A as average of A value across all relevant days
-           Station[elem].iloc[sa:sa+x+1] = float(Station[elem].iloc[sa+x].replace('A','')) / (x+1)
-          break
+     # Process normal multi-day events, where data shows S->A. An S starts an event if the next A is
+     # less than mdr days away, and of all S sharing the same next A only the first such S starts it.
+     # Earlier S of the same group are too far from the A and remain S.
+
+     index = np.arange(len(Flags))
+     Apos = np.flatnonzero(Flags == stream.FLAG_A)
+     nextA = np.append(Apos,len(Flags))[np.searchsorted(Apos,index)]  # index of next A, or len(Flags)
+     starts = np.flatnonzero((Flags == stream.FLAG_S) & (nextA < len(Flags)) & (nextA - index < mdr))
+     starts = starts[np.diff(nextA[starts],prepend=-1) != 0]
+
+     if mdr_opt == 'avg' and len(starts) > 0:
+      # Set pcpn/snow values from S->A as average of A value across all relevant days
+      ends = nextA[starts]
+      days = ends - starts + 1
+      event = np.repeat(starts - np.append(0,np.cumsum(days)[:-1]), days) + np.arange(days.sum())
+      Values[event] = np.repeat(Values[ends] / days, days)
+      Flags[event] = stream.FLAG_VALUE
                          
      # Process where any 'A' values remain, which means there was no 'S' before  
 
-     if Station[elem].str.contains('A').any() == True:
-      if mdr_A == 'equal':
-         if print_md == True:
-          print(sid+' has standalone A, setting equal to that days value')
-         Aind = Station[elem].index[Station[elem].str.contains('A') == True].values
-         # Manage if the station has more than one of these special data cases
-         if len(Aind) > 0:
-          for Aelem in range(len(Aind)):
-           if print_md == True:
-            Adate = pd.date_range(start=sdate,end=edate,freq='D')[Aind][Aelem].date() # find date of standalone
-            print(str(Adate)+': '+Station[elem][int(Aind[Aelem])]+'->'+\
-                             str(np.float64(Station[elem][int(Aind[Aelem])].replace('A',''))))
-           Station[elem][Aind[Aelem]] = np.float64(Station[elem][Aind[Aelem]].replace('A',''))
+     Aind = np.flatnonzero(Flags == stream.FLAG_A)
+     if len(Aind) > 0 and mdr_A == 'equal':
+      if print_md == True:
+       print(sid+' has standalone A, setting equal to that days value')
+       # Manage if the station has more than one of these special data cases
+       for Adate, Aval in zip(pd.Timestamp(sdate) + pd.to_timedelta(Aind,unit='D'), Values[Aind]):
+        print(str(Adate.date())+': '+str(Aval)+'A->'+str(Aval))
+      Flags[Aind] = stream.FLAG_VALUE
 
      # Process where any 'S' values remain, which means there is no 'A' afterwards 
 
-     if Station[elem].str.contains('S').any() == True:
+     Sind = np.flatnonzero(Flags == stream.FLAG_S)
+     if len(Sind) > 0:
       if print_md == True:   
        print(sid+' has standalone S, setting to 0')
-      Sind = Station[elem].index[Station[elem].str.contains('S') == True].values
-      # Manage if the station has more than one of these special data cases
-      if len(Sind) > 0:
-       for Selem in range(len(Sind)):
-        if print_md == True:
-         Sdate = pd.date_range(start=sdate,end=edate,freq='D')[Sind][Selem].date() # find date of standalone   
-         print(str(Sdate)+': '+Station[elem][int(Sind[Selem])]+'->0')
-        Station[elem][Sind[Selem]] = 0
+       # Manage if the station has more than one of these special data cases
+       for Sdate in pd.Timestamp(sdate) + pd.to_timedelta(Sind,unit='D'):
+        print(str(Sdate.date())+': S->0')
+      Values[Sind] = 0
 
     #-------------------------------------------------------------------------------------------------
     # Output final array as a float array
     #-------------------------------------------------------------------------------------------------
 
-    return np.float32(Station[elem])
+    return np.float32(Values)
+
+#======================================================================================================
+# JSON request to pull raw daily values of a single station from NOAA ACIS 
+#======================================================================================================
+
+def json_req_stndata(elem: str, sid: str, sdate: str, edate: str):
+
+    '''
+    Performs json request of NOAA ACIS StnData for a single station and element and returns the raw
+    daily values (e.g., '45', 'M', 'T', 'S', '2.0A') as values and flags. The response is parsed while 
+    it is being read, straight into a preallocated array, see 'NOAA_ACIS_stream.py'.
+
+    Parameters
+    -------------
+    elem, sid, sdate, edate
+     class: 'string', Element, station ID, and starting and ending dates ('YYYY-MM-DD') to query.
+
+    Returns
+    ---------------------
+    output: class: 'numpy.ndarray', Raw daily values of 'NOAA_ACIS_stream.raw_dtype', one per day from 
+                                    'sdate' to 'edate'.
+    '''
+
+    # Input dictionary of station id, start date, and end date 
+    input_dict = {'sid': sid,'elems': elem,'sdate':sdate,'edate':edate}
+
+    # Parse json data from url while it is being read
+    return stream.parse_stndata(transport.acis_request_stream('StnData',input_dict),
+                                (pd.Timestamp(edate) - pd.Timestamp(sdate)).days+1)
 
 ######################################################################################################
 #
@@ -200,6 +288,497 @@ def singlestn_daily(elem: str, sid: str, sdate: str, edate: str,
 #
 ######################################################################################################
 
+#======================================================================================================
+# Query daily data from every station listed in a metadata DataFrame concurrently, return list of float
+# arrays in the same order as the metadata rows
+#======================================================================================================
+
+def multistn_fetch(elem: str, metadata: pd.DataFrame,
+
+                   # Optional parameters for concurrent data query
+                   max_workers: int = 8, on_error: str = 'skip',
+
+                   # Optional parameters for all elems
+                   M: float = float('NaN'),
+
+                   # Optional parameters for elems 'pcpn', 'snow', and 'snwd'
+                   T: float = 0.00001, mdr: int = 50, mdr_opt: str = 'avg',
+                   mdr_A: str = 'equal', mdr_S: str = '0',
+
+                   # Optional parameters for printing results
+                   print_results: bool = True, print_md: bool = True,
+
+                   # Optional parameters for on-disk cache
+                   use_cache: bool = False
+
+                   ):
+
+    '''
+    Queries daily data for every station in a metadata DataFrame (as returned by the stnmeta
+    functions) by issuing the single station StnData requests in parallel from a bounded pool of
+    worker threads. Each station is read with singlestn_daily() between its own 'sdate' and 'edate'.
+    Almost all of the time spent on a multi-station query is waiting on the network, so running
+    several requests at once shortens the query roughly by a factor of 'max_workers'.
+
+    Required Parameters
+    --------------------
+    elem
+     class: 'string', Single variable element to include. Example: 'maxt'
+                      Possible options are 'maxt','mint','avgt','pcpn','snow','snwd'.
+
+    metadata
+     class: 'pandas.DataFrame', Metadata for all stations to query. Must include 'sids', 'name',
+                                'state', 'sdate' and 'edate' columns.
+
+    Optional parameters for concurrent data query
+    ----------------------------------------------
+    max_workers        Default = 8
+     class: 'integer', Maximum number of station requests sent to NOAA ACIS at the same time. 
+                       Setting this to 1 queries the stations one after another.
+
+    on_error           Default = 'skip'
+     class: 'string', 'skip' sets all values of a station to NaN and continues with the remaining 
+                      stations if the station cannot be queried once all retries of 
+                      'NOAA_ACIS_transport.py' have failed. 'raise' stops the query with the error.
+
+    Optional parameters for all elems, for elems 'pcpn', 'snow', and 'snwd', for printing results, 
+    and for on-disk cache
+    --------------------------------------------------------------------------------------------------
+    See singlestn_daily().
+
+    Returns
+    ---------------------
+    output: class: 'list', 'list'
+            List of 'numpy.ndarray' with one array per station, in the same order as the rows of 
+            'metadata', and list of station ids (sids) that could not be queried.
+    '''
+
+    #-------------------------------------------------------------------------------------------------
+    # Submit every station to the thread pool 
+    #-------------------------------------------------------------------------------------------------
+
+    if print_results == True and len(metadata) > 0:
+     print(str(elem)+': Reading in '+str(len(metadata))+' total stations (station id: name, state) ...')
+
+    with ThreadPoolExecutor(max_workers=max(1,int(max_workers))) as executor:
+
+     futures = {executor.submit(stndata.singlestn_daily, elem=elem, sid=metadata['sids'][i],
+                                sdate=metadata['sdate'][i], edate=metadata['edate'][i],
+                                M=M, T=T, mdr=mdr, mdr_opt=mdr_opt, mdr_A=mdr_A, mdr_S=mdr_S,
+                                print_results=print_results, print_md=print_md,
+                                use_cache=use_cache): i
+                for i in range(len(metadata))}
+
+     #-------------------------------------------------------------------------------------------------
+     # Collect results as they arrive and keep them in metadata order
+     #-------------------------------------------------------------------------------------------------
+
+     station_values, failed_rows = [None]*len(metadata), []
+     for n, future in enumerate(as_completed(futures)):
+      i = futures[future]
+      # Isolate failed stations so one error does not abort the whole query
+      try:
+       station_values[i] = future.result()
+      except Exception as error:
+       if on_error == 'raise':
+        raise
+       print('ERROR: '+metadata['sids'][i]+' could not be queried ('+str(error)+'), values set to NaN')
+       station_values[i] = np.full((pd.Timestamp(metadata['edate'][i]) - 
+                                    pd.Timestamp(metadata['sdate'][i])).days+1,np.nan,dtype=np.float32)
+       failed_rows.append(i)
+      # Show station information if permitted
+      if print_results == True:
+       print('#'+str(n+1)+'. '+metadata['sids'][i]+': '+metadata['name'][i]+', '+metadata['state'][i])
+
+    return station_values, [metadata['sids'][i] for i in sorted(failed_rows)]
+
+#======================================================================================================
+# Plan chunked MultiStnData requests from the date range of each station, keeping the number of daily 
+# values in each response near a target size
+#======================================================================================================
+
+def plan_chunks(ranges: dict, chunk_size: int = 50, target_days: int = None, nelems: int = 1):
+
+    '''
+    Splits stations into the chunks of a MultiStnData query. Each request covers the dates of all of
+    its stations, so its response holds (number of stations) x (days from earliest 'sdate' to latest
+    'edate') values per element. Without 'target_days', stations are split in their given order into
+    chunks of 'chunk_size' stations. With 'target_days', stations are sorted by date range and added to
+    a chunk while its response stays within 'target_days' values, so stations with similar periods of
+    record share a request and short records are not padded to the longest one in the box. A station
+    is never split across requests. Chunks are returned largest first, so the longest requests start
+    first when sent concurrently.
+
+    Parameters
+    -------------
+    ranges
+     class: 'dict', (sdate, edate) of each station id to query, as 'pandas.Timestamp'.
+
+    chunk_size         Default = 50
+     class: 'integer', Maximum number of stations in a chunk.
+
+    target_days        Default = None
+     class: 'integer', Target number of daily values in the response of a chunk, over all of its
+                       stations and elements.
+
+    nelems             Default = 1
+     class: 'integer', Number of elements queried for each station.
+
+    Returns
+    ---------------------
+    output: class: 'list', 'integer'
+            List of chunks, each a list of station ids, and total number of daily values requested.
+    '''
+
+    chunk_size = max(1,int(chunk_size))
+    sids = list(ranges)
+
+    # Daily values requested by a chunk
+    def chunk_days(chunk):
+     return len(chunk)*nelems*((max(ranges[sid][1] for sid in chunk) - 
+                                min(ranges[sid][0] for sid in chunk)).days+1)
+
+    if target_days is None:
+     chunks = [sids[c:c+chunk_size] for c in range(0,len(sids),chunk_size)]
+     return chunks, sum(chunk_days(chunk) for chunk in chunks)
+
+    #-------------------------------------------------------------------------------------------------
+    # Fill chunks with stations in order of date range while they stay within the target size
+    #-------------------------------------------------------------------------------------------------
+
+    chunks, sizes = [], []
+    chunk, chunk_sdate, chunk_edate = [], None, None
+    for sid in sorted(sids, key=lambda sid: ranges[sid]):
+     sdate, edate = ranges[sid]
+     if len(chunk) > 0:
+      edate_new = max(chunk_edate,edate)
+      size = (len(chunk)+1)*nelems*((edate_new - chunk_sdate).days+1)
+      if len(chunk) < chunk_size and size <= target_days:
+       chunk.append(sid)
+       chunk_edate = edate_new
+       continue
+      chunks.append(chunk)
+      sizes.append(len(chunk)*nelems*((chunk_edate - chunk_sdate).days+1))
+     chunk, chunk_sdate, chunk_edate = [sid], sdate, edate
+    if len(chunk) > 0:
+     chunks.append(chunk)
+     sizes.append(len(chunk)*nelems*((chunk_edate - chunk_sdate).days+1))
+
+    # Largest chunks first
+    order = np.argsort(sizes,kind='stable')[::-1]
+
+    return [chunks[i] for i in order], int(sum(sizes))
+
+#======================================================================================================
+# Query daily data from every station listed in a metadata DataFrame with chunked MultiStnData requests,
+# return list of float arrays in the same order as the metadata rows
+#======================================================================================================
+
+def multistn_fetch_batched(elem: str, metadata: pd.DataFrame,
+
+                           # Optional parameters for batched data query
+                           chunk_size: int = 50, max_workers: int = 4, on_error: str = 'skip',
+                           target_days: int = None,
+
+                           # Optional parameters for all elems
+                           M: float = float('NaN'),
+
+                           # Optional parameters for elems 'pcpn', 'snow', and 'snwd'
+                           T: float = 0.00001, mdr: int = 50, mdr_opt: str = 'avg',
+                           mdr_A: str = 'equal', mdr_S: str = '0',
+
+                           # Optional parameters for printing results
+                           print_results: bool = True, print_md: bool = True,
+
+                           # Optional parameters for on-disk cache
+                           use_cache: bool = False
+
+                           ):
+
+    '''
+    Queries daily data for every station in a metadata DataFrame (as returned by the stnmeta
+    functions) with MultiStnData requests, each one covering up to 'chunk_size' stations, instead of
+    one StnData request per station. Chunks are always built from the 'sids' of the metadata, for a 
+    bounding box query as well as for a list of sids, so every station in the combined response can
+    be matched back to its metadata row. Each station is then cut to its own 'sdate' and 'edate' and
+    processed with singlestn_decode(), giving the same arrays as singlestn_daily().
+
+    Required Parameters
+    --------------------
+    elem
+     class: 'string', Single variable element to include. Example: 'maxt'
+                      Possible options are 'maxt','mint','avgt','pcpn','snow','snwd'.
+
+    metadata
+     class: 'pandas.DataFrame', Metadata for all stations to query. Must include 'sids', 'name',
+                                'state', 'sdate' and 'edate' columns.
+
+    Optional parameters for batched data query
+    -------------------------------------------
+    chunk_size         Default = 50
+     class: 'integer', Maximum number of stations included in a single MultiStnData request. Keeps
+                       the size of each response bounded.
+
+    max_workers        Default = 4
+     class: 'integer', Maximum number of MultiStnData requests sent to NOAA ACIS at the same time.
+
+    on_error           Default = 'skip'
+     class: 'string', 'skip' queries the stations of a failed MultiStnData request one by one, sets
+                      all values of a station that still fails to NaN, and continues with the
+                      remaining stations. 'raise' stops the query with the error.
+
+    target_days        Default = None
+     class: 'integer', If given, stations with similar date ranges are grouped into requests of
+                       about this many daily values each (at most 'chunk_size' stations), see
+                       plan_chunks(). Keeps the size of each response bounded for any number of
+                       stations and record lengths.
+
+    Optional parameters for all elems, for elems 'pcpn', 'snow', and 'snwd', for printing results, 
+    and for on-disk cache
+    --------------------------------------------------------------------------------------------------
+    See singlestn_daily().
+
+    Returns
+    ---------------------
+    output: class: 'list', 'list'
+            List of 'numpy.ndarray' with one array per station, in the same order as the rows of 
+            'metadata', and list of station ids (sids) that could not be queried.
+    '''
+
+    station_values, failed = stndata.multielem_fetch_batched(elems=(elem,), metadata={elem: metadata},
+                                                             chunk_size=chunk_size, max_workers=max_workers,
+                                                             on_error=on_error, target_days=target_days,
+                                                             M=M, T=T, mdr=mdr,
+                                                             mdr_opt=mdr_opt, mdr_A=mdr_A, mdr_S=mdr_S,
+                                                             print_results=print_results, print_md=print_md,
+                                                             use_cache=use_cache)[elem]
+
+    return station_values, failed
+
+#======================================================================================================
+# Query daily data of several elements from every station listed in one metadata DataFrame per element
+# with chunked MultiStnData requests, each station is queried once for all of its elements
+#======================================================================================================
+
+def multielem_fetch_batched(elems: tuple, metadata: dict,
+
+                            # Optional parameters for batched data query
+                            chunk_size: int = 50, max_workers: int = 4, on_error: str = 'skip',
+                            target_days: int = None,
+
+                            # Optional parameters for all elems
+                            M: float = float('NaN'),
+
+                            # Optional parameters for elems 'pcpn', 'snow', and 'snwd'
+                            T: float = 0.00001, mdr: int = 50, mdr_opt: str = 'avg',
+                            mdr_A: str = 'equal', mdr_S: str = '0',
+
+                            # Optional parameters for printing results
+                            print_results: bool = True, print_md: bool = True,
+
+                            # Optional parameters for on-disk cache
+                            use_cache: bool = False,
+
+                            # Optional parameters for background queries
+                            progress = None, cancel: threading.Event = None
+
+                            ):
+
+    '''
+    Queries daily data of several elements for the stations in one metadata DataFrame per element (as
+    returned by the stnmeta functions). NOAA ACIS returns every element listed in 'elems' for each
+    station of a MultiStnData request, so each station found in any of the metadata DataFrames is
+    queried once, over the dates needed by all of its elements, and its response is split into one
+    raw array per element. Each element of a station is then cut to the 'sdate' and 'edate' of its
+    own metadata row and processed with singlestn_decode(), giving the same arrays as
+    multistn_fetch_batched() for that element alone.
+
+    Required Parameters
+    --------------------
+    elems
+     class: 'tuple', Elements to include. Example: ('maxt','mint','pcpn','snow')
+
+    metadata
+     class: 'dict', Metadata DataFrame of the stations to query for each element in 'elems'. Each must
+                    include 'sids', 'name', 'state', 'sdate' and 'edate' columns.
+
+    Optional parameters for batched data query, for all elems, for elems 'pcpn', 'snow', and 'snwd', 
+    for printing results, and for on-disk cache
+    --------------------------------------------------------------------------------------------------
+    See multistn_fetch_batched(). With 'target_days', stations are grouped into requests by plan_chunks()
+    counting the daily values of all elements.
+
+    Optional parameters for background queries
+    -------------------------------------------
+    progress           Default = None
+     class: 'function', Called as progress(stations_done, stations_total, nbytes) each time a chunk of
+                        stations is done, with the number of stations queried so far, the number of
+                        stations to query, and the number of response bytes received so far. Called
+                        from the query threads.
+
+    cancel             Default = None
+     class: 'threading.Event', Once set, chunks not yet sent are skipped and their stations are left
+                               as not queried (NaN, listed in the failed station ids), so the
+                               stations queried so far are returned as partial results.
+
+    Returns
+    ---------------------
+    output: class: 'dict', For each element, the list of 'numpy.ndarray' with one array per station in
+                           the same order as the rows of its metadata, and the list of station ids
+                           (sids) that could not be queried.
+    '''
+
+    #-------------------------------------------------------------------------------------------------
+    # Dates to query for each station and element, stations fully served by the on-disk cache are not
+    # queried
+    #-------------------------------------------------------------------------------------------------
+
+    plans, rows_of = {}, {}
+    for elem in elems:
+     meta = metadata[elem]
+     if use_cache == True:
+      plans[elem] = [stncache.cache_plan(elem,meta['sids'][i],meta['sdate'][i],meta['edate'][i])
+                     for i in range(len(meta))]
+     else:
+      plans[elem] = [(meta['sdate'][i],meta['edate'][i]) for i in range(len(meta))]
+     # Rows of each station id, a few distinct stations share their first station id
+     rows_of[elem] = {}
+     for i in range(len(meta)):
+      rows_of[elem].setdefault(meta['sids'][i],[]).append(i)
+
+    # Each station is queried once over the dates to query of all of its elements
+    ranges = {}
+    for elem in elems:
+     for sid, plan in zip(metadata[elem]['sids'],plans[elem]):
+      if plan is None:
+       continue
+      sdate, edate = pd.Timestamp(plan[0]), pd.Timestamp(plan[1])
+      ranges[sid] = (min(sdate,ranges[sid][0]), max(edate,ranges[sid][1])) if sid in ranges else (sdate, edate)
+
+    #-------------------------------------------------------------------------------------------------
+    # Split the stations into chunks of at most 'chunk_size' stations, or of about 'target_days' daily
+    # values
+    #-------------------------------------------------------------------------------------------------
+
+    query_sids = list(ranges)
+    chunks, ndays = stndata.plan_chunks(ranges, chunk_size=chunk_size, target_days=target_days,
+                                        nelems=len(elems))
+
+    nstations = len(set(sid for elem in elems for sid in metadata[elem]['sids']))
+    if print_results == True and nstations > 0:
+     print(','.join(elems)+': Reading in '+str(nstations)+' total stations in '+str(len(chunks))+
+           ' MultiStnData requests ('+str(round(ndays/1e6,1))+' million daily values) '+
+           '(station id: name, state) ...')
+
+    # Raw daily values of each element and metadata row, as queried for the dates of its plan
+    raw_values = {elem: [None]*len(metadata[elem]) for elem in elems}
+
+    # Stations done and response bytes received, shared by the query threads
+    done = {'stations': 0, 'nbytes': 0}
+    done_lock = threading.Lock()
+
+    #-------------------------------------------------------------------------------------------------
+    # Query one chunk and keep the raw daily values of each element of its stations
+    #-------------------------------------------------------------------------------------------------
+
+    def query_chunk(sids):
+
+     # Date range of the chunk covers the queried date range of all of its stations
+     chunk_sdate = min(ranges[sid][0] for sid in sids)
+     chunk_edate = max(ranges[sid][1] for sid in sids)
+
+     # Input dictionary of station ids, elements, start date, and end date 
+     input_dict = {'sids': ','.join(sids),'elems': ','.join(elems),'meta': 'sids',
+                   'sdate': str(chunk_sdate.date()),'edate': str(chunk_edate.date())}
+
+     # Get json data from url
+     body = transport.acis_request_raw('MultiStnData',input_dict)
+     with done_lock:
+      done['nbytes'] += len(body)
+     raw = json.loads(body)
+
+     # Match every station id listed in the response to its daily values, one array per element
+     response = {}
+     for stn in raw['data']:
+      values = [stream.encode_values([day[k] for day in stn['data']]) for k in range(len(elems))]
+      for stn_sid in stn['meta']['sids']:
+       response[stn_sid.split(' ')[0]] = values
+
+     # Cut each element of a station to its own queried date range, missing stations are set to 'M'
+     for sid in sids:
+      for k, elem in enumerate(elems):
+       for i in rows_of[elem].get(sid,[]):
+        if plans[elem][i] is None:
+         continue
+        sdate_ind = (pd.Timestamp(plans[elem][i][0]) - chunk_sdate).days
+        edate_ind = (pd.Timestamp(plans[elem][i][1]) - chunk_sdate).days
+        values = response[sid][k] if sid in response else stream.missing_values(edate_ind+1)
+        raw_values[elem][i] = values[sdate_ind:edate_ind+1]
+
+    #-------------------------------------------------------------------------------------------------
+    # Send chunks concurrently, then decode each element of each station in metadata order
+    #-------------------------------------------------------------------------------------------------
+
+    # Query stations of a failed chunk one by one, stations that still fail are left as None
+    def query_chunk_isolated(sids):
+     if cancel is not None and cancel.is_set():
+      return
+     try:
+      query_chunk(sids)
+     except Exception as error:
+      if on_error == 'raise':
+       raise
+      print('ERROR: MultiStnData request failed ('+str(error)+'), querying its stations one by one')
+      for sid in sids:
+       for elem in elems:
+        for i in rows_of[elem].get(sid,[]):
+         if plans[elem][i] is None or (cancel is not None and cancel.is_set()):
+          continue
+         try:
+          raw_values[elem][i] = stndata.json_req_stndata(elem=elem,sid=sid,sdate=plans[elem][i][0],
+                                                         edate=plans[elem][i][1])
+         except Exception as error:
+          print('ERROR: '+sid+' could not be queried ('+str(error)+'), values set to NaN')
+     # Report stations done
+     if progress is not None:
+      with done_lock:
+       done['stations'] += len(sids)
+       stations_done, nbytes = done['stations'], done['nbytes']
+      progress(stations_done, len(query_sids), nbytes)
+
+    with ThreadPoolExecutor(max_workers=max(1,int(max_workers))) as executor:
+     list(executor.map(query_chunk_isolated, chunks))
+
+    results = {}
+    for elem in elems:
+     meta = metadata[elem]
+     station_values, failed = [], []
+     for i in range(len(meta)):
+      # Show station information if permitted
+      if print_results == True:
+       print('#'+str(i+1)+'. '+meta['sids'][i]+': '+meta['name'][i]+', '+meta['state'][i])
+      # Failed stations are set to NaN
+      if plans[elem][i] is not None and raw_values[elem][i] is None:
+       station_values.append(np.full((pd.Timestamp(meta['edate'][i]) - 
+                                      pd.Timestamp(meta['sdate'][i])).days+1,np.nan,dtype=np.float32))
+       failed.append(meta['sids'][i])
+       continue
+      # Combine queried values with the on-disk cache
+      values = raw_values[elem][i]
+      if use_cache == True:
+       values = stncache.cache_update(elem,meta['sids'][i],meta['sdate'][i],meta['edate'][i],
+                                      plans[elem][i],values)
+       if values is None:
+        values = stndata.json_req_stndata(elem=elem,sid=meta['sids'][i],
+                                          sdate=meta['sdate'][i],edate=meta['edate'][i])
+      station_values.append(stndata.singlestn_decode(elem=elem, sid=meta['sids'][i],
+                                                     sdate=meta['sdate'][i], edate=meta['edate'][i],
+                                                     values=values, M=M, T=T, mdr=mdr, mdr_opt=mdr_opt,
+                                                     mdr_A=mdr_A, mdr_S=mdr_S, print_md=print_md))
+     results[elem] = (station_values, failed)
+
+    return results
+
 #======================================================================================================
 # Query daily data from multiple stations from NOAA ACIS within a specified bounding box, return as 
 # Pandas DataFrame with each station represented by a new column      
@@ -208,7 +787,11 @@ def singlestn_daily(elem: str, sid: str, sdate: str, edate: str,
 def bbox_multistn_daily(elem: str, slat: float, nlat: float, wlon: float, elon: float,
                    
                         # Optional parameters for size of data query
-                        stn_size: int = 1000,
+                        stn_size: int = 1000, target_days: int = None, max_days: int = 100000000,
+
+                        # Optional parameters for concurrent data query
+                        max_workers: int = 8, query_mode: str = 'stndata', chunk_size: int = 50,
+                        on_error: str = 'skip',
  
                         # Optional parameters for all elems
                         M: float = float('NaN'),
@@ -220,6 +803,18 @@ def bbox_multistn_daily(elem: str, slat: float, nlat: float, wlon: float, elon:
                         # Optional parameters for printing results
                         print_results: bool = True, print_md: bool = True,
 
+                        # Optional parameters for on-disk cache
+                        use_cache: bool = False,
+
+                        # Optional parameters for station metadata
+                        meta_source: str = 'live',
+
+                        # Optional parameters for station prefilter
+                        min_days: int = None, overlap: tuple = None, sids_types: tuple = None,
+
+                        # Optional parameters for output format
+                        as_matrix: bool = False, sparse: bool = False,
+
                         # Optional parameters for outputing variables to excel
                         stn_excel: bool = False, meta_excel: bool = False,
                         folderpath: str = ''
@@ -247,7 +842,42 @@ def bbox_multistn_daily(elem: str, slat: float, nlat: float, wlon: float, elon:
     -------------------------------------------
     stn_size           Default = 1000
      class: 'integer', If the bbox returns more than this many stations, data will not be queried
-                       and script will exit.
+                       and script will exit. Not checked if 'target_days' is given, 'max_days' is
+                       checked instead.
+
+    target_days        Default = None
+     class: 'integer', If given, the bbox is queried whatever its number of stations: stations are
+                       grouped into MultiStnData requests of about this many daily values each (see
+                       plan_chunks()), sent 'max_workers' at a time, and query_mode is always
+                       'multistndata'. Example: 500000 (about 50 stations over 27 years). Use with
+                       sparse = True for large regions.
+
+    max_days           Default = 100000000
+     class: 'integer', If 'target_days' is given and the periods of record of all stations in the bbox
+                       hold more than this many daily values, data will not be queried and script
+                       will exit. The default is about 2700 stations over 100 years, or 400 MB of
+                       float32 values with sparse = True.
+
+    Optional parameters for concurrent data query
+    ----------------------------------------------
+    max_workers        Default = 8
+     class: 'integer', Maximum number of station requests sent to NOAA ACIS at the same time. 
+                       Setting this to 1 queries the stations one after another.
+
+    query_mode         Default = 'stndata'
+     class: 'string', 'stndata' sends one StnData request per station. 'multistndata' sends chunked
+                      MultiStnData requests with up to 'chunk_size' stations each, which cuts the 
+                      number of round trips from one per station to a handful.
+
+    chunk_size         Default = 50
+     class: 'integer', Maximum number of stations per MultiStnData request if 
+                       query_mode = 'multistndata'.
+
+    on_error           Default = 'skip'
+     class: 'string', 'skip' sets all values of a station to NaN and continues with the remaining 
+                      stations if the station cannot be queried once all retries have failed. The
+                      station ids (sids) of such stations are listed in attrs['failed_sids'] of both
+                      returned DataFrames. 'raise' stops the query with the error.
 
     Optional parameters for all elems
     ----------------------------------
@@ -288,6 +918,50 @@ def bbox_multistn_daily(elem: str, slat: float, nlat: float, wlon: float, elon:
     print_md        Default = True
      class: 'bool', Print information about multi-day event processing if found while querying data.
 
+    Optional parameters for on-disk cache
+    -------------------------------------
+    use_cache       Default = False
+     class: 'bool', If True, raw daily values are read from the on-disk cache in 'NOAA_ACIS_cache.py' 
+                    and only the days that are not cached yet are queried from NOAA ACIS.
+
+    Optional parameters for station metadata
+    ----------------------------------------
+    meta_source     Default = 'live'
+     class: 'string', Where station metadata is read from. 'live' queries NOAA ACIS StnMeta, 'catalog'
+                      reads the local station catalog in 'NOAA_ACIS_catalog.py' without any request,
+                      and 'auto' reads the catalog while it is recent and only queries NOAA ACIS for
+                      stations whose period of record may have grown since. See bbox_metadata().
+
+    Optional parameters for station prefilter
+    -----------------------------------------
+    min_days        Default = None
+     class: 'integer', Stations with fewer days from 'sdate' to 'edate' are not queried.
+
+    overlap         Default = None
+     class: 'tuple', (sdate, edate) window, stations whose period of record does not overlap it are not
+                     queried. Either date may be None. Example: ('1991-01-01', '2020-12-31')
+
+    sids_types      Default = None
+     class: 'tuple', Types of station ids to query, other stations are not queried.
+                     Example: ('coop','wban','ghcn') leaves out 'cocorahs' stations.
+
+    Stations are removed from the metadata before any data request (see stnmeta.filter_metadata()),
+    the data of the remaining stations is unchanged. Raises ValueError if no stations are left.
+
+    Optional parameters for output format
+    -------------------------------------
+    as_matrix       Default = False
+     class: 'bool', If True, station data is returned as a 'StationMatrix' (see 'NOAA_ACIS_stnmatrix.py')
+                    holding float32 values, instead of a float64 DataFrame. Its frame() method returns
+                    a DataFrame with the same layout that shares memory with the matrix.
+
+    sparse          Default = False
+     class: 'bool', If True, station data is returned as 'StationSegments' (see 'NOAA_ACIS_stnmatrix.py')
+                    holding the float32 values of each station only within its valid date range, one
+                    station after another. No array over all dates and stations is allocated, which
+                    saves most of the memory if stations have disjoint periods of record. The
+                    processing functions and plots accept it in place of a DataFrame.
+
     Optional parameters for outputing variables to excel
     ----------------------------------------------------
     stn_excel       Default = False
@@ -308,7 +982,8 @@ def bbox_multistn_daily(elem: str, slat: float, nlat: float, wlon: float, elon:
 
     Returns
     ---------------------
-    output: class: 'pandas.DataFrame'
+    output: class: 'pandas.DataFrame', or 'NOAA_ACIS_stnmatrix.StationMatrix' if as_matrix = True, or
+                   'NOAA_ACIS_stnmatrix.StationSegments' if sparse = True
     '''
 
     #-------------------------------------------------------------------------------------------------
@@ -317,13 +992,21 @@ def bbox_multistn_daily(elem: str, slat: float, nlat: float, wlon: float, elon:
 
     # Only pull metadata on required parameters
     metadata = stnmeta.bbox_metadata(elem=elem,items='name,state,sids,ll,valid_daterange',
-                                                  slat=slat,nlat=nlat,wlon=wlon,elon=elon)
+                                                  slat=slat,nlat=nlat,wlon=wlon,elon=elon,source=meta_source)
+
+    # Leave out stations that cannot contribute before any data request
+    metadata = stnmeta.filter_metadata(metadata=metadata, min_days=min_days, overlap=overlap,
+                                       sids_types=sids_types, print_results=print_results)
 
     #-------------------------------------------------------------------------------------------------
     # Assess size of data query, continue if less than maximum allowable number of stations
     #-------------------------------------------------------------------------------------------------
 
-    if len(metadata) < stn_size: 
+    # Daily values within the periods of record of all stations, the size of the query once it is
+    # split into requests by 'target_days'
+    ndays = int(((pd.to_datetime(metadata['edate']) - pd.to_datetime(metadata['sdate'])).dt.days + 1).sum())
+
+    if (target_days is None and len(metadata) < stn_size) or (target_days is not None and ndays <= max_days):
 
        #-------------------------------------------------------------------------------------------------
        # Define range of dates from earliest to latest station dates available based on metadata 
@@ -333,48 +1016,30 @@ def bbox_multistn_daily(elem: str, slat: float, nlat: float, wlon: float, elon:
                              str(max(pd.to_datetime(metadata['edate'])).date()), # latest date 
                                                                        freq='d') # daily frequency
    
+       # Use metadata to read in all stations concurrently, results are kept in metadata order
+       if query_mode == 'multistndata' or target_days is not None:
+        all_values, failed = stndata.multistn_fetch_batched(elem=elem, metadata=metadata, chunk_size=chunk_size,
+                                                            max_workers=max_workers, on_error=on_error,
+                                                            target_days=target_days,
+                                                            M=M, T=T, mdr=mdr, mdr_opt=mdr_opt,
+                                                            mdr_A=mdr_A, mdr_S=mdr_S, use_cache=use_cache,
+                                                            print_results=print_results, print_md=print_md)
+       else:
+        all_values, failed = stndata.multistn_fetch(elem=elem, metadata=metadata, max_workers=max_workers, on_error=on_error,
+                                                    M=M, T=T, mdr=mdr, mdr_opt=mdr_opt,
+                                                    mdr_A=mdr_A, mdr_S=mdr_S, use_cache=use_cache,
+                                                    print_results=print_results, print_md=print_md)
+   
        #-------------------------------------------------------------------------------------------------
-       # Define Pandas DataFrame from sdate to edate that will be filled with station data in a loop 
+       # Assemble all stations into a single DataFrame with one column per station
        #-------------------------------------------------------------------------------------------------
    
-       STATIONS = pd.DataFrame({'Date': dates})
-   
-       # Add feature here that says if # of stations exceeds a certain value, query is exited and not run
-   
-       # Loop through all stations within bounded box
-       for i in range(len(metadata)):
-   
-        # Show station information if permitted
-        if print_results == True:
-         if i == 0:
-            print(str(elem)+': Reading in '+str(len(metadata))+' total stations (station id: name, state) ...')
-         print('#'+str(i+1)+'. '+metadata['sids'][i]+': '+metadata['name'][i]+', '+metadata['state'][i])
-   
-        # Use metadata to read in each station individually
-        station_values = stndata.singlestn_daily(elem=elem, sid=metadata['sids'][i], 
-                                                 sdate=metadata['sdate'][i], edate=metadata['edate'][i], 
-                                                 M=M, T=T, mdr=mdr, mdr_opt=mdr_opt, 
-                                                 mdr_A=mdr_A, mdr_S=mdr_S, 
-                                                 print_results=print_results, print_md=print_md        )
-   
-        #-------------------------------------------------------------------------------------------------
-        # Append data to STATIONS DataFrame based on corresponding dates, make all else equal to NaN 
-        #-------------------------------------------------------------------------------------------------
-   
-        # Ignore unnecessary Pandas warnings
-        pd.options.mode.chained_assignment = None
-        simplefilter(action="ignore", category=pd.errors.PerformanceWarning)
-   
-        # Make new column in STATIONS for new station and set all values to NaN first 
-        STATIONS[str(metadata['sids'][i]+': '+metadata['name'][i]+', '+metadata['state'][i])] = float('NaN')
-   
-        # Define start and end date indices for each Station ID to insert data based on appropriate dates
-        sdate_ind = STATIONS['Date'].index[STATIONS['Date'] == metadata['sdate'][i]][0]
-        edate_ind = STATIONS['Date'].index[STATIONS['Date'] == metadata['edate'][i]][0]
-   
-        # Fill data between start and end dates in corresponding column in STATIONS DataFrame
-        STATIONS[str(metadata['sids'][i]+': '+metadata['name'][i]+', '+metadata['state'][i])].iloc[
-                                                                  sdate_ind:edate_ind+1] = station_values
+       # Station segments keep each station's values within its valid date range only
+       if sparse == True:
+        matrix = stnmatrix.StationSegments.from_stations(metadata=metadata, station_values=all_values, dates=dates)
+       else:
+        matrix = stnmatrix.StationMatrix.from_stations(metadata=metadata, station_values=all_values, dates=dates)
+       STATIONS = None if sparse == True else matrix.frame() if as_matrix == True else matrix.to_frame()
    
        #--------------------------------------------------------------------------------------------------
        # Save stations and metadata to Excel
@@ -392,8 +1057,8 @@ def bbox_multistn_daily(elem: str, slat: float, nlat: float, wlon: float, elon:
         if stn_excel == True:
    
          # Set new dataframe from STATIONS, make dates dtype=string so they show up in Excel
-         df = STATIONS
-         df['Date'] = pd.DataFrame(STATIONS['Date'],dtype='string')
+         df = matrix.to_frame() if sparse == True else STATIONS
+         df['Date'] = pd.DataFrame(df['Date'],dtype='string')
    
          # Output dataframe to Excel as sheet name 'stations'
          df.to_excel(w,sheet_name='stations',index=False)
@@ -411,17 +1076,425 @@ def bbox_multistn_daily(elem: str, slat: float, nlat: float, wlon: float, elon:
         w.save()
    
        #--------------------------------------------------------------------------------------------------
-       # Return Pandas DataFrame 
+       # Return Pandas DataFrame, listing stations that could not be queried
        #--------------------------------------------------------------------------------------------------
-   
-       return STATIONS, metadata
 
-    else:
+       metadata.attrs['failed_sids'] = matrix.attrs['failed_sids'] = failed
+       if STATIONS is not None:
+        STATIONS.attrs['failed_sids'] = failed
+
+       return (matrix if as_matrix == True or sparse == True else STATIONS), metadata
+
+    elif target_days is None:
 
        print(f'ERROR: Bounding box has more than maximum ({stn_size}) number of queried stations. '+
               'Choose smaller bounding box.')
        raise SystemExit()
 
+    else:
+
+       print(f'ERROR: Bounding box has more than maximum ({max_days}) number of daily values. '+
+              'Choose smaller bounding box.')
+       raise SystemExit()
+
+#======================================================================================================
+# Query daily data of several elements from multiple stations from NOAA ACIS within a specified bounding
+# box at once, return one station DataFrame and metadata per element
+#======================================================================================================
+
+def bbox_multielem_daily(elems: tuple, slat: float, nlat: float, wlon: float, elon: float,
+
+                         # Optional parameters for size of data query
+                         stn_size: int = 1000, target_days: int = None, max_days: int = 100000000,
+
+                         # Optional parameters for concurrent data query
+                         max_workers: int = 8, chunk_size: int = 50, on_error: str = 'skip',
+
+                         # Optional parameters for all elems
+                         M: float = float('NaN'),
+
+                         # Optional parameters for elems 'pcpn', 'snow', and 'snwd'
+                         T: float = 0.00001, mdr: int = 50, mdr_opt: str = 'avg',
+                         mdr_A: str = 'equal', mdr_S: str = '0',
+
+                         # Optional parameters for printing results
+                         print_results: bool = True, print_md: bool = True,
+
+                         # Optional parameters for on-disk cache
+                         use_cache: bool = False,
+
+                         # Optional parameters for station metadata
+                         meta_source: str = 'live',
+
+                         # Optional parameters for station prefilter
+                         min_days: int = None, overlap: tuple = None, sids_types: tuple = None,
+
+                         # Optional parameters for output format
+                         as_matrix: bool = False, sparse: bool = False,
+
+                         # Optional parameters for background queries
+                         progress = None, cancel: threading.Event = None
+
+                         ):
+
+    '''
+    Queries several elements within a bounded box at once. The metadata of each element is queried as
+    in bbox_multistn_daily(), then every station is queried once for all of its elements with chunked
+    MultiStnData requests (see multielem_fetch_batched()), instead of once per element. Each element
+    gets the same output as bbox_multistn_daily() with query_mode = 'multistndata', its dates being the
+    part of the daily date axis shared by all elements that covers its own stations.
+
+    Required Parameters
+    --------------------
+    elems
+     class: 'tuple', Elements to include. Example: ('maxt','mint','pcpn','snow')
+                     Possible options are 'maxt','mint','avgt','pcpn','snow','snwd'.
+
+    slat, nlat, wlon, elon
+     class: 'float', Bounding latitude and longitude coordinates. See bbox_multistn_daily().
+
+    Optional parameters
+    ---------------------
+    See bbox_multistn_daily(). 'stn_size' applies to each element, and 'target_days' and 'max_days'
+    count the daily values of all elements of a station. See multielem_fetch_batched() for
+    'progress' and 'cancel', the metadata of elements not yet queried when 'cancel' is set is skipped.
+
+    Returns
+    ---------------------
+    output: class: 'dict', Station data and metadata of each element as returned by bbox_multistn_daily(),
+                           as a (data, metadata) tuple. Elements without stations in the bounding box
+                           are left out.
+    '''
+
+    #-------------------------------------------------------------------------------------------------
+    # Use metadata of each element to find all station IDs within bounded box
+    #-------------------------------------------------------------------------------------------------
+
+    metadata = {}
+    for elem in elems:
+     if cancel is not None and cancel.is_set():
+      break
+     meta = stnmeta.bbox_metadata(elem=elem,items='name,state,sids,ll,valid_daterange',
+                                  slat=slat,nlat=nlat,wlon=wlon,elon=elon,source=meta_source)
+     # Elements without stations, or without stations left after the prefilter, are left out
+     try:
+      meta = stnmeta.filter_metadata(metadata=meta, min_days=min_days, overlap=overlap,
+                                     sids_types=sids_types, print_results=print_results)
+     except ValueError:
+      continue
+     if isinstance(meta,pd.DataFrame):
+      metadata[elem] = meta
+
+    #-------------------------------------------------------------------------------------------------
+    # Assess size of data query, continue if less than maximum allowable number of stations
+    #-------------------------------------------------------------------------------------------------
+
+    if target_days is None and any(len(meta) >= stn_size for meta in metadata.values()):
+     print(f'ERROR: Bounding box has more than maximum ({stn_size}) number of queried stations. '+
+            'Choose smaller bounding box.')
+     raise SystemExit()
+
+    # Daily values within the periods of record of all stations and elements
+    ndays = sum(int(((pd.to_datetime(meta['edate']) - pd.to_datetime(meta['sdate'])).dt.days + 1).sum())
+                for meta in metadata.values())
+
+    if target_days is not None and ndays > max_days:
+     print(f'ERROR: Bounding box has more than maximum ({max_days}) number of daily values. '+
+            'Choose smaller bounding box.')
+     raise SystemExit()
+
+    #-------------------------------------------------------------------------------------------------
+    # Read in all elements of all stations concurrently, results are kept in metadata order
+    #-------------------------------------------------------------------------------------------------
+
+    queried = list(metadata)
+    all_values = stndata.multielem_fetch_batched(elems=tuple(queried), metadata=metadata,
+                                                 chunk_size=chunk_size, max_workers=max_workers,
+                                                 on_error=on_error, target_days=target_days,
+                                                 M=M, T=T, mdr=mdr, mdr_opt=mdr_opt,
+                                                 mdr_A=mdr_A, mdr_S=mdr_S, use_cache=use_cache,
+                                                 print_results=print_results, print_md=print_md,
+                                                 progress=progress, cancel=cancel) \
+                 if len(queried) > 0 else {}
+
+    #-------------------------------------------------------------------------------------------------
+    # Assemble stations of each element on the shared range of dates
+    #-------------------------------------------------------------------------------------------------
+
+    if len(queried) > 0:
+     dates = pd.date_range(str(min(pd.to_datetime(metadata[elem]['sdate']).min() for elem in queried).date()),
+                           str(max(pd.to_datetime(metadata[elem]['edate']).max() for elem in queried).date()),
+                           freq='d')
+
+    results = {}
+    for elem in queried:
+     meta = metadata[elem]
+     station_values, failed = all_values[elem]
+     # Dates from earliest to latest station dates of this element
+     first = dates.searchsorted(min(pd.to_datetime(meta['sdate'])))
+     last = dates.searchsorted(max(pd.to_datetime(meta['edate'])))
+     if sparse == True:
+      matrix = stnmatrix.StationSegments.from_stations(metadata=meta, station_values=station_values,
+                                                       dates=dates[first:last+1])
+     else:
+      matrix = stnmatrix.StationMatrix.from_stations(metadata=meta, station_values=station_values,
+                                                     dates=dates[first:last+1])
+     STATIONS = None if sparse == True else matrix.frame() if as_matrix == True else matrix.to_frame()
+     # List stations that could not be queried
+     meta.attrs['failed_sids'] = matrix.attrs['failed_sids'] = failed
+     if STATIONS is not None:
+      STATIONS.attrs['failed_sids'] = failed
+     results[elem] = ((matrix if as_matrix == True or sparse == True else STATIONS), meta)
+
+    return results
+
+#======================================================================================================
+# Query monthly values reduced by NOAA ACIS from every station listed in a metadata DataFrame with
+# chunked MultiStnData requests, return arrays over all months in the same order as the metadata rows
+#======================================================================================================
+
+def multistn_fetch_monthly(elem: str, metadata: pd.DataFrame, months: pd.DatetimeIndex, how: str = 'max',
+
+                           # Optional parameters for batched data query
+                           chunk_size: int = 50, max_workers: int = 4, on_error: str = 'skip',
+
+                           # Optional parameters for all elems
+                           M: float = float('NaN'),
+
+                           # Optional parameters for elems 'pcpn', 'snow', and 'snwd'
+                           T: float = 0.00001,
+
+                           # Optional parameters for printing results
+                           print_results: bool = True
+
+                           ):
+
+    '''
+    Queries the monthly maximum, minimum, sum or mean of the daily values of every station in a
+    metadata DataFrame, computed by NOAA ACIS ('reduce' over a monthly 'interval'), along with the
+    number of days with data in each month. One value per month is returned instead of one per day,
+    and no daily values are processed. Stations are queried in MultiStnData requests of up to
+    'chunk_size' stations, as in multistn_fetch_batched().
+
+    NOTE: NOAA ACIS reduces the daily values as reported, a multi-day total ('A') counts as the value
+    of a single day instead of being spread over the days of the event with 'mdr_opt' as in
+    singlestn_decode(). Months whose reduced value is flagged 'A' are therefore set to 'M', so the
+    monthly values of 'pcpn', 'snow' and 'snwd' never hold a multi-day total. Months with multi-day
+    events whose reduced value is a single day can still differ from reducing the daily values of
+    bbox_multistn_daily(), which spreads the event total over its days.
+
+    Required Parameters
+    --------------------
+    elem
+     class: 'string', Single variable element to include. Example: 'maxt'
+
+    metadata
+     class: 'pandas.DataFrame', Metadata for all stations to query. Must include 'sids', 'name' and
+                                'state' columns.
+
+    months
+     class: 'pandas.DatetimeIndex', First day of every month to return.
+
+    how                Default = 'max'
+     class: 'string', Reduction of the daily values of each month, 'max', 'min', 'sum' or 'mean'.
+
+    Optional parameters for batched data query
+    -------------------------------------------
+    See multistn_fetch_batched().
+
+    Optional parameters for all elems and for elems 'pcpn', 'snow', and 'snwd'
+    ---------------------------------------------------------------------------
+    M, T
+     class: 'float', Values to which months without data ('M') and trace months ('T') are converted.
+
+    Returns
+    ---------------------
+    output: class: 'list', 'list', 'list'
+            Lists of 'numpy.ndarray' with the monthly values (float32) and days with data (integer) of
+            each station over all 'months', in the same order as the rows of 'metadata', and list of
+            station ids (sids) that could not be queried. Stations that could not be queried are NaN,
+            stations missing from the response of a request are 'M' in every month.
+    '''
+
+    #-------------------------------------------------------------------------------------------------
+    # Split the stations into chunks of at most 'chunk_size' stations
+    #-------------------------------------------------------------------------------------------------
+
+    sids = list(dict.fromkeys(metadata['sids']))
+    chunk_size = max(1,int(chunk_size))
+    chunks = [sids[c:c+chunk_size] for c in range(0,len(sids),chunk_size)]
+
+    if print_results == True and len(metadata) > 0:
+     print(str(elem)+': Reading in monthly '+how+' of '+str(len(metadata))+' total stations in '+
+           str(len(chunks))+' MultiStnData requests ...')
+
+    # Reduced element, months with any number of missing days are still reduced
+    elems = [{'name': elem, 'interval': 'mly', 'duration': 'mly', 'maxmissing': 31,
+              'reduce': {'reduce': how, 'add': 'mcnt'}}]
+    days_in_month = np.asarray(months.days_in_month,dtype=np.int64)
+
+    # Monthly values and days with data of each station id, and station ids of requests answered
+    response, answered = {}, set()
+
+    #-------------------------------------------------------------------------------------------------
+    # Query one chunk and keep the monthly values and days with data of its stations
+    #-------------------------------------------------------------------------------------------------
+
+    def query_chunk(chunk):
+
+     # Input dictionary of station ids, reduced element, start month, and end month
+     input_dict = {'sids': ','.join(chunk),'elems': elems,'meta': 'sids',
+                   'sdate': months[0].strftime('%Y-%m'),'edate': months[-1].strftime('%Y-%m')}
+
+     # Get json data from url
+     raw = transport.acis_request('MultiStnData',input_dict)
+
+     for stn in raw['data']:
+      # Each month holds the reduced value and the number of missing days
+      reduced = stream.encode_values([month[0][0] for month in stn['data']])
+      mcnt = np.array([month[0][1] for month in stn['data']],dtype=np.int64)
+      # Multi-day totals ('A') are not the value of a single day and are set to M
+      values = np.where(reduced['flag'] == stream.FLAG_VALUE,reduced['value'],M)
+      values[reduced['flag'] == stream.FLAG_T] = T
+      counts = np.maximum(0,days_in_month[:len(mcnt)] - mcnt)
+      for stn_sid in stn['meta']['sids']:
+       response[stn_sid.split(' ')[0]] = (values.astype(np.float32), counts)
+     answered.update(chunk)
+
+    # Query stations of a failed chunk one by one, stations that still fail are left out
+    def query_chunk_isolated(chunk):
+     try:
+      query_chunk(chunk)
+     except Exception as error:
+      if on_error == 'raise':
+       raise
+      print('ERROR: MultiStnData request failed ('+str(error)+'), querying its stations one by one')
+      for sid in chunk:
+       try:
+        query_chunk([sid])
+       except Exception as error:
+        print('ERROR: '+sid+' could not be queried ('+str(error)+'), values set to NaN')
+
+    with ThreadPoolExecutor(max_workers=max(1,int(max_workers))) as executor:
+     list(executor.map(query_chunk_isolated, chunks))
+
+    #-------------------------------------------------------------------------------------------------
+    # Values and days with data of each station in metadata order, failed stations are set to NaN and
+    # stations missing from an answered request to M
+    #-------------------------------------------------------------------------------------------------
+
+    station_values, station_counts, failed = [], [], []
+    for i in range(len(metadata)):
+     if metadata['sids'][i] not in response:
+      station_values.append(np.full(len(months),M if metadata['sids'][i] in answered else np.nan,
+                                    dtype=np.float32))
+      station_counts.append(np.zeros(len(months),dtype=np.int64))
+      if metadata['sids'][i] not in answered:
+       failed.append(metadata['sids'][i])
+      continue
+     values, counts = response[metadata['sids'][i]]
+     station_values.append(values)
+     station_counts.append(counts)
+
+    return station_values, station_counts, failed
+
+#======================================================================================================
+# Query monthly values reduced by NOAA ACIS from multiple stations within a specified bounding box, 
+# return with each station represented by a new column
+#======================================================================================================
+
+def bbox_multistn_monthly(elem: str, slat: float, nlat: float, wlon: float, elon: float, how: str = 'max',
+
+                          # Optional parameters for size of data query
+                          stn_size: int = 1000,
+
+                          # Optional parameters for batched data query
+                          max_workers: int = 8, chunk_size: int = 50, on_error: str = 'skip',
+
+                          # Optional parameters for all elems
+                          M: float = float('NaN'),
+
+                          # Optional parameters for elems 'pcpn', 'snow', and 'snwd'
+                          T: float = 0.00001,
+
+                          # Optional parameters for printing results
+                          print_results: bool = True,
+
+                          # Optional parameters for station metadata
+                          meta_source: str = 'live',
+
+                          # Optional parameters for station prefilter
+                          min_days: int = None, overlap: tuple = None, sids_types: tuple = None
+
+                          ):
+
+    '''
+    Queries the monthly maximum, minimum, sum or mean of every station within a bounded box, reduced
+    from the daily values by NOAA ACIS, along with the days with data in each month (see
+    multistn_fetch_monthly()). Monthly products only need these: the time series plots take the
+    returned 'StationMonthly' in place of the daily data of bbox_multistn_daily() with 'max' or 'min'
+    (Tmax and Tmin 'max'/'min', Rain and Snow 'rx1day') methods, and the payload holds one value per
+    month instead of one per day.
+
+    Required Parameters
+    --------------------
+    elem, slat, nlat, wlon, elon
+     See bbox_multistn_daily().
+
+    how                Default = 'max'
+     class: 'string', Reduction of the daily values of each month, 'max', 'min', 'sum' or 'mean'.
+
+    Optional parameters
+    ---------------------
+    See bbox_multistn_daily() and multistn_fetch_monthly(), and stnmeta.filter_metadata() for the
+    station prefilter.
+
+    Returns
+    ---------------------
+    output: class: 'NOAA_ACIS_stnmatrix.StationMonthly', 'pandas.DataFrame'
+    '''
+
+    #-------------------------------------------------------------------------------------------------
+    # Use metadata to find all station IDs within bounded box
+    #-------------------------------------------------------------------------------------------------
+
+    # Only pull metadata on required parameters
+    metadata = stnmeta.bbox_metadata(elem=elem,items='name,state,sids,ll,valid_daterange',
+                                     slat=slat,nlat=nlat,wlon=wlon,elon=elon,source=meta_source)
+
+    # Leave out stations that cannot contribute before any data request
+    metadata = stnmeta.filter_metadata(metadata=metadata, min_days=min_days, overlap=overlap,
+                                       sids_types=sids_types, print_results=print_results)
+
+    #-------------------------------------------------------------------------------------------------
+    # Assess size of data query, continue if less than maximum allowable number of stations
+    #-------------------------------------------------------------------------------------------------
+
+    if len(metadata) >= stn_size:
+     print(f'ERROR: Bounding box has more than maximum ({stn_size}) number of queried stations. '+
+            'Choose smaller bounding box.')
+     raise SystemExit()
+
+    # Months from earliest to latest station dates available based on metadata
+    months = pd.date_range(pd.to_datetime(metadata['sdate']).min().to_period('M').to_timestamp(),
+                           pd.to_datetime(metadata['edate']).max(),freq='MS')
+
+    # Read in monthly values of all stations, results are kept in metadata order
+    station_values, station_counts, failed = stndata.multistn_fetch_monthly(elem=elem, metadata=metadata,
+                                                                            months=months, how=how,
+                                                                            chunk_size=chunk_size,
+                                                                            max_workers=max_workers,
+                                                                            on_error=on_error, M=M, T=T,
+                                                                            print_results=print_results)
+
+    monthly = stnmatrix.StationMonthly.from_stations(metadata=metadata, station_values=station_values,
+                                                     station_counts=station_counts, months=months, how=how)
+
+    # List stations that could not be queried
+    metadata.attrs['failed_sids'] = monthly.attrs['failed_sids'] = failed
+
+    return monthly, metadata
+
 #======================================================================================================
 # Query daily data from multiple stations from NOAA ACIS given a list of station ids (sids), return as 
 # Pandas DataFrame with each station represented by a new column      
@@ -429,6 +1502,10 @@ def bbox_multistn_daily(elem: str, slat: float, nlat: float, wlon: float, elon:
 
 def sids_multistn_daily(elem: str, sids: list,
 
+                        # Optional parameters for concurrent data query
+                        max_workers: int = 8, query_mode: str = 'stndata', chunk_size: int = 50,
+                        on_error: str = 'skip',
+
                         # Optional parameters for all elems
                         M: float = float('NaN'),
 
@@ -439,6 +1516,15 @@ def sids_multistn_daily(elem: str, sids: list,
                         # Optional parameters for printing results
                         print_results: bool = True, print_md: bool = True,
 
+                        # Optional parameters for on-disk cache
+                        use_cache: bool = False,
+
+                        # Optional parameters for station metadata
+                        meta_source: str = 'live',
+
+                        # Optional parameters for output format
+                        as_matrix: bool = False, sparse: bool = False,
+
                         # Optional parameters for outputing variables to excel
                         stn_excel: bool = False, meta_excel: bool = False,
                         folderpath: str = ''
@@ -460,6 +1546,27 @@ def sids_multistn_daily(elem: str, sids: list,
      class: 'list', List of station ids (sids) for which to query corresponding data. Each element
                     in the list must be type 'string'.
 
+    Optional parameters for concurrent data query
+    ----------------------------------------------
+    max_workers        Default = 8
+     class: 'integer', Maximum number of station requests sent to NOAA ACIS at the same time. 
+                       Setting this to 1 queries the stations one after another.
+
+    query_mode         Default = 'stndata'
+     class: 'string', 'stndata' sends one StnData request per station. 'multistndata' sends chunked
+                      MultiStnData requests with up to 'chunk_size' stations each, which cuts the 
+                      number of round trips from one per station to a handful.
+
+    chunk_size         Default = 50
+     class: 'integer', Maximum number of stations per MultiStnData request if 
+                       query_mode = 'multistndata'.
+
+    on_error           Default = 'skip'
+     class: 'string', 'skip' sets all values of a station to NaN and continues with the remaining 
+                      stations if the station cannot be queried once all retries have failed. The
+                      station ids (sids) of such stations are listed in attrs['failed_sids'] of both
+                      returned DataFrames. 'raise' stops the query with the error.
+
     Optional parameters for all elems
     ----------------------------------
     M                Default = float('NaN')
@@ -499,6 +1606,34 @@ def sids_multistn_daily(elem: str, sids: list,
     print_md        Default = True
      class: 'bool', Print information about multi-day event processing if found while querying data.
 
+    Optional parameters for on-disk cache
+    -------------------------------------
+    use_cache       Default = False
+     class: 'bool', If True, raw daily values are read from the on-disk cache in 'NOAA_ACIS_cache.py' 
+                    and only the days that are not cached yet are queried from NOAA ACIS.
+
+    Optional parameters for station metadata
+    ----------------------------------------
+    meta_source     Default = 'live'
+     class: 'string', Where station metadata is read from. 'live' queries NOAA ACIS StnMeta, 'catalog'
+                      reads the local station catalog in 'NOAA_ACIS_catalog.py' without any request,
+                      and 'auto' reads the catalog while it is recent and only queries NOAA ACIS for
+                      stations whose period of record may have grown since. See bbox_metadata().
+
+    Optional parameters for output format
+    -------------------------------------
+    as_matrix       Default = False
+     class: 'bool', If True, station data is returned as a 'StationMatrix' (see 'NOAA_ACIS_stnmatrix.py')
+                    holding float32 values, instead of a float64 DataFrame. Its frame() method returns
+                    a DataFrame with the same layout that shares memory with the matrix.
+
+    sparse          Default = False
+     class: 'bool', If True, station data is returned as 'StationSegments' (see 'NOAA_ACIS_stnmatrix.py')
+                    holding the float32 values of each station only within its valid date range, one
+                    station after another. No array over all dates and stations is allocated, which
+                    saves most of the memory if stations have disjoint periods of record. The
+                    processing functions and plots accept it in place of a DataFrame.
+
     Optional parameters for outputing variables to excel
     ----------------------------------------------------
     stn_excel       Default = False
@@ -519,7 +1654,8 @@ def sids_multistn_daily(elem: str, sids: list,
 
     Returns
     ---------------------
-    output: class: 'pandas.DataFrame'
+    output: class: 'pandas.DataFrame', or 'NOAA_ACIS_stnmatrix.StationMatrix' if as_matrix = True, or
+                   'NOAA_ACIS_stnmatrix.StationSegments' if sparse = True
     '''
 
     #-------------------------------------------------------------------------------------------------
@@ -530,7 +1666,8 @@ def sids_multistn_daily(elem: str, sids: list,
     sids = [sids] if type(sids) == str else sids
 
     # Only pull metadata on required parameters
-    metadata = stnmeta.sids_metadata(elem=elem,items='name,state,sids,ll,valid_daterange',sids=sids)
+    metadata = stnmeta.sids_metadata(elem=elem,items='name,state,sids,ll,valid_daterange',sids=sids,
+                                     source=meta_source)
 
     #-------------------------------------------------------------------------------------------------
     # Define range of dates from earliest to latest station dates available based on metadata 
@@ -540,46 +1677,29 @@ def sids_multistn_daily(elem: str, sids: list,
                           str(max(pd.to_datetime(metadata['edate'])).date()), # latest date 
                                                                     freq='d') # daily frequency
 
+    # Use metadata to read in all stations concurrently, results are kept in metadata order
+    if query_mode == 'multistndata':
+     all_values, failed = stndata.multistn_fetch_batched(elem=elem, metadata=metadata, chunk_size=chunk_size,
+                                                         max_workers=max_workers, on_error=on_error,
+                                                         M=M, T=T, mdr=mdr, mdr_opt=mdr_opt,
+                                                         mdr_A=mdr_A, mdr_S=mdr_S, use_cache=use_cache,
+                                                         print_results=print_results, print_md=print_md)
+    else:
+     all_values, failed = stndata.multistn_fetch(elem=elem, metadata=metadata, max_workers=max_workers, on_error=on_error,
+                                                 M=M, T=T, mdr=mdr, mdr_opt=mdr_opt,
+                                                 mdr_A=mdr_A, mdr_S=mdr_S, use_cache=use_cache,
+                                                 print_results=print_results, print_md=print_md)
+
     #-------------------------------------------------------------------------------------------------
-    # Define Pandas DataFrame from sdate to edate that will be filled with station data in a loop 
+    # Assemble all stations into a single DataFrame with one column per station
     #-------------------------------------------------------------------------------------------------
 
-    STATIONS = pd.DataFrame({'Date': dates})
-
-    # Loop through all stations within bounded box
-    for i in range(len(metadata)):
-
-     # Show station information if permitted
-     if print_results == True:
-      if i == 0:
-         print(str(elem)+': Reading in '+str(len(metadata))+' total stations (station id: name, state) ...')
-      print('#'+str(i+1)+'. '+metadata['sids'][i]+': '+metadata['name'][i]+', '+metadata['state'][i])
-
-     # Use metadata to read in each station individually
-     station_values = stndata.singlestn_daily(elem=elem, sid=metadata['sids'][i],
-                                              sdate=metadata['sdate'][i], edate=metadata['edate'][i],
-                                              M=M, T=T, mdr=mdr, mdr_opt=mdr_opt,
-                                              mdr_A=mdr_A, mdr_S=mdr_S,
-                                              print_results=print_results, print_md=print_md        )
-
-     #-------------------------------------------------------------------------------------------------
-     # Append data to STATIONS DataFrame based on corresponding dates, make all else equal to NaN 
-     #-------------------------------------------------------------------------------------------------
-
-     # Ignore unnecessary Pandas warnings
-     pd.options.mode.chained_assignment = None
-     simplefilter(action="ignore", category=pd.errors.PerformanceWarning)
-
-     # Make new column in STATIONS for new station and set all values to NaN first 
-     STATIONS[str(metadata['sids'][i]+': '+metadata['name'][i]+', '+metadata['state'][i])] = float('NaN')
-
-     # Define start and end date indices for each Station ID to insert data based on appropriate dates
-     sdate_ind = STATIONS['Date'].index[STATIONS['Date'] == metadata['sdate'][i]][0]
-     edate_ind = STATIONS['Date'].index[STATIONS['Date'] == metadata['edate'][i]][0]
-
-     # Fill data between start and end dates in corresponding column in STATIONS DataFrame
-     STATIONS[str(metadata['sids'][i]+': '+metadata['name'][i]+', '+metadata['state'][i])].iloc[
-                                                               sdate_ind:edate_ind+1] = station_values
+    # Station segments keep each station's values within its valid date range only
+    if sparse == True:
+     matrix = stnmatrix.StationSegments.from_stations(metadata=metadata, station_values=all_values, dates=dates)
+    else:
+     matrix = stnmatrix.StationMatrix.from_stations(metadata=metadata, station_values=all_values, dates=dates)
+    STATIONS = None if sparse == True else matrix.frame() if as_matrix == True else matrix.to_frame()
 
     #--------------------------------------------------------------------------------------------------
     # Save stations and metadata to Excel
@@ -597,8 +1717,8 @@ def sids_multistn_daily(elem: str, sids: list,
      if stn_excel == True:
 
       # Set new dataframe from STATIONS, make dates dtype=string so they show up in Excel
-      df = STATIONS
-      df['Date'] = pd.DataFrame(STATIONS['Date'],dtype='string')
+      df = matrix.to_frame() if sparse == True else STATIONS
+      df['Date'] = pd.DataFrame(df['Date'],dtype='string')
 
       # Output dataframe to Excel as sheet name 'stations'
       df.to_excel(w,sheet_name='stations',index=False)
@@ -616,10 +1736,209 @@ def sids_multistn_daily(elem: str, sids: list,
      w.save()
 
     #--------------------------------------------------------------------------------------------------
-    # Return Pandas DataFrame 
+    # Return Pandas DataFrame, listing stations that could not be queried
+    #--------------------------------------------------------------------------------------------------
+
+    metadata.attrs['failed_sids'] = matrix.attrs['failed_sids'] = failed
+    if STATIONS is not None:
+     STATIONS.attrs['failed_sids'] = failed
+
+    return (matrix if as_matrix == True or sparse == True else STATIONS), metadata
+
+#======================================================================================================
+# Refresh an already queried bounding box with the latest NOAA ACIS data, querying only the days after 
+# the last day of each station and the full record of stations that are new to the bounding box
+#======================================================================================================
+
+def bbox_multistn_refresh(elem: str, stndata_df: pd.DataFrame, stnmeta_df: pd.DataFrame,
+                          slat: float, nlat: float, wlon: float, elon: float,
+
+                          # Optional parameters for concurrent data query
+                          max_workers: int = 8, query_mode: str = 'stndata', chunk_size: int = 50,
+                          on_error: str = 'skip',
+
+                          # Optional parameters for all elems
+                          M: float = float('NaN'),
+
+                          # Optional parameters for elems 'pcpn', 'snow', and 'snwd'
+                          T: float = 0.00001, mdr: int = 50, mdr_opt: str = 'avg',
+                          mdr_A: str = 'equal', mdr_S: str = '0',
+
+                          # Optional parameters for printing results
+                          print_results: bool = True, print_md: bool = True,
+
+                          # Optional parameters for on-disk cache
+                          use_cache: bool = False,
+
+                          # Optional parameters for station metadata
+                          meta_source: str = 'live',
+
+                          # Optional parameters for station prefilter
+                          min_days: int = None, overlap: tuple = None, sids_types: tuple = None
+
+                          ):
+
+    '''
+    Brings the output of bbox_multistn_daily() up to date without querying the entire observational
+    record again. Metadata for the bounding box is queried again and compared with 'stnmeta_df':
+    stations already in 'stndata_df' are only queried for the days after their previous 'edate' and
+    stations that are new to the bounding box are queried for their full record and added as new 
+    columns. For elems 'pcpn', 'snow', and 'snwd', the last 'mdr' days of each station are replaced so
+    multi-day events that were still open at the previous 'edate' are processed in full. These days are
+    decoded from a query starting 'mdr' days earlier still, so an event that starts before them and
+    ends within them is averaged over all of its days, as in a query of the entire record.
+    Stations that are no longer returned for the bounding box are kept unchanged.
+
+    Required Parameters
+    --------------------
+    elem
+     class: 'string', Single variable element to include. Example: 'maxt'
+                      Possible options are 'maxt','mint','avgt','pcpn','snow','snwd'.
+
+    stndata_df
+     class: 'pandas.DataFrame', DataFrame containing all daily data with each column representing
+                                each station. Left-most column should be 'Date'. Produce this 
+                                DataFrame with i.e., bbox_multistn_daily(). 
+
+    stnmeta_df
+     class: 'pandas.DataFrame', DataFrame containing metadata for all stations contained within
+                                stndata_df, in the same order as its columns. Produce this DataFrame
+                                with i.e., bbox_multistn_daily(). 
+
+    slat, nlat, wlon, elon
+     class: 'float', Bounding latitude and longitude coordinates used for 'stndata_df'.
+
+    Optional parameters for concurrent data query, for all elems, for elems 'pcpn', 'snow', and 'snwd', 
+    for printing results, for on-disk cache, for station metadata, and for station prefilter
+    --------------------------------------------------------------------------------------------------
+    See bbox_multistn_daily(). Pass the same prefilter parameters as for 'stndata_df', otherwise the
+    stations the prefilter left out are added as new stations and queried for their full record.
+
+    Returns
+    ---------------------
+    output: class: 'pandas.DataFrame', 'pandas.DataFrame'
+            Refreshed station data and metadata, with the same layout as bbox_multistn_daily().
+    '''
+
+    #-------------------------------------------------------------------------------------------------
+    # Use latest metadata to find updated and new stations within bounded box
+    #-------------------------------------------------------------------------------------------------
+
+    metadata = stnmeta.bbox_metadata(elem=elem,items='name,state,sids,ll,valid_daterange',
+                                     slat=slat,nlat=nlat,wlon=wlon,elon=elon,source=meta_source)
+
+    # Leave out the stations the prefilter of 'stndata_df' left out, if none are left nothing is queried
+    try:
+     metadata = stnmeta.filter_metadata(metadata=metadata, min_days=min_days, overlap=overlap,
+                                        sids_types=sids_types, print_results=print_results)
+    except ValueError:
+     metadata = metadata.iloc[0:0].reset_index(drop=True)
+
+    # Row of each previously queried station in stnmeta_df
+    old_rows = {sid: i for i, sid in enumerate(stnmeta_df['sids'])}
+
+    # Number of days replaced for open multi-day events. Events ending within these days start at most
+    # 'mdr' days earlier, so they are decoded from a query starting twice as many days back
+    redo_days = mdr if elem == 'pcpn' or elem == 'snow' or elem == 'snwd' else 0
+
+    # Find dates to query and dates to replace for every station, skip stations without new days
+    fetch_rows, fetch_sdates, write_sdates = [], [], []
+    for i in range(len(metadata)):
+     sid = metadata['sids'][i]
+     if sid in old_rows:
+      old_edate = pd.Timestamp(stnmeta_df['edate'][old_rows[sid]])
+      if pd.Timestamp(metadata['edate'][i]) <= old_edate:
+       continue
+      old_sdate = pd.Timestamp(stnmeta_df['sdate'][old_rows[sid]])
+      write_sdate = max(old_sdate, old_edate + pd.Timedelta(days=1-redo_days))
+      fetch_sdate = max(old_sdate, old_edate + pd.Timedelta(days=1-2*redo_days))
+     else:
+      fetch_sdate = write_sdate = pd.Timestamp(metadata['sdate'][i])
+     fetch_rows.append(i)
+     fetch_sdates.append(str(fetch_sdate.date()))
+     write_sdates.append(write_sdate)
+
+    fetch_meta = metadata.iloc[fetch_rows].reset_index(drop=True)
+    fetch_meta['sdate'] = pd.Series(fetch_sdates,dtype='string')
+
+    if print_results == True:
+     n_new = sum(metadata['sids'][i] not in old_rows for i in fetch_rows)
+     print(str(elem)+': Refreshing '+str(len(fetch_rows)-n_new)+' stations and adding '+str(n_new)+
+           ' new stations ...')
+
+    #-------------------------------------------------------------------------------------------------
+    # Query only the new days of each station
+    #-------------------------------------------------------------------------------------------------
+
+    if query_mode == 'multistndata':
+     all_values, failed = stndata.multistn_fetch_batched(elem=elem, metadata=fetch_meta, chunk_size=chunk_size,
+                                                         max_workers=max_workers, on_error=on_error,
+                                                         M=M, T=T, mdr=mdr, mdr_opt=mdr_opt,
+                                                         mdr_A=mdr_A, mdr_S=mdr_S, use_cache=use_cache,
+                                                         print_results=print_results, print_md=print_md)
+    else:
+     all_values, failed = stndata.multistn_fetch(elem=elem, metadata=fetch_meta, max_workers=max_workers, on_error=on_error,
+                                                 M=M, T=T, mdr=mdr, mdr_opt=mdr_opt,
+                                                 mdr_A=mdr_A, mdr_S=mdr_S, use_cache=use_cache,
+                                                 print_results=print_results, print_md=print_md)
+
+    #-------------------------------------------------------------------------------------------------
+    # Merge metadata: update previously queried stations in place and append new stations
+    #-------------------------------------------------------------------------------------------------
+
+    # Stations that could not be queried keep their previous metadata, or are not added if they are new,
+    # so their missing days are queried again by the next refresh
+    new_meta = stnmeta_df.copy()
+    new_rows = []
+    for i in fetch_rows:
+     sid = metadata['sids'][i]
+     if sid in failed:
+      continue
+     if sid in old_rows:
+      new_meta.loc[old_rows[sid], metadata.columns] = metadata.loc[i].values
+     else:
+      new_rows.append(i)
+    new_meta = pd.concat([new_meta, metadata.iloc[new_rows]], ignore_index=True)
+
+    #-------------------------------------------------------------------------------------------------
+    # Merge station data on the extended range of dates
+    #-------------------------------------------------------------------------------------------------
+
+    base_date = min(stndata_df['Date'].iloc[0], min(pd.to_datetime(new_meta['sdate'])))
+    dates = pd.date_range(str(base_date.date()),
+                          str(max(stndata_df['Date'].iloc[-1], max(pd.to_datetime(new_meta['edate']))).date()),
+                          freq='d')
+
+    # Names of new columns follow bbox_multistn_daily()
+    columns = list(stndata_df.columns[1:]) + [str(new_meta['sids'][r]+': '+new_meta['name'][r]+', '+
+                                                  new_meta['state'][r]) for r in range(len(stnmeta_df),
+                                                                                       len(new_meta))]
+    values = np.full((len(dates),len(columns)),np.nan)
+
+    # Copy previously queried data at its offset on the new range of dates
+    offset = (stndata_df['Date'].iloc[0] - base_date).days
+    values[offset:offset+len(stndata_df),:stndata_df.shape[1]-1] = stndata_df.iloc[:,1:].values
+
+    # Insert newly queried days of each station, days queried only to decode multi-day events that
+    # started earlier are left as they were
+    column_of = {sid: c for c, sid in enumerate(new_meta['sids'])}
+    for f in range(len(fetch_meta)):
+     # Keep previously queried data of stations that could not be queried
+     if fetch_meta['sids'][f] in failed:
+      continue
+     skip = (write_sdates[f] - pd.Timestamp(fetch_meta['sdate'][f])).days
+     sdate_ind = (write_sdates[f] - base_date).days
+     values[sdate_ind:sdate_ind+len(all_values[f])-skip,column_of[fetch_meta['sids'][f]]] = all_values[f][skip:]
+
+    STATIONS = pd.concat([pd.DataFrame({'Date': dates}), pd.DataFrame(values,columns=columns)],axis=1)
+
+    #--------------------------------------------------------------------------------------------------
+    # Return Pandas DataFrame, listing stations that could not be queried
     #--------------------------------------------------------------------------------------------------
 
-    return STATIONS, metadata
+    STATIONS.attrs['failed_sids'] = new_meta.attrs['failed_sids'] = failed
+
+    return STATIONS, new_meta
 
 ######################################################################################################
 #
@@ -652,7 +1971,8 @@ def bbox_multistn_dataviz(elem: str, stndata_df: pd.DataFrame, stnmeta_df: pd.Da
     stndata_df
      class: 'pandas.DataFrame', DataFrame containing all daily data with each column representing
                                 each station. Left-most column should be 'Date'. Produce this 
-                                DataFrame with i.e., bbox_multistn_daily(). 
+                                DataFrame with i.e., bbox_multistn_daily(). 'StationSegments' are
+                                also accepted.
 
     stnmeta_df
      class: 'pandas.DataFrame', DataFrame containing metadata for all stations contained within
@@ -726,7 +2046,11 @@ def bbox_multistn_dataviz(elem: str, stndata_df: pd.DataFrame, stnmeta_df: pd.Da
     #--------------------------------------------------------------------------------------------------
 
     for z in range(len(stndata_df.columns)-1):
-        ax1.plot(stndata_df['Date'],stndata_df.iloc[:,z+1],'o',markersize=1,c='k')
+        if isinstance(stndata_df, stnmatrix.StationSegments): # only the dates of the station
+           values, span = stndata_df.segment(z)
+           ax1.plot(stndata_df.dates[span],values,'o',markersize=1,c='k')
+        else:
+           ax1.plot(stndata_df['Date'],stndata_df.iloc[:,z+1],'o',markersize=1,c='k')
 
     # Define y-axis label
     if elem == 'maxt' or elem == 'mint' or elem == 'avgt':
@@ -749,9 +2073,12 @@ def bbox_multistn_dataviz(elem: str, stndata_df: pd.DataFrame, stnmeta_df: pd.Da
     #--------------------------------------------------------------------------------------------------
 
     # Count number of active stations for each day
-    numrecs = np.zeros(len(stndata_df['Date']),dtype=int)
-    for rec in range(len(stndata_df['Date'])):
-        numrecs[rec] = (len(stndata_df.columns)-1) - (np.sum(pd.isnull(stndata_df.iloc[rec,1:])))
+    if isinstance(stndata_df, stnmatrix.StationSegments):
+       numrecs = stndata_df.reduce('count').astype(int)
+    else:
+       numrecs = np.zeros(len(stndata_df['Date']),dtype=int)
+       for rec in range(len(stndata_df['Date'])):
+           numrecs[rec] = (len(stndata_df.columns)-1) - (np.sum(pd.isnull(stndata_df.iloc[rec,1:])))
 
     ax2.plot(stndata_df['Date'],numrecs,'-',c='k',lw=0.5)
     ax2.set_ylabel('Count')
@@ -825,7 +2152,8 @@ def sids_multistn_dataviz(elem: str, stndata_df: pd.DataFrame, stnmeta_df: pd.Da
     stndata_df
      class: 'pandas.DataFrame', DataFrame containing all daily data with each column representing
                                 each station. Left-most column should be 'Date'. Produce this 
-                                DataFrame with i.e., bbox_multistn_daily(). 
+                                DataFrame with i.e., bbox_multistn_daily(). 'StationSegments' are
+                                also accepted.
 
     stnmeta_df
      class: 'pandas.DataFrame', DataFrame containing metadata for all stations contained within
@@ -897,7 +2225,11 @@ def sids_multistn_dataviz(elem: str, stndata_df: pd.DataFrame, stnmeta_df: pd.Da
     #--------------------------------------------------------------------------------------------------
 
     for z in range(len(stndata_df.columns)-1):
-        ax1.plot(stndata_df['Date'],stndata_df.iloc[:,z+1],'o',markersize=1,c='k')
+        if isinstance(stndata_df, stnmatrix.StationSegments): # only the dates of the station
+           values, span = stndata_df.segment(z)
+           ax1.plot(stndata_df.dates[span],values,'o',markersize=1,c='k')
+        else:
+           ax1.plot(stndata_df['Date'],stndata_df.iloc[:,z+1],'o',markersize=1,c='k')
 
     # Define y-axis label
     if elem == 'maxt' or elem == 'mint' or elem == 'avgt':
@@ -919,9 +2251,12 @@ def sids_multistn_dataviz(elem: str, stndata_df: pd.DataFrame, stnmeta_df: pd.Da
     #--------------------------------------------------------------------------------------------------
 
     # Count number of active stations for each day
-    numrecs = np.zeros(len(stndata_df['Date']),dtype=int)
-    for rec in range(len(stndata_df['Date'])):
-        numrecs[rec] = (len(stndata_df.columns)-1) - (np.sum(pd.isnull(stndata_df.iloc[rec,1:])))
+    if isinstance(stndata_df, stnmatrix.StationSegments):
+       numrecs = stndata_df.reduce('count').astype(int)
+    else:
+       numrecs = np.zeros(len(stndata_df['Date']),dtype=int)
+       for rec in range(len(stndata_df['Date'])):
+           numrecs[rec] = (len(stndata_df.columns)-1) - (np.sum(pd.isnull(stndata_df.iloc[rec,1:])))
 
     ax2.plot(stndata_df['Date'],numrecs,'-',c='k',lw=0.5)
     ax2.set_ylabel('Count')
@@ -1054,100 +2389,19 @@ def singlestn_daily_term(elem: str, sid: str, sdate: str, edate: str,
     output: class: 'numpy.ndarray'
     '''
 
-    import urllib.request
-    
     #-------------------------------------------------------------------------------------------------
     # Query raw data from json request    
     #-------------------------------------------------------------------------------------------------
 
-    # Input dictionary of station id, start date, and end date 
-    input_dict = {'sid': sid,'elems': elem,'sdate':sdate,'edate':edate}
-
-    # Get json data from url
-    json_response = urllib.request.urlopen(urllib.request.Request('http://data.rcc-acis.org/StnData',
-                                           urllib.parse.urlencode({'params':json.dumps(input_dict)}
-                                           ).encode('utf-8'),{'Accept':'application/json'})).read()
-    raw = json.loads(json_response)
+    values = stndata.json_req_stndata(elem=elem, sid=sid, sdate=sdate, edate=edate)
 
     #-------------------------------------------------------------------------------------------------
-    # Read in data to pd DataFrame and process missing and trace values
-    #-------------------------------------------------------------------------------------------------
-    
-    # pd.DataFrame named 'Station' contains raw data 
-    Station = pd.DataFrame(raw['data'],columns=['Date',elem])
-    
-    # Set M to specified value 
-    Station[elem] = np.where(Station[elem] == 'M', M, Station[elem])
-
-    #-------------------------------------------------------------------------------------------------
-    # Further processing if elem is 'pcpn' or 'snow' or 'snwd' 
-    #-------------------------------------------------------------------------------------------------
-
-    if elem == 'pcpn' or elem == 'snow' or elem == 'snwd':
-
-     # Set T to specified value
-     Station[elem] = np.where(Station[elem] == 'T', T, Station[elem])
-
-     #-------------------------------------------------------------------------------------------------
-     # Process multi-day events (i.e., when data shows a value like 'S' ... '2.0A') 
-     #-------------------------------------------------------------------------------------------------
-
-     # Process normal multi-day events, where data shows S->A
-
-     for sa in range(len(Station[elem])):
-      if Station[elem].iloc[sa] == 'S':
-       # First, control for multi-day range (mdr) extending beyond bounds of record
-       if (len(Station[elem]) - Station[elem].index[sa]) < mdr:
-        for x in range(len(Station[elem]) - Station[elem].index[sa]):
-         if ('A' in str(Station[elem].iloc[sa+x])) == True:
-          if mdr_opt == 'avg':
-           # Set pcpn/snow values from S->A as average of A value across all relevant days
-           Station[elem].iloc[sa:sa+x+1] = float(Station[elem].iloc[sa+x].replace('A','')) / (x+1)
-          break
-       # Next, calculate all other multi-day range (mdr) events 
-       else:
-        for x in range(mdr):                          # check next n days for the A
-         if ('A' in str(Station[elem].iloc[sa+x])) == True:
-          if mdr_opt == 'avg':
-           # Set pcpn/snow values from S->A as average of A value across all relevant days
-           Station[elem].iloc[sa:sa+x+1] = float(Station[elem].iloc[sa+x].replace('A','')) / (x+1)
-          break
-                         
-     # Process where any 'A' values remain, which means there was no 'S' before  
-
-     if Station[elem].str.contains('A').any() == True:
-      if mdr_A == 'equal':
-         if print_md == True:
-          print(sid+' has standalone A, setting equal to that days value')
-         Aind = Station[elem].index[Station[elem].str.contains('A') == True].values
-         # Manage if the station has more than one of these special data cases
-         if len(Aind) > 0:
-          for Aelem in range(len(Aind)):
-           if print_md == True:
-            Adate = pd.date_range(start=sdate,end=edate,freq='D')[Aind][Aelem].date() # find date of standalone
-            print(str(Adate)+': '+Station[elem][int(Aind[Aelem])]+'->'+\
-                             str(np.float64(Station[elem][int(Aind[Aelem])].replace('A',''))))
-           Station[elem][Aind[Aelem]] = np.float64(Station[elem][Aind[Aelem]].replace('A',''))
-
-     # Process where any 'S' values remain, which means there is no 'A' afterwards 
-
-     if Station[elem].str.contains('S').any() == True:
-      if print_md == True:   
-       print(sid+' has standalone S, setting to 0')
-      Sind = Station[elem].index[Station[elem].str.contains('S') == True].values
-      # Manage if the station has more than one of these special data cases
-      if len(Sind) > 0:
-       for Selem in range(len(Sind)):
-        if print_md == True:
-         Sdate = pd.date_range(start=sdate,end=edate,freq='D')[Sind][Selem].date() # find date of standalone   
-         print(str(Sdate)+': '+Station[elem][int(Sind[Selem])]+'->0')
-        Station[elem][Sind[Selem]] = 0
-
-    #-------------------------------------------------------------------------------------------------
-    # Output final array as a float array
+    # Process missing, trace, and multi-day values and output final array as a float array
     #-------------------------------------------------------------------------------------------------
 
-    return np.float32(Station[elem])
+    return stndata.singlestn_decode(elem=elem, sid=sid, sdate=sdate, edate=edate, values=values,
+                                    M=M, T=T, mdr=mdr, mdr_opt=mdr_opt, mdr_A=mdr_A, mdr_S=mdr_S,
+                                    print_md=print_md)
     
     
     
@@ -0,0 +1,866 @@
+#######################################################################################################
+#
+# Compact float32 containers of daily data from multiple NOAA ACIS stations
+#
+#######################################################################################################
+
+import numpy as np
+import pandas as pd
+
+#######################################################################################################
+#
+# STATION MATRIX
+#
+#######################################################################################################
+
+class StationMatrix:
+
+    '''
+    Daily values of multiple stations held in one float32 array (days x stations). Along with the
+    values it keeps the date axis, the station ids (sids), the row of each station in the metadata
+    DataFrame, and the first and last day of each station's valid date range. DataFrames in the
+    layout of bbox_multistn_daily() ('Date' followed by one column per station) are available as
+    zero-copy views with frame(), or as a float64 copy with to_frame().
+
+    Parameters
+    -------------
+    values
+     class: 'numpy.ndarray', float32 array of shape (days, stations), NaN outside each station's
+                             valid date range.
+
+    dates
+     class: 'pandas.DatetimeIndex', Daily dates of the rows of 'values'.
+
+    sids
+     class: 'list', Station id of each column of 'values'.
+
+    rows
+     class: 'numpy.ndarray', Row (position) of each station in the metadata DataFrame.
+
+    valid
+     class: 'numpy.ndarray', Integer array of shape (stations, 2) with the first and last row of
+                             'values' within each station's valid date range.
+
+    names
+     class: 'list', Column name of each station, 'sid: name, state'.
+    '''
+
+    def __init__(self, values: np.ndarray, dates: pd.DatetimeIndex, sids: list, rows: np.ndarray,
+                 valid: np.ndarray, names: list):
+        self.values, self.dates = values, dates
+        self.sids, self.rows, self.valid, self.names = list(sids), np.asarray(rows), np.asarray(valid), list(names)
+        self.column_of = {sid: c for c, sid in enumerate(self.sids)}
+        self.attrs = {}
+
+    #==================================================================================================
+    # Build a station matrix from the daily values of each station
+    #==================================================================================================
+
+    @classmethod
+    def from_stations(cls, metadata: pd.DataFrame, station_values: list, dates: pd.DatetimeIndex):
+
+        '''
+        Writes the daily values of every station into one preallocated float32 array at offsets
+        computed from the first date. Columns are named 'sid: name, state' as in
+        bbox_multistn_daily(); if two stations share a name the later one replaces the earlier one.
+
+        Parameters
+        -------------
+        metadata
+         class: 'pandas.DataFrame', Metadata of the stations with columns 'sids', 'name', 'state',
+                                    'sdate' and 'edate'.
+
+        station_values
+         class: 'list', List of 'numpy.ndarray' with one array per station, in the same order as the
+                        rows of 'metadata', as returned by multistn_fetch().
+
+        dates
+         class: 'pandas.DatetimeIndex', Daily dates covering the dates of every station.
+
+        Returns
+        ---------------------
+        output: class: 'StationMatrix'
+        '''
+
+        # Column of each station, stations sharing a name share the column of the first one
+        names = [str(metadata['sids'][i]+': '+metadata['name'][i]+', '+metadata['state'][i])
+                 for i in range(len(metadata))]
+        columns = list(dict.fromkeys(names))
+        column_of = {name: c for c, name in enumerate(columns)}
+
+        values = np.full((len(dates),len(columns)),np.nan,dtype=np.float32)
+        rows = np.zeros(len(columns),dtype=int)
+        valid = np.zeros((len(columns),2),dtype=int)
+
+        for i in range(len(metadata)):
+         c = column_of[names[i]]
+         # Start and end date indices of the station, counted in days from the first date
+         sdate_ind = (pd.Timestamp(metadata['sdate'][i]) - dates[0]).days
+         edate_ind = (pd.Timestamp(metadata['edate'][i]) - dates[0]).days
+         values[:,c] = np.nan
+         values[sdate_ind:edate_ind+1,c] = station_values[i]
+         rows[c], valid[c] = i, (sdate_ind, edate_ind)
+
+        return cls(values, dates, [metadata['sids'][r] for r in rows], rows, valid, columns)
+
+    #==================================================================================================
+    # Build a station matrix from a DataFrame in the layout of bbox_multistn_daily()
+    #==================================================================================================
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, metadata: pd.DataFrame):
+
+        '''
+        Converts a DataFrame returned by bbox_multistn_daily() or sids_multistn_daily() and its
+        metadata into a station matrix. Columns are matched to metadata rows by their position.
+
+        Returns
+        ---------------------
+        output: class: 'StationMatrix'
+        '''
+
+        dates = pd.DatetimeIndex(df['Date'])
+        valid = np.array([((pd.Timestamp(metadata['sdate'][r]) - dates[0]).days,
+                           (pd.Timestamp(metadata['edate'][r]) - dates[0]).days)
+                          for r in range(df.shape[1]-1)],dtype=int).reshape(-1,2)
+
+        return cls(np.asarray(df.iloc[:,1:].values,dtype=np.float32), dates,
+                   list(metadata['sids'][:df.shape[1]-1]), np.arange(df.shape[1]-1), valid,
+                   list(df.columns[1:]))
+
+    #==================================================================================================
+    # DataFrame views and copies
+    #==================================================================================================
+
+    def frame(self):
+
+        '''
+        Returns a DataFrame in the layout of bbox_multistn_daily() whose station columns share memory
+        with the float32 values, no values are copied. Changing the DataFrame changes the matrix.
+
+        Returns
+        ---------------------
+        output: class: 'pandas.DataFrame'
+        '''
+
+        df = pd.DataFrame(self.values,columns=self.names,copy=False)
+        df.insert(0,'Date',self.dates)
+        df.attrs.update(self.attrs)
+
+        return df
+
+    def to_frame(self, dtype=np.float64):
+
+        '''
+        Returns a copy of the matrix as a DataFrame in the layout of bbox_multistn_daily(), with the
+        station columns converted to 'dtype'. Default is float64 as returned by earlier versions.
+
+        Returns
+        ---------------------
+        output: class: 'pandas.DataFrame'
+        '''
+
+        df = pd.concat([pd.DataFrame({'Date': self.dates}),
+                        pd.DataFrame(self.values,columns=self.names,dtype=dtype)],axis=1)
+        df.attrs.update(self.attrs)
+
+        return df
+
+    #==================================================================================================
+    # Access single stations
+    #==================================================================================================
+
+    def station(self, sid: str):
+
+        '''
+        Returns a view of the daily values of a station within its valid date range, along with the
+        dates of these values.
+
+        Returns
+        ---------------------
+        output: class: 'numpy.ndarray', 'pandas.DatetimeIndex'
+        '''
+
+        c = self.column_of[sid]
+        first, last = self.valid[c]
+
+        return self.values[first:last+1,c], self.dates[first:last+1]
+
+    def metadata_row(self, sid: str, metadata: pd.DataFrame):
+
+        '''
+        Returns the row of 'metadata' describing a station.
+
+        Returns
+        ---------------------
+        output: class: 'pandas.Series'
+        '''
+
+        return metadata.iloc[self.rows[self.column_of[sid]]]
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.valid.nbytes + self.rows.nbytes
+
+    def __repr__(self):
+        return ('StationMatrix('+str(self.values.shape[1])+' stations, '+str(self.values.shape[0])+
+                ' days, '+str(round(self.nbytes/1024**2,1))+' MB)')
+
+#######################################################################################################
+#
+# STATION SEGMENTS
+#
+#######################################################################################################
+
+class StationSegments:
+
+    '''
+    Daily values of multiple stations where only each station's valid date range is stored. The values
+    of all stations are kept one after another in one float32 array: station c holds
+    values[offsets[c]:offsets[c+1]], starting at row starts[c] of the date axis. Boxes with stations of
+    disjoint periods of record (e.g., one station from 1893 to 1920 and another from 2005 to today)
+    take a fraction of the memory of a 'StationMatrix'. The processing functions and plots accept
+    station segments in place of a DataFrame, reducing across stations without densifying.
+
+    Parameters
+    -------------
+    values
+     class: 'numpy.ndarray', float32 array with the values of all stations one after another.
+
+    offsets
+     class: 'numpy.ndarray', Integer array of length stations+1, the values of station c are
+                             values[offsets[c]:offsets[c+1]].
+
+    starts
+     class: 'numpy.ndarray', Row of 'dates' of the first value of each station.
+
+    dates
+     class: 'pandas.DatetimeIndex', Daily dates covering the dates of every station.
+
+    sids
+     class: 'list', Station id of each station.
+
+    rows
+     class: 'numpy.ndarray', Row (position) of each station in the metadata DataFrame.
+
+    names
+     class: 'list', Column name of each station, 'sid: name, state'.
+    '''
+
+    def __init__(self, values: np.ndarray, offsets: np.ndarray, starts: np.ndarray, dates: pd.DatetimeIndex,
+                 sids: list, rows: np.ndarray, names: list):
+        self.values, self.offsets, self.starts, self.dates = values, np.asarray(offsets), np.asarray(starts), dates
+        self.sids, self.rows, self.names = list(sids), np.asarray(rows), list(names)
+        self.column_of = {sid: c for c, sid in enumerate(self.sids)}
+        self.name_of = {name: c for c, name in enumerate(self.names)}
+        self.attrs = {}
+
+    #==================================================================================================
+    # Build station segments from the daily values of each station, or from a station matrix
+    #==================================================================================================
+
+    @classmethod
+    def from_stations(cls, metadata: pd.DataFrame, station_values: list, dates: pd.DatetimeIndex):
+
+        '''
+        Writes the daily values of every station one after another into one float32 array, along with
+        the row of 'dates' where each station starts. Stations are named and ordered as the columns of
+        StationMatrix.from_stations(); if two stations share a name the later one replaces the earlier
+        one.
+
+        Parameters
+        -------------
+        metadata
+         class: 'pandas.DataFrame', Metadata of the stations with columns 'sids', 'name', 'state' and
+                                    'sdate'.
+
+        station_values
+         class: 'list', List of 'numpy.ndarray' with one array per station, in the same order as the
+                        rows of 'metadata', as returned by multistn_fetch().
+
+        dates
+         class: 'pandas.DatetimeIndex', Daily dates covering the dates of every station.
+
+        Returns
+        ---------------------
+        output: class: 'StationSegments'
+        '''
+
+        # Metadata row of each station, stations sharing a name keep the position of the first one
+        names = [str(metadata['sids'][i]+': '+metadata['name'][i]+', '+metadata['state'][i])
+                 for i in range(len(metadata))]
+        last_row = {name: i for i, name in enumerate(names)}
+        columns = list(dict.fromkeys(names))
+        rows = np.array([last_row[name] for name in columns],dtype=int)
+
+        # First row of each station, counted in days from the first date
+        starts = np.array([(pd.Timestamp(metadata['sdate'][r]) - dates[0]).days for r in rows],dtype=int)
+        offsets = np.concatenate([[0],np.cumsum([len(station_values[r]) for r in rows],dtype=int)])
+
+        values = np.empty(offsets[-1],dtype=np.float32)
+        for c, r in enumerate(rows):
+         values[offsets[c]:offsets[c+1]] = station_values[r]
+
+        return cls(values, offsets, starts, dates, [metadata['sids'][r] for r in rows], rows, columns)
+
+    @classmethod
+    def from_matrix(cls, matrix: StationMatrix):
+
+        '''
+        Keeps the values of each station of a 'StationMatrix' within its valid date range only.
+
+        Returns
+        ---------------------
+        output: class: 'StationSegments'
+        '''
+
+        lengths = np.maximum(0,matrix.valid[:,1] - matrix.valid[:,0] + 1)
+        offsets = np.concatenate([[0],np.cumsum(lengths,dtype=int)])
+
+        values = np.empty(offsets[-1],dtype=np.float32)
+        for c, (first, last) in enumerate(matrix.valid):
+         values[offsets[c]:offsets[c+1]] = matrix.values[first:first+lengths[c],c]
+
+        segments = cls(values, offsets, matrix.valid[:,0], matrix.dates, matrix.sids, matrix.rows, matrix.names)
+        segments.attrs.update(matrix.attrs)
+
+        return segments
+
+    #==================================================================================================
+    # Access single stations and columns
+    #==================================================================================================
+
+    def segment(self, c: int):
+
+        '''
+        Returns a view of the values of the station at position 'c' and the rows of 'dates' they cover.
+
+        Returns
+        ---------------------
+        output: class: 'numpy.ndarray', 'slice'
+        '''
+
+        values = self.values[self.offsets[c]:self.offsets[c+1]]
+
+        return values, slice(self.starts[c],self.starts[c]+len(values))
+
+    def station(self, sid: str):
+
+        '''
+        Returns a view of the daily values of a station within its valid date range, along with the
+        dates of these values.
+
+        Returns
+        ---------------------
+        output: class: 'numpy.ndarray', 'pandas.DatetimeIndex'
+        '''
+
+        values, span = self.segment(self.column_of[sid])
+
+        return values, self.dates[span]
+
+    def metadata_row(self, sid: str, metadata: pd.DataFrame):
+
+        '''
+        Returns the row of 'metadata' describing a station.
+
+        Returns
+        ---------------------
+        output: class: 'pandas.Series'
+        '''
+
+        return metadata.iloc[self.rows[self.column_of[sid]]]
+
+    def __getitem__(self, name: str):
+
+        '''
+        Returns 'Date' or the values of a single station over all dates as a Series, as the column of
+        the same name in a DataFrame in the layout of bbox_multistn_daily(). Only the requested
+        station is expanded.
+
+        Returns
+        ---------------------
+        output: class: 'pandas.Series'
+        '''
+
+        if name == 'Date':
+           return pd.Series(self.dates,name='Date')
+
+        values, span = self.segment(self.name_of[name])
+        column = np.full(len(self.dates),np.nan,dtype=np.float32)
+        column[span] = values
+
+        return pd.Series(column,name=name)
+
+    @property
+    def columns(self):
+        # Columns of the equivalent DataFrame in the layout of bbox_multistn_daily()
+        return pd.Index(['Date']+self.names)
+
+    #==================================================================================================
+    # Reduce across stations for every day
+    #==================================================================================================
+
+    def reduce(self, how: str, min_stations: int = 1, above: float = None):
+
+        '''
+        Reduces the values of all stations for every day, visiting each station's segment once. Equals
+        the reduction across the station columns (axis=1) of the equivalent DataFrame, accumulated in
+        float64.
+
+        Parameters
+        -------------
+        how
+         class: 'string', Reduction across stations. Options are 'mean', 'sum', 'max', 'min', 'count'.
+
+        min_stations
+         class: 'integer', Days with fewer stations reporting data (any non-NaN value) are set to NaN.
+                           Default is 1.
+
+        above
+         class: 'float', If given, only values greater than 'above' are reduced, e.g. to average days
+                         with measurable precipitation. Does not change the count for 'min_stations'.
+                         Default is None.
+
+        Returns
+        ---------------------
+        output: class: 'numpy.ndarray', float64 array with one value per date, NaN (0 for 'count') on days
+                                        without data.
+        '''
+
+        stations = np.zeros(len(self.dates),dtype=np.int32)
+        used = np.zeros(len(self.dates),dtype=np.int32)
+        total = np.zeros(len(self.dates)) if how in ('mean','sum','count') else np.full(len(self.dates),np.nan)
+
+        for c in range(len(self.names)):
+         values, span = self.segment(c)
+         ok = ~np.isnan(values)
+         stations[span] += ok
+         if above is not None:
+          ok &= values > above
+         used[span] += ok
+         if how == 'mean' or how == 'sum':
+          total[span] += np.where(ok,values,0)
+         elif how == 'max':
+          total[span] = np.fmax(total[span],np.where(ok,values,np.nan))
+         elif how == 'min':
+          total[span] = np.fmin(total[span],np.where(ok,values,np.nan))
+         elif how != 'count':
+          raise ValueError("'how' must be 'mean', 'sum', 'max', 'min' or 'count'")
+
+        if how == 'count':
+         total = used.astype(np.float64)
+        elif how == 'mean' or how == 'sum':
+         total = np.divide(total,used,out=np.full(len(total),np.nan),where=used > 0) if how == 'mean' else \
+                 np.where(used > 0,total,np.nan)
+
+        total[stations < min_stations] = 0 if how == 'count' else np.nan
+
+        return total
+
+    def reduce_frame(self, how: str, min_stations: int = 1, above: float = None):
+
+        '''
+        Returns reduce() as a DataFrame with 'Date' and a single column named 'how', in the layout of
+        bbox_multistn_daily() with one station.
+
+        Returns
+        ---------------------
+        output: class: 'pandas.DataFrame'
+        '''
+
+        df = pd.DataFrame({'Date': self.dates, how: self.reduce(how,min_stations,above)})
+        df.attrs.update(self.attrs)
+
+        return df
+
+    #==================================================================================================
+    # Count days with data for every station and month
+    #==================================================================================================
+
+    def monthly_count(self):
+
+        '''
+        Counts the days with data (non-NaN values) of every station in every month of 'dates'. Equals
+        grouping the station columns of the equivalent DataFrame by 'Year' and 'Month' and counting.
+
+        Returns
+        ---------------------
+        output: class: 'pandas.DataFrame', Counts with a ('Year','Month') index and one column per station.
+        '''
+
+        # Month of every date, months are numbered from 0 in order of the dates
+        month_id, months = pd.factorize(self.dates.year*12 + self.dates.month - 1)
+        counts = np.zeros((len(months),len(self.names)),dtype=np.int64)
+
+        for c in range(len(self.names)):
+         values, span = self.segment(c)
+         counts[:,c] = np.bincount(month_id[span][~np.isnan(values)],minlength=len(months))
+
+        index = pd.MultiIndex.from_arrays([months//12, months%12+1],names=['Year','Month'])
+
+        return pd.DataFrame(counts,index=index,columns=self.names)
+
+    #==================================================================================================
+    # Masked copies
+    #==================================================================================================
+
+    def mask_days(self, days: np.ndarray):
+
+        '''
+        Returns a copy where every station is NaN on the days where 'days' is True.
+
+        Returns
+        ---------------------
+        output: class: 'StationSegments'
+        '''
+
+        days = np.asarray(days,dtype=bool)
+        values = self.values.copy()
+        for c in range(len(self.names)):
+         span = self.segment(c)[1]
+         values[self.offsets[c]:self.offsets[c+1]][days[span]] = np.nan
+
+        return self.with_values(values)
+
+    def keep_above(self, threshold: float):
+
+        '''
+        Returns a copy where values not greater than 'threshold' (e.g., 0 and trace precipitation) are
+        NaN.
+
+        Returns
+        ---------------------
+        output: class: 'StationSegments'
+        '''
+
+        return self.with_values(np.where(self.values > threshold,self.values,np.nan).astype(np.float32))
+
+    def with_values(self, values: np.ndarray):
+        # Station segments with the same layout and other values
+        segments = StationSegments(values, self.offsets, self.starts, self.dates, self.sids, self.rows, self.names)
+        segments.attrs.update(self.attrs)
+        return segments
+
+    def sids_with_data(self, days: np.ndarray):
+
+        '''
+        Returns the station ids, taken from the column names, of the stations with data on any day
+        where 'days' is True.
+
+        Returns
+        ---------------------
+        output: class: 'list'
+        '''
+
+        days = np.asarray(days,dtype=bool)
+        sids = []
+        for c in range(len(self.names)):
+         values, span = self.segment(c)
+         if np.any(days[span] & ~np.isnan(values)):
+          sids.append(self.names[c].split(':')[0])
+
+        return sids
+
+    #==================================================================================================
+    # Dense copies
+    #==================================================================================================
+
+    def to_matrix(self):
+
+        '''
+        Expands the segments into a 'StationMatrix' over all dates.
+
+        Returns
+        ---------------------
+        output: class: 'StationMatrix'
+        '''
+
+        values = np.full((len(self.dates),len(self.names)),np.nan,dtype=np.float32)
+        for c in range(len(self.names)):
+         segment, span = self.segment(c)
+         values[span,c] = segment
+
+        lengths = np.diff(self.offsets)
+        matrix = StationMatrix(values, self.dates, self.sids, self.rows,
+                               np.stack([self.starts,self.starts+lengths-1],axis=1), self.names)
+        matrix.attrs.update(self.attrs)
+
+        return matrix
+
+    def to_frame(self, dtype=np.float64):
+
+        '''
+        Returns a copy of the segments as a DataFrame in the layout of bbox_multistn_daily(), with the
+        station columns converted to 'dtype'. Default is float64 as returned by earlier versions.
+
+        Returns
+        ---------------------
+        output: class: 'pandas.DataFrame'
+        '''
+
+        return self.to_matrix().to_frame(dtype=dtype)
+
+    @property
+    def shape(self):
+        # Shape of the equivalent station matrix (days, stations)
+        return (len(self.dates), len(self.names))
+
+    @property
+    def density(self):
+        # Fraction of the equivalent station matrix that is stored
+        return len(self.values)/max(1,len(self.dates)*len(self.names))
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.offsets.nbytes + self.starts.nbytes + self.rows.nbytes
+
+    def __repr__(self):
+        return ('StationSegments('+str(len(self.names))+' stations, '+str(len(self.dates))+' days, '+
+                str(round(self.nbytes/1024**2,1))+' MB, '+str(round(100*self.density,1))+'% of dense)')
+
+#######################################################################################################
+#
+# STATION MONTHLY
+#
+#######################################################################################################
+
+class StationMonthly:
+
+    '''
+    Monthly values of multiple stations reduced from their daily values by NOAA ACIS (the maximum,
+    minimum, sum or mean of each month), held in one float32 array (months x stations) along with the
+    number of days with data in each month. Monthly time series only need these, so they are queried
+    without downloading any daily values, see bbox_multistn_monthly(). 'Date' holds the first day of
+    each month, and the count, masking and reduction methods follow 'StationSegments' with one row
+    per month, so the time series plots accept it in place of daily data.
+
+    Parameters
+    -------------
+    values
+     class: 'numpy.ndarray', float32 array of shape (months, stations), NaN for months without data.
+
+    counts
+     class: 'numpy.ndarray', Integer array of shape (months, stations), days with data in each month.
+
+    months
+     class: 'pandas.DatetimeIndex', First day of each month of the rows of 'values'.
+
+    sids
+     class: 'list', Station id of each column of 'values'.
+
+    rows
+     class: 'numpy.ndarray', Row (position) of each station in the metadata DataFrame.
+
+    names
+     class: 'list', Column name of each station, 'sid: name, state'.
+
+    how
+     class: 'string', Reduction of the daily values of each month, 'max', 'min', 'sum' or 'mean'.
+    '''
+
+    def __init__(self, values: np.ndarray, counts: np.ndarray, months: pd.DatetimeIndex, sids: list,
+                 rows: np.ndarray, names: list, how: str):
+        self.values, self.counts, self.months = values, counts, months
+        self.sids, self.rows, self.names, self.how = list(sids), np.asarray(rows), list(names), how
+        self.column_of = {sid: c for c, sid in enumerate(self.sids)}
+        self.name_of = {name: c for c, name in enumerate(self.names)}
+        self.attrs = {}
+
+    #==================================================================================================
+    # Build monthly values from the monthly values of each station
+    #==================================================================================================
+
+    @classmethod
+    def from_stations(cls, metadata: pd.DataFrame, station_values: list, station_counts: list,
+                      months: pd.DatetimeIndex, how: str):
+
+        '''
+        Writes the monthly values and counts of every station into one array each. Stations are named
+        and ordered as the columns of StationMatrix.from_stations(); if two stations share a name the
+        later one replaces the earlier one.
+
+        Parameters
+        -------------
+        metadata
+         class: 'pandas.DataFrame', Metadata of the stations with columns 'sids', 'name' and 'state'.
+
+        station_values, station_counts
+         class: 'list', Lists of 'numpy.ndarray' with the values and counts of each station over all
+                        'months', in the same order as the rows of 'metadata'.
+
+        months
+         class: 'pandas.DatetimeIndex', First day of each month.
+
+        how
+         class: 'string', Reduction of the daily values of each month.
+
+        Returns
+        ---------------------
+        output: class: 'StationMonthly'
+        '''
+
+        # Metadata row of each station, stations sharing a name keep the position of the first one
+        names = [str(metadata['sids'][i]+': '+metadata['name'][i]+', '+metadata['state'][i])
+                 for i in range(len(metadata))]
+        last_row = {name: i for i, name in enumerate(names)}
+        columns = list(dict.fromkeys(names))
+        rows = np.array([last_row[name] for name in columns],dtype=int)
+
+        values = np.full((len(months),len(columns)),np.nan,dtype=np.float32)
+        counts = np.zeros((len(months),len(columns)),dtype=np.int64)
+        for c, r in enumerate(rows):
+         values[:,c], counts[:,c] = station_values[r], station_counts[r]
+
+        return cls(values, counts, months, [metadata['sids'][r] for r in rows], rows, columns, how)
+
+    #==================================================================================================
+    # Access single stations and columns
+    #==================================================================================================
+
+    def __getitem__(self, name: str):
+
+        '''
+        Returns 'Date' (first day of each month) or the monthly values of a single station as a Series.
+
+        Returns
+        ---------------------
+        output: class: 'pandas.Series'
+        '''
+
+        if name == 'Date':
+           return pd.Series(self.months,name='Date')
+
+        return pd.Series(self.values[:,self.name_of[name]],name=name)
+
+    @property
+    def columns(self):
+        # Columns of the equivalent DataFrame, 'Date' followed by one column per station
+        return pd.Index(['Date']+self.names)
+
+    #==================================================================================================
+    # Reduce across stations for every month
+    #==================================================================================================
+
+    def reduce_frame(self, how: str):
+
+        '''
+        Reduces the monthly values of all stations for every month and returns a DataFrame with 'Date'
+        and a single column named 'how'. Only reductions that give the same result as reducing the
+        daily values first are possible: the maximum of monthly maxima and the minimum of monthly
+        minima.
+
+        Returns
+        ---------------------
+        output: class: 'pandas.DataFrame'
+        '''
+
+        if how != self.how or how not in ('max','min'):
+         raise ValueError(f"Monthly '{self.how}' values cannot be reduced to '{how}' across stations, "+
+                          'query daily values with bbox_multistn_daily() instead')
+
+        # Months without data at any station are NaN
+        has_data = ~np.isnan(self.values).all(axis=1)
+        reduced = np.full(len(self.months),np.nan,dtype=np.float64)
+        reducer = np.nanmax if how == 'max' else np.nanmin
+        reduced[has_data] = reducer(self.values[has_data],axis=1)
+
+        df = pd.DataFrame({'Date': self.months, how: reduced})
+        df.attrs.update(self.attrs)
+
+        return df
+
+    #==================================================================================================
+    # Count days with data for every station and month
+    #==================================================================================================
+
+    def monthly_count(self):
+
+        '''
+        Returns the days with data of every station in every month, in the layout of
+        StationSegments.monthly_count().
+
+        Returns
+        ---------------------
+        output: class: 'pandas.DataFrame', Counts with a ('Year','Month') index and one column per station.
+        '''
+
+        index = pd.MultiIndex.from_arrays([self.months.year, self.months.month],names=['Year','Month'])
+
+        return pd.DataFrame(self.counts,index=index,columns=self.names)
+
+    #==================================================================================================
+    # Masked copies
+    #==================================================================================================
+
+    def mask_days(self, months: np.ndarray):
+
+        '''
+        Returns a copy where every station is NaN, with no days of data, in the months where 'months'
+        (one per row of 'Date') is True.
+
+        Returns
+        ---------------------
+        output: class: 'StationMonthly'
+        '''
+
+        months = np.asarray(months,dtype=bool)
+        values, counts = self.values.copy(), self.counts.copy()
+        values[months], counts[months] = np.nan, 0
+
+        monthly = StationMonthly(values, counts, self.months, self.sids, self.rows, self.names, self.how)
+        monthly.attrs.update(self.attrs)
+
+        return monthly
+
+    def sids_with_data(self, months: np.ndarray):
+
+        '''
+        Returns the station ids, taken from the column names, of the stations with data in any month
+        where 'months' is True.
+
+        Returns
+        ---------------------
+        output: class: 'list'
+        '''
+
+        has_data = (~np.isnan(self.values[np.asarray(months,dtype=bool)])).any(axis=0)
+
+        return [self.names[c].split(':')[0] for c in np.flatnonzero(has_data)]
+
+    #==================================================================================================
+    # Dense copies
+    #==================================================================================================
+
+    def to_frame(self, dtype=np.float64):
+
+        '''
+        Returns the monthly values as a DataFrame with 'Date' followed by one column per station.
+
+        Returns
+        ---------------------
+        output: class: 'pandas.DataFrame'
+        '''
+
+        df = pd.DataFrame(self.values.astype(dtype),columns=self.names)
+        df.insert(0,'Date',self.months)
+        df.attrs.update(self.attrs)
+
+        return df
+
+    @property
+    def shape(self):
+        # Shape of the monthly values (months, stations)
+        return self.values.shape
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.counts.nbytes + self.rows.nbytes
+
+    def __repr__(self):
+        return ('StationMonthly('+self.how+', '+str(len(self.names))+' stations, '+str(len(self.months))+
+                ' months, '+str(round(self.nbytes/1024**2,1))+' MB)')
@@ -6,10 +6,12 @@
 
 import numpy as np
 import pandas as pd
-import json, urllib
+import os, json, urllib, http.client
 from warnings import simplefilter
 from ClimateDataVisualizer.dataquery import NOAA_ACIS_stnmeta as stnmeta
 from ClimateDataVisualizer.dataquery import NOAA_ACIS_stndata as stndata
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_transport as transport
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_catalog as stncatalog
 
 #######################################################################################################
 #
@@ -17,11 +19,19 @@ from ClimateDataVisualizer.dataquery import NOAA_ACIS_stndata as stndata
 #
 #######################################################################################################
 
+# Type of each station id code in 'sids'
+sids_station_id_type = {1: 'wban', 2: 'coop', 3: 'faa', 4: 'wmo', 5: 'icao', 6: 'ghcn', 7: 'nwsli',
+                        9: 'thrdx', 10: 'cocorahs', 29: 'cadx'}
+
+# Approximate size in bytes of one daily value in an uncompressed NOAA ACIS json response, e.g. '"0.12",'
+bytes_per_day = 7
+
 #======================================================================================================
 # Query metadata from NOAA ACIS given bounding box of coordinates and return as Pandas DataFrame
 #======================================================================================================
 
-def bbox_metadata(elem: str, items: str, slat: float, nlat: float, wlon: float, elon: float):
+def bbox_metadata(elem: str, items: str, slat: float, nlat: float, wlon: float, elon: float,
+                  source: str = 'live'):
 
     '''
     Creates Pandas DataFrame with metadata for all NOAA ACIS stations within bounded coordinates
@@ -46,6 +56,17 @@ def bbox_metadata(elem: str, items: str, slat: float, nlat: float, wlon: float,
                      values correspond to °N and °E. Any number of decimal places may be specified. 
                      Example: slat = 37, nlat = 37.567, wlon = -90.01, elon = -89.5
 
+    source
+     class: 'string', Where metadata is read from. 'live' queries NOAA ACIS StnMeta. 'catalog' reads the
+                      local station catalog (see 'NOAA_ACIS_catalog.py') without any request. 'auto'
+                      reads the catalog if it holds all 'items' and is at most 'catalog_max_age' days
+                      old, and only queries NOAA ACIS for the stations whose period of record may have
+                      grown since the catalog was taken, otherwise it queries NOAA ACIS. Only the items
+                      'name','state','sids','ll','valid_daterange' are held by the catalog. The csv
+                      catalogs shipped in Extras/Metadata are too old for 'auto', build a current one
+                      first with 'python -m ClimateDataVisualizer.dataquery.NOAA_ACIS_catalog'.
+                      Default is 'live'.
+
     Returns
     ---------------------
     output: class: 'pandas.DataFrame'
@@ -53,6 +74,16 @@ def bbox_metadata(elem: str, items: str, slat: float, nlat: float, wlon: float,
             Rows (number of stations within bounded box) x Columns (number of items in 'items') 
     '''
 
+    #-------------------------------------------------------------
+    # Answer from local station catalog if requested
+    #-------------------------------------------------------------
+
+    catalog = stnmeta.local_catalog(elem=elem,items=items,source=source)
+
+    if catalog is not None:
+     rows = catalog.query(slat=slat,nlat=nlat,wlon=wlon,elon=elon)
+     return stnmeta.catalog_metadata(catalog=catalog,rows=rows,items=items,source=source)
+
     #-------------------------------------------------------------
     # Turn coordinates into bbox
     #-------------------------------------------------------------
@@ -81,7 +112,7 @@ def bbox_metadata(elem: str, items: str, slat: float, nlat: float, wlon: float,
 # Query metadata from NOAA ACIS given list of station ids (sids) and return as Pandas DataFrame
 #======================================================================================================
 
-def sids_metadata(elem: str, items: str, sids: list):
+def sids_metadata(elem: str, items: str, sids: list, source: str = 'live'):
 
     '''
     Creates Pandas DataFrame with metadata for all NOAA ACIS stations given a list of station ids
@@ -103,6 +134,10 @@ def sids_metadata(elem: str, items: str, sids: list):
      class: 'list', List of station ids (sids) for which to find corresponding metadata. Each element
                     in the list must be type 'string'.
 
+    source
+     class: 'string', Where metadata is read from, 'live', 'catalog' or 'auto'. See bbox_metadata().
+                      Default is 'live'.
+
     Returns
     ---------------------
     output: class: 'pandas.DataFrame'
@@ -110,6 +145,23 @@ def sids_metadata(elem: str, items: str, sids: list):
             Rows (number of elements in sids) x Columns (number of items in 'items') 
     '''
 
+    #-------------------------------------------------------------
+    # Answer from local station catalog if requested
+    #-------------------------------------------------------------
+
+    catalog = stnmeta.local_catalog(elem=elem,items=items,source=source)
+
+    if catalog is not None:
+     rows, missing = catalog.lookup_sids(sids)
+     # Station ids of other id types are not in the catalog, query all of them to keep their order
+     if len(missing) > 0 and source == 'auto':
+      catalog = None
+     elif len(missing) > 0:
+      print('Station catalog has no stations with sids: '+', '.join(map(str,missing)))
+
+    if catalog is not None:
+     return stnmeta.catalog_metadata(catalog=catalog,rows=rows,items=items,source=source)
+
     #-------------------------------------------------------------
     # Turn list of strings into single delimited string 
     #-------------------------------------------------------------
@@ -134,6 +186,192 @@ def sids_metadata(elem: str, items: str, sids: list):
 
     return metadata
 
+#======================================================================================================
+# Remove stations that cannot contribute to a query from a metadata DataFrame before any data request
+#======================================================================================================
+
+def filter_metadata(metadata: pd.DataFrame, min_days: int = None, overlap: tuple = None,
+                    sids_types: tuple = None, print_results: bool = True):
+
+    '''
+    Removes stations from a metadata DataFrame using only their metadata, so they are never queried:
+    stations with a short period of record, stations without any date within a date window, and
+    stations whose first station id is not of an allowed type. The remaining rows are unchanged, so
+    the data queried for them is the same as without the filter. The number of stations removed and
+    an estimate of the daily values and bytes not queried are kept in attrs['prefilter'].
+
+    Parameters
+    -------------
+    metadata
+     class: 'pandas.DataFrame', Metadata with 'sdate' and 'edate' columns, and 'sids_type' if
+                                'sids_types' is given (metadata items 'valid_daterange' and 'sids').
+
+    min_days           Default = None
+     class: 'integer', Minimum number of days from 'sdate' to 'edate'. This is the length of the
+                       period of record, days without data within it are not known from metadata.
+
+    overlap            Default = None
+     class: 'tuple', (sdate, edate) window the period of record must overlap by at least one day.
+                     Either date may be None for an open window. Example: ('1991-01-01', None)
+
+    sids_types         Default = None
+     class: 'tuple', Allowed types of the first station id, see 'sids_station_id_type'.
+                     Example: ('coop','wban','ghcn','faa','icao','wmo','nwsli','thrdx','cadx')
+                     leaves out 'cocorahs' stations.
+
+    print_results      Default = True
+     class: 'bool', Print the number of stations removed and the estimated size not queried.
+
+    Returns
+    ---------------------
+    output: class: 'pandas.DataFrame'
+            Returns dataframe of the remaining stations with a new index. Raises ValueError if no
+            stations remain.
+    '''
+
+    # Nothing to filter, e.g. no stations in the query region
+    if not isinstance(metadata,pd.DataFrame) or (min_days is None and overlap is None and sids_types is None):
+     return metadata
+
+    sdate = pd.to_datetime(metadata['sdate'])
+    edate = pd.to_datetime(metadata['edate'])
+    keep = np.ones(len(metadata),dtype=bool)
+
+    # Length of the period of record
+    if min_days is not None:
+     keep &= ((edate - sdate).dt.days + 1 >= min_days).to_numpy()
+
+    # Period of record overlaps the window
+    if overlap is not None:
+     if overlap[0] is not None:
+      keep &= (edate >= pd.Timestamp(overlap[0])).to_numpy()
+     if overlap[1] is not None:
+      keep &= (sdate <= pd.Timestamp(overlap[1])).to_numpy()
+
+    # Type of the first station id
+    if sids_types is not None:
+     keep &= metadata['sids_type'].isin(list(sids_types)).fillna(False).to_numpy(dtype=bool)
+
+    #-------------------------------------------------------------------------------------------------
+    # Estimate the daily values and bytes that will not be queried
+    #-------------------------------------------------------------------------------------------------
+
+    days = ((edate - sdate).dt.days + 1).fillna(0).to_numpy()
+    prefilter = {'stations_removed': int((~keep).sum()), 'days_saved': int(days[~keep].sum()),
+                 'bytes_saved': int(days[~keep].sum())*stnmeta.bytes_per_day}
+
+    if print_results == True:
+     print('Prefilter: '+str(prefilter['stations_removed'])+' of '+str(len(metadata))+' stations '+
+           'removed, about '+str(round(prefilter['bytes_saved']/1024**2,1))+' MB ('+
+           str(prefilter['days_saved'])+' daily values) not queried')
+
+    if keep.any() == False:
+     raise ValueError('No stations left after prefilter')
+
+    filtered = metadata[keep].reset_index(drop=True)
+    filtered.attrs['prefilter'] = prefilter
+
+    return filtered
+
+#======================================================================================================
+# Return the local station catalog that answers a metadata query, or None to query NOAA ACIS
+#======================================================================================================
+
+def local_catalog(elem: str, items: str, source: str):
+
+    '''
+    Decides whether a metadata query is answered by the local station catalog. With source='catalog'
+    the catalog must exist and hold all 'items'. With source='auto' None is returned, and NOAA ACIS
+    queried, if it does not exist, lacks an item, or is older than 'catalog_max_age' days. The csv
+    catalogs shipped in Extras/Metadata are older than that until a current catalog is built with
+    build_catalog(), which is noted once per element.
+
+    Returns
+    ---------------------
+    output: class: 'NOAA_ACIS_catalog.StationCatalog', or None
+    '''
+
+    if source == 'live':
+     return None
+    if source != 'catalog' and source != 'auto':
+     raise ValueError("'source' must be 'live', 'catalog' or 'auto'")
+
+    # Every item must be held by the catalog
+    held = all(item.strip() in stncatalog.catalog_items for item in items.split(','))
+
+    try:
+     catalog = stncatalog.get_catalog(elem)
+    except FileNotFoundError:
+     catalog = None
+
+    if source == 'catalog':
+     if catalog is None:
+      raise FileNotFoundError('No station catalog for '+elem+' in '+stncatalog.catalog_folder)
+     if held == False:
+      raise ValueError('Station catalog only holds the items '+','.join(stncatalog.catalog_items))
+     return catalog
+
+    if catalog is None or held == False:
+     return None
+
+    if catalog.age > stncatalog.catalog_max_age:
+     key = (os.path.abspath(stncatalog.catalog_folder), elem)
+     if key not in stncatalog.stale_noted:
+      stncatalog.stale_noted.add(key)
+      print('NOTE: Station catalog for '+elem+' was taken on '+str(catalog.snapshot.date())+', more than '+
+            str(stncatalog.catalog_max_age)+' days ago, querying NOAA ACIS instead. Build a current catalog '+
+            'with: python -m ClimateDataVisualizer.dataquery.NOAA_ACIS_catalog')
+     return None
+
+    return catalog
+
+#======================================================================================================
+# Metadata of catalog stations, refreshing stations whose period of record may have grown
+#======================================================================================================
+
+def catalog_metadata(catalog, rows: np.ndarray, items: str, source: str):
+
+    '''
+    Returns the catalog stations in 'rows' as a metadata DataFrame like json_req_metadata(). With
+    source='auto', stations that were still reporting when the catalog was taken and whose 'edate'
+    is now behind today are queried from NOAA ACIS in a single request and get their current
+    'sdate' and 'edate'. If that request fails the catalog dates are kept, so lookups work offline.
+
+    Returns
+    ---------------------
+    output: class: 'pandas.DataFrame'
+    '''
+
+    metadata = catalog.metadata(rows,items)
+
+    # If no data available, exit and return error message
+    if metadata.empty:
+     return ValueError('No data exist for this query')
+
+    if source != 'auto' or ('valid_daterange' in items) == False:
+     return metadata
+
+    # Stations whose period of record may have grown since the catalog was taken
+    stale = np.isin(rows,catalog.stale_rows(rows))
+    if stale.any() == False:
+     return metadata
+
+    sids = [str(sid) for sid in catalog.columns['sids'][rows[stale]]]
+    try:
+     live = stnmeta.sids_metadata(elem=catalog.elem,items='sids,valid_daterange',sids=sids)
+    except (OSError, http.client.HTTPException) as e:
+     print('Could not refresh '+str(len(sids))+' stations from NOAA ACIS, using catalog dates. '+str(e))
+     return metadata
+
+    if isinstance(live, pd.DataFrame):
+     sdate_of = dict(zip(live['sids'].astype(str),live['sdate']))
+     edate_of = dict(zip(live['sids'].astype(str),live['edate']))
+     positions = np.flatnonzero(stale)
+     metadata.loc[positions,'sdate'] = [sdate_of.get(sid,metadata['sdate'][p]) for sid, p in zip(sids,positions)]
+     metadata.loc[positions,'edate'] = [edate_of.get(sid,metadata['edate'][p]) for sid, p in zip(sids,positions)]
+
+    return metadata
+
 #======================================================================================================
 # JSON request to pull metadata from NOAA ACIS given input dictionary
 #======================================================================================================
@@ -167,84 +405,81 @@ def json_req_metadata(input_dict: dict):
     # Call json request
     #-------------------------------------------------------------------------------------------------
 
-    params = urllib.parse.urlencode({'params':json.dumps(input_dict)}).encode('utf-8')
-    json_response = urllib.request.urlopen(urllib.request.Request('http://data.rcc-acis.org/StnMeta',
-                                           params,{'Accept':'application/json'})
-                                           ).read()
-    json_output = json.loads(json_response)
+    json_output = transport.acis_request('StnMeta',input_dict)
 
-    #------------------------------------------
-    # Convert json_output to Pandas DataFrame
-    #------------------------------------------
+    #---------------------------------------------------------------------------------------------
+    # Decode each selected item of the json 'meta' list into a typed column in a single pass
+    #---------------------------------------------------------------------------------------------
 
-    meta = pd.DataFrame(json_output['meta'])
+    meta = json_output['meta']
+    n = len(meta)
 
-    #----------------------------------------------------------------------------
-    # Load each selected column into output DataFrame 
-    #----------------------------------------------------------------------------
+    # If no data available, exit and return error message
+    if n == 0:
+     return ValueError('No data exist for this query')
 
     # First column defines selected 'elem'
-    metadata = pd.DataFrame({'elem': pd.Series([elem]*len(meta))})
+    columns = {'elem': np.full(n,elem,dtype=object)}
 
-    # If no data available, exit and return error message
-    if metadata.empty:
-     return ValueError('No data exist for this query') 
-
-    # 'name' 
+    # 'name'
     if ('name' in items) == True:
-     metadata = metadata.assign(name=pd.Series(meta['name']))
+     columns['name'] = np.array([stn.get('name',np.nan) for stn in meta],dtype=object)
 
     # 'state'
     if ('state' in items) == True:
-     metadata = metadata.assign(state=pd.Series(meta['state']))
+     columns['state'] = np.array([stn.get('state',np.nan) for stn in meta],dtype=object)
 
     # 'sids'
     # NOTE: Any station ID in the list will supply accurate data when accompanied by the valid data 
     # range so we only extract the first sids here to pass to the metadata dataframe. The attached
     # station code and type are included in the results as well.
     if ('sids' in items) == True:
-     sids = pd.Series(meta['sids'].str[0].str.split(' ', expand=True).iloc[:,0],dtype='string')
+     first = [stn['sids'][0].split(' ') for stn in meta]
+     sids_code = np.array([int(sid[1]) for sid in first],dtype=np.int64)
+     columns['sids'] = pd.array([sid[0] for sid in first],dtype='string')
+     columns['sids_code'] = sids_code
      # Include sids_code and sids_type as columns
-     sids_station_id_type = pd.DataFrame({'code': [1,2,3,4,5,6,7,9,10,29],
-                                          'type': ['wban','coop','faa','wmo','icao','ghcn','nwsli',
-                                                   'thrdx','cocorahs','cadx']                      })
-     sids_code = meta['sids'].str[0].str.split(' ', expand=True).iloc[:,1].astype(int)
-     sids_type = pd.Series(sids_code.map(sids_station_id_type.set_index('code').type),dtype='string')
-     metadata = metadata.assign(sids=sids,sids_code=sids_code,sids_type=sids_type)
+     columns['sids_type'] = pd.array([sids_station_id_type.get(code) for code in sids_code],dtype='string')
 
     # 'sid_dates'
     # NOTE: These dates are not necessarily accurate. I recommend leaving this out of the metadata
     # dataframe and using 'valid_daterange' instead when choosing the dates from which to query.
     if ('sid_dates' in items) == True:
-     sid_sdate = meta['sid_dates'].str[0].str[1] # start date
-     sid_edate = meta['sid_dates'].str[0].str[2] # end date
-     metadata = metadata.assign(sid_sdate=pd.Series(sid_sdate,dtype='string'),
-                                sid_edate=pd.Series(sid_edate,dtype='string')  )
+     sid_dates = [stn['sid_dates'][0] if stn.get('sid_dates') else [None]*3 for stn in meta]
+     columns['sid_sdate'] = pd.array([dates[1] for dates in sid_dates],dtype='string') # start date
+     columns['sid_edate'] = pd.array([dates[2] for dates in sid_dates],dtype='string') # end date
 
     # 'll'
     if ('ll' in items) == True:
-     metadata = metadata.assign(lat=np.float32(meta['ll'].str[1]),lon=np.float32(meta['ll'].str[0]))
+     ll = np.array([stn.get('ll',(np.nan,np.nan)) for stn in meta],dtype=np.float32).reshape(n,2)
+     columns['lat'], columns['lon'] = ll[:,1], ll[:,0]
 
     # 'elev'
     if ('elev' in items) == True:
-     metadata = metadata.assign(elev=pd.Series(meta['elev']))
+     columns['elev'] = pd.Series([stn.get('elev',np.nan) for stn in meta]).values
 
     # 'uid'
     if ('uid' in items) == True:
-     metadata = metadata.assign(uid=pd.Series(meta['uid'],dtype='string'))
+     columns['uid'] = pd.array([None if stn.get('uid') is None else str(stn['uid']) for stn in meta],
+                               dtype='string')
 
     # 'county'
     if ('county' in items) == True:
-     metadata = metadata.assign(county=pd.Series(meta['county'],dtype='string'))
+     columns['county'] = pd.array([stn.get('county') for stn in meta],dtype='string')
 
     # 'climdiv'
     if ('climdiv' in items) == True:
-     metadata = metadata.assign(climdiv=pd.Series(meta['climdiv'],dtype='string'))
+     columns['climdiv'] = pd.array([stn.get('climdiv') for stn in meta],dtype='string')
 
     # 'valid_daterange'
     if ('valid_daterange' in items) == True:
-     metadata = metadata.assign(sdate=pd.Series(meta['valid_daterange'].str[0].str[0],dtype='string'),
-                               edate=pd.Series(meta['valid_daterange'].str[0].str[1],dtype='string')   )
+     daterange = [stn['valid_daterange'][0] if stn.get('valid_daterange') and stn['valid_daterange'][0]
+                  else [None,None] for stn in meta]
+     columns['sdate'] = pd.array([dates[0] for dates in daterange],dtype='string')
+     columns['edate'] = pd.array([dates[1] for dates in daterange],dtype='string')
+
+    # Build the DataFrame once from all columns
+    metadata = pd.DataFrame(columns)
 
     #--------------------------------------
     # Output metadata as Pandas Dataframe
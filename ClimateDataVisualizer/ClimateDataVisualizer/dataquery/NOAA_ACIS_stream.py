@@ -0,0 +1,294 @@
+#######################################################################################################
+#
+# Streaming decode of NOAA ACIS StnData and GridData json responses into preallocated NumPy arrays
+#
+#######################################################################################################
+
+import re, json
+import numpy as np
+
+#######################################################################################################
+#
+# RAW DAILY VALUES
+#
+#######################################################################################################
+
+# Flag codes of raw daily values returned by NOAA ACIS
+FLAG_VALUE = 0   # plain value, e.g. '0.25'
+FLAG_M = 1       # missing, 'M'
+FLAG_T = 2       # trace, 'T'
+FLAG_S = 3       # part of a multi-day event that is reported later, 'S'
+FLAG_A = 4       # multi-day event total, e.g. '2.0A', the number is kept in 'value'
+
+# Raw daily values of a station, one record per day. Values are kept as float64 so multi-day totals
+# are divided exactly as before, the final float32 array is only made in singlestn_decode().
+raw_dtype = np.dtype([('value', np.float64), ('flag', np.uint8)])
+
+#======================================================================================================
+# Convert raw daily values given as strings into a raw array of values and flags
+#======================================================================================================
+
+def encode_values(values: list):
+
+    '''
+    Converts raw daily values returned by NOAA ACIS as strings (e.g., '45', 'M', 'T', 'S', '2.0A') into
+    an array of 'raw_dtype'. Flags are set from the strings and the number of plain values and of 'A'
+    values is kept in 'value', every other 'value' is NaN.
+
+    Parameters
+    -------------
+    values
+     class: 'list', Raw daily values as strings.
+
+    Returns
+    ---------------------
+    output: class: 'numpy.ndarray', Array of 'raw_dtype' with one record per day.
+    '''
+
+    raw = np.empty(len(values),dtype=raw_dtype)
+    raw['value'], raw['flag'] = np.nan, FLAG_VALUE
+
+    if len(values) == 0:
+     return raw
+
+    text = np.array(values,dtype=str)
+    flags = raw['flag']
+    flags[text == 'M'] = FLAG_M
+    flags[text == 'T'] = FLAG_T
+    flags[text == 'S'] = FLAG_S
+    has_A = np.char.find(text,'A') >= 0
+    flags[has_A] = FLAG_A
+
+    # Numbers of plain values and of multi-day totals, 'A' is removed the same way as str.replace()
+    number = (flags == FLAG_VALUE) | has_A
+    raw['value'][number] = np.char.replace(text[number],'A','').astype(np.float64)
+
+    return raw
+
+#======================================================================================================
+# Return raw array of a station with every day missing
+#======================================================================================================
+
+def missing_values(ndays: int):
+
+    '''
+    Returns an array of 'raw_dtype' with 'ndays' missing ('M') days.
+    '''
+
+    raw = np.empty(max(0,ndays),dtype=raw_dtype)
+    raw['value'], raw['flag'] = np.nan, FLAG_M
+
+    return raw
+
+#######################################################################################################
+#
+# STREAMING PARSER
+#
+#######################################################################################################
+
+# Top level keys of a NOAA ACIS response
+key_re = re.compile(r'"(meta|data|error)"\s*:\s*')
+
+# Single day of StnData: ["YYYY-MM-DD", "value"], preceded by a comma after the first day
+stn_day_re = re.compile(r'\s*,?\s*\[\s*"[^"]*"\s*,\s*"([^"]*)"\s*\]')
+
+# Start of a single day of GridData: ["YYYY-MM-DD", followed by the grid [[...],...,[...]]
+grid_day_re = re.compile(r'\s*,?\s*\[\s*"([^"]*)"\s*,\s*(?=\[)')
+grid_row_re = re.compile(r'\]\s*,\s*\[')
+
+# Closing bracket of an array, and the string value of an 'error' key
+end_re = re.compile(r'\s*\]')
+error_re = re.compile(r'"((?:[^"\\]|\\.)*)"')
+
+class ResponseText:
+
+    '''
+    Reads the pieces of response text yielded by NOAA_ACIS_transport.acis_request_stream() and keeps
+    only the part that was not parsed yet.
+
+    Parameters
+    -------------
+    pieces
+     class: 'generator', Pieces of the json response as strings.
+    '''
+
+    def __init__(self, pieces):
+        self.pieces, self.text, self.pos, self.eof = iter(pieces), '', 0, False
+
+    def more(self):
+        # Append the next piece of text, return False once the response has been fully read
+        try:
+            piece = next(self.pieces)
+        except StopIteration:
+            self.eof = True
+            return False
+        self.text, self.pos = self.text[self.pos:]+piece, 0
+        return True
+
+    def match(self, regex):
+        # Match 'regex' at the current position, return None at the closing bracket of an array
+        while True:
+            m = regex.match(self.text,self.pos)
+            if m is not None:
+               self.pos = m.end()
+               return m
+            m = end_re.match(self.text,self.pos)
+            if m is not None:
+               self.pos = m.end()
+               return None
+            if not self.more():
+               raise ValueError('Unexpected end of NOAA ACIS response')
+
+    def find(self, substring: str):
+        # Return text from the current position up to and including 'substring'
+        start = 0
+        while True:
+            end = self.text.find(substring,self.pos+start)
+            if end >= 0:
+               out, self.pos = self.text[self.pos:end+len(substring)], end+len(substring)
+               return out
+            start = max(0,len(self.text)-self.pos-len(substring))
+            if not self.more():
+               raise ValueError('Unexpected end of NOAA ACIS response')
+
+    def keys(self):
+        # Yield each top level key of the response, its value must be read before the next key
+        while True:
+            m = key_re.search(self.text,self.pos)
+            if m is not None:
+               self.pos = m.end()
+               yield m.group(1)
+               continue
+            # Keep the end of the text in case a key is split between two pieces
+            self.pos = max(self.pos,len(self.text)-16)
+            if not self.more():
+               return
+
+    def error(self):
+        # Raise the error message sent by NOAA ACIS in place of data
+        while error_re.match(self.text,self.pos) is None and self.more():
+            pass
+        m = error_re.match(self.text,self.pos)
+        raise ValueError('NOAA ACIS error: '+(json.loads(m.group(0)) if m is not None else 'unknown'))
+
+#======================================================================================================
+# Parse a StnData response into a preallocated raw array
+#======================================================================================================
+
+def parse_stndata(pieces, ndays: int):
+
+    '''
+    Parses the 'data' array of a NOAA ACIS StnData response for a single element while it is being
+    read, writing each day straight into a preallocated array of 'raw_dtype'. Only one piece of the
+    response text is held at a time, 'meta' is skipped.
+
+    Parameters
+    -------------
+    pieces
+     class: 'generator', Pieces of the json response, see NOAA_ACIS_transport.acis_request_stream().
+
+    ndays
+     class: 'integer', Number of requested days, used to preallocate the array.
+
+    Returns
+    ---------------------
+    output: class: 'numpy.ndarray', Array of 'raw_dtype' with one record per day.
+    '''
+
+    reader = ResponseText(pieces)
+    raw, n, batch, found = np.empty(max(0,ndays),dtype=raw_dtype), 0, [], False
+
+    for key in reader.keys():
+
+     if key == 'error':
+      reader.error()
+
+     if key == 'meta':
+      reader.find('}')
+      continue
+
+     # Read days of 'data', converting them in batches to keep the Python work per day small
+     found = True
+     reader.find('[')
+     while True:
+      m = reader.match(stn_day_re)
+      if m is not None:
+       batch.append(m.group(1))
+      if len(batch) == 4096 or (m is None and len(batch) > 0):
+       if n+len(batch) > len(raw):
+        raw = np.concatenate([raw,np.empty(n+len(batch)-len(raw),dtype=raw_dtype)])
+       raw[n:n+len(batch)] = encode_values(batch)
+       n, batch = n+len(batch), []
+      if m is None:
+       break
+
+    if found == False:
+     raise ValueError('NOAA ACIS response has no data')
+
+    return raw[:n]
+
+#======================================================================================================
+# Parse a GridData response into a preallocated float32 array
+#======================================================================================================
+
+def parse_griddata(pieces, ndays: int):
+
+    '''
+    Parses a NOAA ACIS GridData response for a single element while it is being read, writing each
+    day's grid straight into a preallocated float32 array. Only one day of the response text is held
+    at a time.
+
+    Parameters
+    -------------
+    pieces
+     class: 'generator', Pieces of the json response, see NOAA_ACIS_transport.acis_request_stream().
+
+    ndays
+     class: 'integer', Number of requested days, used to preallocate the array.
+
+    Returns
+    ---------------------
+    output: class: 'dict', 'dict', 'list', 'numpy.ndarray'
+            Dictionary with 'meta' (decoded json of the response 'meta'), 'dates' (list of date strings)
+            and 'data' (float32 array of shape (days, rows, columns)).
+    '''
+
+    reader = ResponseText(pieces)
+    meta, dates, grid, found = {}, [], None, False
+
+    for key in reader.keys():
+
+     if key == 'error':
+      reader.error()
+
+     if key == 'meta':
+      meta = json.loads(reader.find('}'))
+      continue
+
+     found = True
+     reader.find('[')
+     while True:
+      m = reader.match(grid_day_re)
+      if m is None:
+       break
+      # Grid of the day, rows are joined so it is read in one call
+      text = reader.find(']]')
+      values = np.fromstring(grid_row_re.sub(',',text.strip()[2:-2]),dtype=np.float32,sep=',')
+      nrows = len(grid_row_re.findall(text))+1
+      shape = (nrows, len(values)//nrows)
+      reader.match(end_re)
+      # Allocate array for all days once the shape of the grid is known
+      if grid is None:
+       grid = np.empty((max(1,ndays),)+shape,dtype=np.float32)
+      if len(dates) == len(grid):
+       grid = np.concatenate([grid,np.empty((1,)+shape,dtype=np.float32)])
+      grid[len(dates)] = values.reshape(shape)
+      dates.append(m.group(1))
+
+    if found == False:
+     raise ValueError('NOAA ACIS response has no data')
+
+    if grid is None:
+     grid = np.empty((0,0,0),dtype=np.float32)
+
+    return {'meta': meta, 'dates': dates, 'data': grid[:len(dates)]}
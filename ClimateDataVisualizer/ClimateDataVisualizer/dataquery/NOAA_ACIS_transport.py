@@ -0,0 +1,362 @@
+#######################################################################################################
+#
+# Shared HTTP transport for all requests sent to NOAA ACIS web services at http://data.rcc-acis.org/
+#
+#######################################################################################################
+
+import json, gzip, zlib, codecs, queue, threading, time, random
+import http.client, urllib.parse, urllib.error
+
+#######################################################################################################
+#
+# TRANSPORT SETTINGS
+#
+#######################################################################################################
+
+# Base URL of NOAA ACIS web services, every endpoint (StnData, StnMeta, ...) is appended to it
+acis_url = 'http://data.rcc-acis.org'
+
+# Seconds to wait for a connection or a response before the request fails
+timeout = 120
+
+# Maximum number of simultaneous open connections to one host
+max_connections = 8
+
+# Maximum average number of requests per second sent to NOAA ACIS, and number of requests that may be
+# sent at once after an idle period
+rate_limit = 10.0
+rate_burst = 10
+
+# Number of times a failed request is sent again, and base and maximum seconds of exponential backoff
+retries = 4
+backoff = 0.5
+backoff_max = 30.0
+
+# HTTP status codes of failed requests that are worth sending again
+retry_status = (429, 500, 502, 503, 504)
+
+# Connection pools for each (scheme, host, port), created on first use
+pools = {}
+pools_lock = threading.Lock()
+
+#======================================================================================================
+# Change transport settings
+#======================================================================================================
+
+def configure_transport(url: str = None, timeout_s: float = None, max_conn: int = None,
+                        rate: float = None, burst: int = None, n_retries: int = None,
+                        backoff_s: float = None, backoff_max_s: float = None):
+
+    '''
+    Changes the settings of the shared HTTP transport. Any parameter left as None keeps its current
+    value. Open connections are closed so the new settings apply to every following request.
+
+    Parameters
+    -------------
+    url
+     class: 'string', Base URL of NOAA ACIS web services. Default is 'http://data.rcc-acis.org'.
+
+    timeout_s
+     class: 'float', Seconds to wait for a connection or a response before the request fails.
+                     Default is 120.
+
+    max_conn
+     class: 'integer', Maximum number of simultaneous open connections to one host. Default is 8.
+
+    rate, burst
+     class: 'float', 'integer', Maximum average number of requests per second sent to NOAA ACIS and
+                                number of requests that may be sent at once after an idle period.
+                                Default is 10 and 10. Set 'rate' to 0 to turn rate limiting off.
+
+    n_retries
+     class: 'integer', Number of times a failed request (connection error, timeout, or HTTP status
+                       429, 500, 502, 503, 504) is sent again before the error is raised. Default is 4.
+
+    backoff_s, backoff_max_s
+     class: 'float', Base and maximum seconds to wait before sending a failed request again. The wait
+                     doubles after every attempt and is randomized (jitter). Default is 0.5 and 30.
+    '''
+
+    global acis_url, timeout, max_connections, rate_limit, rate_burst, retries, backoff, backoff_max
+    global rate_limiter
+
+    if url is not None: acis_url = url.rstrip('/')
+    if timeout_s is not None: timeout = timeout_s
+    if max_conn is not None: max_connections = max_conn
+    if rate is not None: rate_limit = rate
+    if burst is not None: rate_burst = burst
+    if n_retries is not None: retries = n_retries
+    if backoff_s is not None: backoff = backoff_s
+    if backoff_max_s is not None: backoff_max = backoff_max_s
+
+    rate_limiter = TokenBucket(rate_limit,rate_burst)
+
+    with pools_lock:
+     for pool in pools.values():
+      pool.close()
+     pools.clear()
+
+#######################################################################################################
+#
+# RATE LIMITING
+#
+#######################################################################################################
+
+class TokenBucket:
+
+    '''
+    Token bucket shared by all threads. Each request takes one token, tokens are refilled at 'rate'
+    per second up to 'burst' tokens, and a request waits if no token is left.
+
+    Parameters
+    -------------
+    rate
+     class: 'float', Tokens added per second. If 0, requests never wait.
+
+    burst
+     class: 'integer', Maximum number of tokens in the bucket.
+    '''
+
+    def __init__(self, rate: float, burst: int):
+        self.rate, self.burst = rate, max(1,burst)
+        self.tokens, self.last = float(self.burst), time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+           return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last)*self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                   self.tokens -= 1
+                   return
+                wait = (1 - self.tokens)/self.rate
+            time.sleep(wait)
+
+rate_limiter = TokenBucket(rate_limit,rate_burst)
+
+#######################################################################################################
+#
+# CONNECTION POOL
+#
+#######################################################################################################
+
+class ConnectionPool:
+
+    '''
+    Keep-alive connections to a single host. Idle connections are reused by the next request and at
+    most 'max_conn' connections are open at the same time, further requests wait for a free one.
+
+    Parameters
+    -------------
+    scheme, host, port
+     class: 'string', 'string', 'integer', Scheme ('http' or 'https'), host name and port of the host.
+
+    max_conn
+     class: 'integer', Maximum number of simultaneous open connections to the host.
+
+    timeout_s
+     class: 'float', Seconds to wait for a connection or a response before the request fails.
+    '''
+
+    def __init__(self, scheme: str, host: str, port: int, max_conn: int, timeout_s: float):
+        self.scheme, self.host, self.port, self.timeout = scheme, host, port, timeout_s
+        self.slots = threading.BoundedSemaphore(max_conn)
+        self.idle = queue.LifoQueue()
+
+    def new_connection(self):
+        if self.scheme == 'https':
+           return http.client.HTTPSConnection(self.host,self.port,timeout=self.timeout)
+        return http.client.HTTPConnection(self.host,self.port,timeout=self.timeout)
+
+    def request(self, method: str, path: str, body: bytes, headers: dict):
+
+        '''
+        Sends one request on an idle or new connection and returns (status, reason, headers, data).
+        A reused connection that was closed by the server in the meantime is replaced by a new one
+        and the request is sent once more.
+        '''
+
+        with self.slots:
+            try:
+                conn, reused = self.idle.get_nowait(), True
+            except queue.Empty:
+                conn, reused = self.new_connection(), False
+            while True:
+                try:
+                    conn.request(method,path,body=body,headers=headers)
+                    resp = conn.getresponse()
+                    data = resp.read()
+                    break
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    conn.close()
+                    if not reused:
+                       raise
+                    conn, reused = self.new_connection(), False
+                except Exception:
+                    conn.close()
+                    raise
+            # Keep connection open for the next request unless the server closes it
+            if resp.will_close:
+               conn.close()
+            else:
+               self.idle.put(conn)
+            return resp.status, resp.reason, resp.headers, data
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+#======================================================================================================
+# Get connection pool for a host, create it if it does not exist yet
+#======================================================================================================
+
+def get_pool(scheme: str, host: str, port: int):
+
+    '''
+    Returns the shared connection pool of a host.
+    '''
+
+    with pools_lock:
+     if (scheme,host,port) not in pools:
+      pools[(scheme,host,port)] = ConnectionPool(scheme,host,port,max_connections,timeout)
+     return pools[(scheme,host,port)]
+
+#######################################################################################################
+#
+# REQUEST FUNCTIONS
+#
+#######################################################################################################
+
+#======================================================================================================
+# Send request to a NOAA ACIS endpoint and return the raw response body
+#======================================================================================================
+
+def acis_request_raw(endpoint: str, params: dict, decompress: bool = True):
+
+    '''
+    Sends the input dictionary 'params' to a NOAA ACIS web service endpoint over a pooled keep-alive
+    connection, asking for a gzip compressed response, and returns the decompressed response body.
+    Every attempt waits for the shared rate limiter first. Connection errors, timeouts, and HTTP 
+    status codes in 'retry_status' are retried up to 'retries' times with exponential backoff and
+    jitter, honoring the 'Retry-After' header if the server sends one.
+
+    Parameters
+    -------------
+    endpoint
+     class: 'string', NOAA ACIS web service. Example: 'StnData', 'MultiStnData', 'StnMeta', 'GridData'
+
+    params
+     class: 'dict', Input dictionary of the query, see https://www.rcc-acis.org/docs_webservices.html
+
+    decompress
+     class: 'bool', If False, the response body is returned as sent by the server, which may still be
+                    gzip compressed. Default is True.
+
+    Returns
+    ---------------------
+    output: class: 'bytes'
+    '''
+
+    url = acis_url+'/'+endpoint
+    parts = urllib.parse.urlsplit(url)
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+
+    body = urllib.parse.urlencode({'params':json.dumps(params)}).encode('utf-8')
+    headers = {'Accept': 'application/json', 'Accept-Encoding': 'gzip',
+               'Content-Type': 'application/x-www-form-urlencoded', 'Connection': 'keep-alive'}
+
+    for attempt in range(retries+1):
+
+     rate_limiter.acquire()
+
+     try:
+      status, reason, resp_headers, data = get_pool(parts.scheme,parts.hostname,port).request(
+                                                                  'POST',parts.path,body,headers)
+     except (OSError, http.client.HTTPException) as e:
+      status, error, retry_after = None, e, None
+
+     if status == 200:
+      break
+     if status is not None:
+      error = urllib.error.HTTPError(url,status,reason,resp_headers,None)
+      retry_after = resp_headers.get('Retry-After')
+
+     if attempt == retries or (status is not None and status not in retry_status):
+      raise error
+
+     # Exponential backoff with full jitter, or wait as long as the server asks
+     wait = random.uniform(0, min(backoff_max, backoff*2**attempt))
+     if retry_after is not None and str(retry_after).isdigit():
+      wait = min(backoff_max, float(retry_after))
+     time.sleep(wait)
+
+    if decompress == True and resp_headers.get('Content-Encoding','') == 'gzip':
+     data = gzip.decompress(data)
+
+    return data
+
+#======================================================================================================
+# Send request to a NOAA ACIS endpoint and return the decoded json response
+#======================================================================================================
+
+def acis_request(endpoint: str, params: dict):
+
+    '''
+    Sends the input dictionary 'params' to a NOAA ACIS web service endpoint and returns the decoded
+    json response. See acis_request_raw().
+
+    Returns
+    ---------------------
+    output: class: 'dict'
+    '''
+
+    return json.loads(acis_request_raw(endpoint,params))
+
+#======================================================================================================
+# Send request to a NOAA ACIS endpoint and return the response text in pieces
+#======================================================================================================
+
+def acis_request_stream(endpoint: str, params: dict, chunk_bytes: int = 65536):
+
+    '''
+    Sends the input dictionary 'params' to a NOAA ACIS web service endpoint and yields the response
+    text in pieces. Only the gzip compressed body is held in memory, it is decompressed and decoded
+    'chunk_bytes' at a time so the full json text never exists at once. See acis_request_raw().
+
+    Parameters
+    -------------
+    chunk_bytes
+     class: 'integer', Number of compressed bytes decompressed per piece. Default is 65536.
+
+    Returns
+    ---------------------
+    output: class: 'generator', Yields 'string' pieces of the json response.
+    '''
+
+    data = acis_request_raw(endpoint,params,decompress=False)
+
+    decoder = codecs.getincrementaldecoder('utf-8')()
+
+    # Body was not compressed by the server, decode it as is
+    if data[:2] != b'\x1f\x8b':
+     for i in range(0,len(data),chunk_bytes):
+      yield decoder.decode(data[i:i+chunk_bytes])
+     yield decoder.decode(b'',final=True)
+     return
+
+    # Decompress gzip body piece by piece, limiting the size of each decompressed piece
+    unzip = zlib.decompressobj(16+zlib.MAX_WBITS)
+    for i in range(0,len(data),chunk_bytes):
+     piece = unzip.decompress(data[i:i+chunk_bytes],chunk_bytes*8)
+     yield decoder.decode(piece)
+     while unzip.unconsumed_tail:
+      piece = unzip.decompress(unzip.unconsumed_tail,chunk_bytes*8)
+      yield decoder.decode(piece)
+    yield decoder.decode(unzip.flush(),final=True)
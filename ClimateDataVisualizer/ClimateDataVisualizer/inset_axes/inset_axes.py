@@ -10,6 +10,7 @@ import matplotlib as mpl
 from matplotlib.patches import Rectangle
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
 import cartopy, cartopy.mpl.geoaxes, cartopy.io.img_tiles
+from ClimateDataVisualizer.dataquery.NOAA_ACIS_stnmatrix import StationSegments, StationMonthly
 
 #======================================================================================================
 # Plot inset map on main figure 
@@ -40,7 +41,7 @@ def inset_map(ax: mpl.axes.Axes, meta: pd.DataFrame, var: pd.DataFrame, width: f
 
    var
     class: pandas.DataFrame', Pandas DataFrame from stndata function. Must contain 'Date' at 
-                              left-most column.
+                              left-most column. 'StationSegments' are also accepted.
 
    width, height
     class: 'float', Size of the inset map axes in inches. Can also be string in relative units, 
@@ -107,8 +108,11 @@ def inset_map(ax: mpl.axes.Axes, meta: pd.DataFrame, var: pd.DataFrame, width: f
    axm.add_feature(cartopy.feature.COASTLINE,edgecolor='k',linewidths=0.5)
 
    # Plot sites and overlay iyr if specified
-   sids_iyr = list(var.iloc[:,1:].loc[var['Date'].dt.year == iyr].columns[var.iloc[:,1:].loc[
-                   var['Date'].dt.year == iyr].notna().any()].str.split(':').str[0])
+   if isinstance(var, (StationSegments, StationMonthly)):
+      sids_iyr = var.sids_with_data(var['Date'].dt.year.values == iyr)
+   else:
+      sids_iyr = list(var.iloc[:,1:].loc[var['Date'].dt.year == iyr].columns[var.iloc[:,1:].loc[
+                      var['Date'].dt.year == iyr].notna().any()].str.split(':').str[0])
    axm.plot(meta['lon'],meta['lat'],'.',markersize=markersize,c=markercolor)
    if incl_year == True:
       axm.plot(meta['lon'].loc[meta['sids'].isin(sids_iyr)],meta['lat'].loc[meta['sids'].isin(sids_iyr)],
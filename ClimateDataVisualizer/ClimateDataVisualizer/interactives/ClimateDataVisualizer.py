@@ -16,10 +16,13 @@ import cartopy, cartopy.mpl.geoaxes, cartopy.io.img_tiles
 import ipyleaflet as ipyl     
 from ClimateDataVisualizer.dataquery import NOAA_ACIS_stnmeta as stnmeta
 from ClimateDataVisualizer.dataquery import NOAA_ACIS_stndata as stndata
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_catalog as stncatalog
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_jobs as stnjobs
 from ClimateDataVisualizer.processing.bbox_dy import bbox_avg_dy
 from ClimateDataVisualizer.inset_axes.inset_axes import inset_map, inset_timeseries
 from ClimateDataVisualizer.interactives import plots, widgets
 import ipywidgets as ipyw # must be below v7.7
+from IPython import get_ipython
 from IPython.display import display, HTML, clear_output, Javascript
 
 # URLs, needs double quotes based on code below
@@ -28,7 +31,7 @@ url_how = "https://sites.google.com/view/ajtclimate/climate-data-viz/how-to-use-
 # File paths
 cdv = '/paleonas/ajthompson/pyscripts/ClimateDataVisualizer/'
 
-def widget_single_variable(enable_js: bool=True, stn_size: int=1000):
+def widget_single_variable(enable_js: bool=True, target_days: int=500000, max_days: int=100000000):
 
    ####################################################################################################
    # Generate map and input features 
@@ -110,6 +113,12 @@ def widget_single_variable(enable_js: bool=True, stn_size: int=1000):
                               tooltip='Click here to start querying data!',
                               style={'description_width': 'initial'},layout=ipyw.Layout(width='220px'))
    query_output = ipyw.Output()
+
+   # Progress of the running query and button to cancel it, the stations queried so far are shown
+   query_progress = ipyw.IntProgress(value=0,min=0,max=100,layout=ipyw.Layout(width='350px'))
+   query_status = ipyw.Label()
+   cancel_button = ipyw.Button(description='Cancel query',tooltip='Click here to stop the running '+
+                               'and queued queries',layout=ipyw.Layout(width='120px'))
  
    ####################################################################################################
    # Upon click, transfer rectangle's lat/lon from map to query prompts
@@ -134,13 +143,8 @@ def widget_single_variable(enable_js: bool=True, stn_size: int=1000):
        for layer in m.layers:
            if isinstance(layer,ipyl.LayerGroup): 
               m.remove_layer(layer)
-       # Read in data and process it 
-       meta = pd.read_csv(f'{cdv}Extras/Metadata/{var_dpdn.value}.csv')
-       stns = pd.DataFrame({'stn': meta.apply(lambda row: f"{row['sids']}: {row['name']}, {row['state']} "+
-                             f"({row['sids_type']})\n{var_dpdn.value}: {row['sdate']}, {row['edate']}\n"
-                             f"(lat) {row['lat']} (lon) {row['lon']}",axis=1),
-                            'lat': meta['lat'],'lon': meta['lon'], 
-                            'sdate': pd.to_datetime(meta['sdate']),'edate': pd.to_datetime(meta['edate'])})
+       # Station catalog is read once and kept in memory with a spatial and date index
+       catalog = stncatalog.get_catalog(var_dpdn.value,cdv+'Extras/Metadata')
        # Set nlat.value, etc. as the drawn rectangle's coordinates                              
        try: 
            nlat_val = round(m.controls[2].data[0]['geometry']['coordinates'][0][1][1],3)
@@ -149,21 +153,14 @@ def widget_single_variable(enable_js: bool=True, stn_size: int=1000):
            elon_val = round(m.controls[2].data[0]['geometry']['coordinates'][0][2][0],3)
        except IndexError:
            print('No rectangle drawn yet. Use toolbar to the left to select rectangle.')
-       # Filter by lat/lon
-       bbox_stns = stns[(stns['lat'] >= (slat_val - 0.5)) & (stns['lat'] <= (nlat_val + 0.5)) & 
-                        (stns['lon'] >= (wlon_val - 1)) & (stns['lon'] <= (elon_val + 1))   ]
-       # Apply sdate/edate filter if entered by user
-       sftr = pd.to_datetime(stn_button_ftr1.value) if stn_button_ftr1.value else None
-       eftr = pd.to_datetime(stn_button_ftr2.value) if stn_button_ftr2.value else None
-       if sftr is not None and eftr is not None:
-          bbox_stns = bbox_stns[(bbox_stns['sdate'] <= sftr) & (bbox_stns['edate'] >= eftr)]
-       elif sftr is not None: 
-          bbox_stns = bbox_stns[bbox_stns['edate'] >= eftr]
-       elif eftr is not None:
-          bbox_stns = bbox_stns[bbox_stns['sdate'] <= sftr]
-       # Add markers based on metadata
+       # Filter by lat/lon and by sdate/edate if entered by user, stations must have data from sdate to edate
+       sftr = stn_button_ftr1.value if stn_button_ftr1.value else None
+       eftr = stn_button_ftr2.value if stn_button_ftr2.value else None
+       rows = catalog.query(slat=slat_val-0.5,nlat=nlat_val+0.5,wlon=wlon_val-1,elon=elon_val+1,
+                            sdate=sftr,edate=eftr)
+       # Add markers based on metadata, tooltips are only made for the stations in the box
        markers = []
-       for name, lat, lon in bbox_stns[['stn','lat','lon']].iloc[:,:].values:
+       for name, lat, lon in zip(catalog.tooltips(rows),catalog.lat[rows],catalog.lon[rows]):
            markers.append(ipyl.Marker(location=(lat,lon),draggable=False,title=name,alt=name))
        m.add_layer(ipyl.LayerGroup(layers=markers))
 
@@ -171,16 +168,84 @@ def widget_single_variable(enable_js: bool=True, stn_size: int=1000):
    # Upon click, interactive query will be activated         
    ####################################################################################################
 
+   # Stations of every variable from the last queried region
+   queried = {'bbox': None, 'elems': {}}
+
+   # Queries run in the background one region at a time, in the order they were submitted, so the page
+   # shows their progress and can cancel them
+   jobs = stnjobs.JobQueue()
+
+   # Output widgets only capture reliably from the kernel thread, so functions building widgets are
+   # handed to the kernel's event loop (called right away outside a kernel)
+   def on_kernel_thread(func, *args):
+       kernel = getattr(get_ipython(),'kernel',None)
+       io_loop = getattr(kernel,'io_loop',None)
+       if io_loop is None:
+           func(*args)
+       else:
+           io_loop.add_callback(func,*args)
+
    def on_query_button_clicked(event):
+       bbox = (nlat.value,slat.value,wlon.value,elon.value)
+       # Switching variables for the same region is served from the previous query
+       if queried['bbox'] == bbox:
+           show_query(queried['elems'])
+           return
+       # Query data of every variable at once, large regions are split into requests of about
+       # 'target_days' daily values and limited to 'max_days' daily values in total
+       ahead = len(jobs.queued()) + len(jobs.running)
+       elems = tuple(v for _, v in var_dpdn.options)
+       # Station metadata is read from the station catalogs once current ones are built, until then
+       # it is queried from NOAA ACIS
+       meta_source = 'auto' if all(stncatalog.is_current(elem) for elem in elems) else 'live'
+       job = jobs.submit(stndata.bbox_multielem_daily,name=location_name.value or 'Query',
+                         listener=lambda job: on_job_event(job,bbox),
+                         elems=elems,nlat=nlat.value,slat=slat.value,
+                         wlon=wlon.value,elon=elon.value,print_results=False,print_md=False,
+                         target_days=target_days,max_days=max_days,use_cache=True,sparse=True,
+                         meta_source=meta_source)
+       if ahead > 0:
+           query_status.value = job.status()+' ('+str(ahead)+' ahead)'
+
+   def on_job_event(job, bbox):
+       # Called from the thread running the query, which only publishes progress and state, the results
+       # are shown from the kernel thread
+       query_progress.value = int(round(100*job.fraction))
+       query_status.value = job.status()
+       if job.state in ('done','cancelled','failed'):
+           on_kernel_thread(on_job_finished,job,bbox)
+
+   def on_job_finished(job, bbox):
+       if job.state == 'done':
+           queried['bbox'], queried['elems'] = bbox, job.result
+           show_query(job.result)
+       # Partial results of a cancelled query are shown but not kept, the region is queried again on
+       # the next submit
+       if job.state == 'cancelled' and job.result is not None:
+           show_query(job.result)
+       if job.state == 'failed':
+           with query_output:
+               clear_output()
+               if isinstance(job.error,SystemExit):
+                   print(f'Bounding box has more than maximum ({max_days}) number of daily values. '+
+                          'Choose smaller bounding box.')
+               else:
+                   print('ERROR: Query failed ('+type(job.error).__name__+': '+str(job.error)+'). Try again.')
+
+   def on_cancel_button_clicked(event):
+       jobs.cancel_all()
+
+   def show_query(elems):
        with query_output:
            clear_output()
-           # Query data
            try:
-               var, meta = stndata.bbox_multistn_daily(elem=var_dpdn.value,nlat=nlat.value,slat=slat.value,
-                                                       wlon=wlon.value,elon=elon.value,print_md=False, 
-                                                       stn_size=stn_size)
-           except TypeError:
+               stnseg, meta = elems[var_dpdn.value]
+               # Stations with mostly disjoint periods of record are kept as segments, which widgets and
+               # plots reduce without densifying, otherwise they read a float32 station matrix view
+               var = stnseg if stnseg.density < 0.5 else stnseg.to_matrix().frame()
+           except (TypeError, KeyError):
                print('No stations in bounding box. Try again.')
+               return
            
            # Choose which widgets to employ based on variable
            if var_dpdn.value == 'maxt':
@@ -289,7 +354,9 @@ def widget_single_variable(enable_js: bool=True, stn_size: int=1000):
    coord_button.on_click(on_coord_button_clicked)
    stn_button.on_click(on_stn_button_clicked)
    query_button.on_click(on_query_button_clicked)
-   submit_box = ipyw.VBox([query_button,query_output],layout=ipyw.Layout(align_items='center'))
+   cancel_button.on_click(on_cancel_button_clicked)
+   submit_box = ipyw.VBox([query_button,ipyw.HBox([query_progress,cancel_button]),query_status,query_output],
+                          layout=ipyw.Layout(align_items='center'))
    page1 = ipyw.VBox([ipyw.VBox([image_header]),
                       ipyw.VBox([txt_link],layout=ipyw.Layout(align_items='center')),
                       ipyw.VBox([txt_var,var_dpdn],layout=ipyw.Layout(align_items='center')),
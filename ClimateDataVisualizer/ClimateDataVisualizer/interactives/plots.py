@@ -20,8 +20,12 @@ import geocat.viz.util as gv
 import urllib, json, cmaps, math
 from ClimateDataVisualizer.dataquery import NOAA_ACIS_stnmeta as stnmeta
 from ClimateDataVisualizer.dataquery import NOAA_ACIS_stndata as stndata
-from ClimateDataVisualizer.processing.bbox_dy import bbox_avg_dy
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_transport as transport
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_stream as stream
+from ClimateDataVisualizer.dataquery.NOAA_ACIS_stnmatrix import StationSegments, StationMonthly
+from ClimateDataVisualizer.processing.bbox_dy import bbox_avg_dy, bbox_filter_dy
 from ClimateDataVisualizer.processing.bbox_my import bbox_avg_my, bbox_max_my, bbox_min_my
+from ClimateDataVisualizer.processing.bbox_climatology import climatology_cube
 from ClimateDataVisualizer.inset_axes.inset_axes import inset_map, inset_timeseries
 import warnings
 
@@ -47,12 +51,10 @@ def annualcycle_tmax_plot(var,meta,location_name,nlat,slat,wlon,elon,syr,eyr,num
     leapyears = [1800 + i * 4 for i in range((2100 - 1800) // 4 + 1)]
     isleap = False if iyr not in leapyears else True
 
-    # Apply NaN filter to the dataframe based on minimum number of stations collecting data on a given day
-    var_filt = var.copy()
-    var_filt.loc[var_filt.iloc[:,1:].count(axis=1) < num_stn, var_filt.columns[1:]] = np.nan
-
-    # Create dataframe of every day of the every year
-    var_dy = bbox_avg_dy(var_filt,leap=isleap)
+    # Days with fewer than num_stn stations collecting data are filtered out and the dataframe of every
+    # day of every year is created once per query, num_stn and leap, other parameters reuse it
+    cube = climatology_cube(var,num_stn,isleap)
+    var_dy = cube.frame
 
     ############################################################################################################# 
     # Auto-select dates based on parameters 
@@ -60,17 +62,14 @@ def annualcycle_tmax_plot(var,meta,location_name,nlat,slat,wlon,elon,syr,eyr,num
 
     # If earliest, take earliest year with data
     if syr == 'earliest':
-        try:
-           syr = int(np.min(var_dy.dropna(axis=1,how='all').columns[2:]))
-        except:
+        if cube.earliest() is None:
            print('ERROR: There are no years with this many stations collecting data simultaneously.')
+        else:
+           syr = cube.earliest()
 
     # If latest, take latest year (but not this year) with fewer than 365 NaN values   
-    if eyr == 'latest':
-        for c in range(2,len(var_dy)+1):
-            if var_dy[var_dy.columns[-c]].isna().sum() < 365:
-                eyr = int(var_dy.columns[-c])
-                break
+    if eyr == 'latest' and cube.latest() is not None:
+        eyr = cube.latest()
 
     # Define back-end plotting year based on whether current year is a leap year or not
     plt_yr = 2020 if iyr in leapyears else 2022
@@ -90,21 +89,8 @@ def annualcycle_tmax_plot(var,meta,location_name,nlat,slat,wlon,elon,syr,eyr,num
 
     if incl_hist == True:
 
-        # MEAN
-        var_avg = np.nanmean(var_dy.iloc[:,var_dy.columns.get_loc(str(syr)):\
-                                          var_dy.columns.get_loc(str(eyr))+1],axis=1)
-
-        # 5th and 95th percentiles
-        var_05 = np.nanpercentile(var_dy.iloc[:,var_dy.columns.get_loc(str(syr)):\
-                                                var_dy.columns.get_loc(str(eyr))+1],5,axis=1)
-        var_95 = np.nanpercentile(var_dy.iloc[:,var_dy.columns.get_loc(str(syr)):\
-                                                var_dy.columns.get_loc(str(eyr))+1],95,axis=1)
-
-        # Min and Max
-        var_min = np.nanmin(var_dy.iloc[:,var_dy.columns.get_loc(str(syr)):\
-                                                var_dy.columns.get_loc(str(eyr))+1],axis=1)
-        var_max = np.nanmax(var_dy.iloc[:,var_dy.columns.get_loc(str(syr)):\
-                                                var_dy.columns.get_loc(str(eyr))+1],axis=1)
+        # Max, 95th percentile, mean, 5th percentile and min, computed once per historical period
+        var_max, var_95, var_avg, var_05, var_min = cube.stats(syr,eyr)
 
         # Plot historical data
         ax.plot(xtime,var_avg,'-',c='k',lw=1.5,alpha=0.5,zorder=100)
@@ -201,7 +187,8 @@ def annualcycle_tmax_plot(var,meta,location_name,nlat,slat,wlon,elon,syr,eyr,num
     ax.set_ylim([np.nanmin(var_min)-minbuff,np.nanmax(var_max)+maxbuff]);
     ax.spines[['right','top']].set_visible(False)
 
-    return fig, var_dy, var_max, var_95, var_avg, var_05, var_min
+    # The climatology is cached for later renders, callers get copies they can change
+    return fig, var_dy.copy(), var_max.copy(), var_95.copy(), var_avg.copy(), var_05.copy(), var_min.copy()
 
 #================================================================================================================
 # annualcycle_tmin_plot
@@ -219,12 +206,10 @@ def annualcycle_tmin_plot(var,meta,location_name,nlat,slat,wlon,elon,syr,eyr,num
     leapyears = [1800 + i * 4 for i in range((2100 - 1800) // 4 + 1)]
     isleap = False if iyr not in leapyears else True
 
-    # Apply NaN filter to the dataframe based on minimum number of stations collecting data on a given day
-    var_filt = var.copy()
-    var_filt.loc[var_filt.iloc[:,1:].count(axis=1) < num_stn, var_filt.columns[1:]] = np.nan
-
-    # Create dataframe of every day of the every year
-    var_dy = bbox_avg_dy(var_filt,leap=isleap)
+    # Days with fewer than num_stn stations collecting data are filtered out and the dataframe of every
+    # day of every year is created once per query, num_stn and leap, other parameters reuse it
+    cube = climatology_cube(var,num_stn,isleap)
+    var_dy = cube.frame
 
     ############################################################################################################# 
     # Auto-select dates based on parameters 
@@ -232,17 +217,14 @@ def annualcycle_tmin_plot(var,meta,location_name,nlat,slat,wlon,elon,syr,eyr,num
 
     # If earliest, take earliest year with data
     if syr == 'earliest':
-        try:
-           syr = int(np.min(var_dy.dropna(axis=1,how='all').columns[2:]))
-        except:
+        if cube.earliest() is None:
            print('ERROR: There are no years with this many stations collecting data simultaneously.')
+        else:
+           syr = cube.earliest()
 
     # If latest, take latest year (but not this year) with fewer than 365 NaN values   
-    if eyr == 'latest':
-        for c in range(2,len(var_dy)+1):
-            if var_dy[var_dy.columns[-c]].isna().sum() < 365:
-                eyr = int(var_dy.columns[-c])
-                break
+    if eyr == 'latest' and cube.latest() is not None:
+        eyr = cube.latest()
 
     # Define back-end plotting year based on whether current year is a leap year or not
     plt_yr = 2020 if iyr in leapyears else 2022
@@ -262,21 +244,8 @@ def annualcycle_tmin_plot(var,meta,location_name,nlat,slat,wlon,elon,syr,eyr,num
 
     if incl_hist == True:
 
-        # MEAN
-        var_avg = np.nanmean(var_dy.iloc[:,var_dy.columns.get_loc(str(syr)):\
-                                          var_dy.columns.get_loc(str(eyr))+1],axis=1)
-
-        # 5th and 95th percentiles
-        var_05 = np.nanpercentile(var_dy.iloc[:,var_dy.columns.get_loc(str(syr)):\
-                                                var_dy.columns.get_loc(str(eyr))+1],5,axis=1)
-        var_95 = np.nanpercentile(var_dy.iloc[:,var_dy.columns.get_loc(str(syr)):\
-                                                var_dy.columns.get_loc(str(eyr))+1],95,axis=1)
-
-        # Min and Max
-        var_min = np.nanmin(var_dy.iloc[:,var_dy.columns.get_loc(str(syr)):\
-                                                var_dy.columns.get_loc(str(eyr))+1],axis=1)
-        var_max = np.nanmax(var_dy.iloc[:,var_dy.columns.get_loc(str(syr)):\
-                                                var_dy.columns.get_loc(str(eyr))+1],axis=1)
+        # Max, 95th percentile, mean, 5th percentile and min, computed once per historical period
+        var_max, var_95, var_avg, var_05, var_min = cube.stats(syr,eyr)
 
         # Plot historical data
         ax.plot(xtime,var_avg,'-',c='k',lw=1.5,alpha=0.5,zorder=100)
@@ -373,7 +342,8 @@ def annualcycle_tmin_plot(var,meta,location_name,nlat,slat,wlon,elon,syr,eyr,num
     ax.set_ylim([np.nanmin(var_min)-minbuff,np.nanmax(var_max)+maxbuff]);
     ax.spines[['right','top']].set_visible(False)
 
-    return fig, var_dy, var_max, var_95, var_avg, var_05, var_min
+    # The climatology is cached for later renders, callers get copies they can change
+    return fig, var_dy.copy(), var_max.copy(), var_95.copy(), var_avg.copy(), var_05.copy(), var_min.copy()
 
 #================================================================================================================
 # annualcycle_rain_plot
@@ -392,18 +362,20 @@ def annualcycle_pcpn_plot(var,meta,location_name,nlat,slat,wlon,elon,rain_type,n
     isleap = False if iyr not in leapyears else True
 
     # Apply NaN filter to the dataframe based on minimum number of stations collecting data on a given day
-    var_filt = var.copy()
-    var_filt.loc[var_filt.iloc[:,1:].count(axis=1) < num_stn, var_filt.columns[1:]] = np.nan
+    var_filt = bbox_filter_dy(var,num_stn)
 
     # Average by day and year
     if rain_type == 'all' :
         var_dy = bbox_avg_dy(var_filt,leap=isleap)
     elif rain_type == 'rain' or rain_type == 'wetNday':
         # Set 0.'s and trace values to NaN (need to remove 'Date' column to do this)
-        var_filt_raindays = var_filt[[col for col in var_filt.columns if col != 'Date']].applymap(
-                                             lambda x: x if x > 0.00001 else np.nan)
-        # Add 'Date' column back 
-        var_filt_raindays['Date'] = var_filt['Date']
+        if isinstance(var_filt, StationSegments):
+            var_filt_raindays = var_filt.keep_above(0.00001)
+        else:
+            var_filt_raindays = var_filt[[col for col in var_filt.columns if col != 'Date']].applymap(
+                                                 lambda x: x if x > 0.00001 else np.nan)
+            # Add 'Date' column back 
+            var_filt_raindays['Date'] = var_filt['Date']
         var_dy = bbox_avg_dy(var_filt_raindays,leap=isleap)
 
     ###################################################################################################
@@ -612,18 +584,20 @@ def annualcycle_snow_plot(var,meta,location_name,nlat,slat,wlon,elon,snow_type,n
     isleap = False if iyr not in leapyears else True
 
     # Apply NaN filter to the dataframe based on minimum number of stations collecting data on a given day
-    var_filt = var.copy()
-    var_filt.loc[var_filt.iloc[:,1:].count(axis=1) < num_stn, var_filt.columns[1:]] = np.nan
+    var_filt = bbox_filter_dy(var,num_stn)
 
     # Average by day and year
     if snow_type == 'all' :
         var_dy = bbox_avg_dy(var_filt,leap=isleap)
     elif snow_type == 'snow' or snow_type == 'wetNday':
         # Set 0.'s and trace values to NaN (need to remove 'Date' column to do this)
-        var_filt_snowdays = var_filt[[col for col in var_filt.columns if col != 'Date']].applymap(
-                                             lambda x: x if x > 0.00001 else np.nan)
-        # Add 'Date' column back 
-        var_filt_snowdays['Date'] = var_filt['Date']
+        if isinstance(var_filt, StationSegments):
+            var_filt_snowdays = var_filt.keep_above(0.00001)
+        else:
+            var_filt_snowdays = var_filt[[col for col in var_filt.columns if col != 'Date']].applymap(
+                                                 lambda x: x if x > 0.00001 else np.nan)
+            # Add 'Date' column back 
+            var_filt_snowdays['Date'] = var_filt['Date']
         var_dy = bbox_avg_dy(var_filt_snowdays,leap=isleap)
 
     ###################################################################################################
@@ -1177,20 +1151,24 @@ def timeseries_tmax_plot(var,meta,location_name,nlat,slat,wlon,elon,month1,month
     #############################################################################################################
     
     # Mask var based on data quality standards (num_days, num_mons, num_stns)
-    var_filt = var.copy()
-    
-    # Add 'Year' and 'Month' to filter
-    if 'Year' not in var_filt.columns and 'Month' not in var_filt.columns:
-        var_filt.insert(0,'Year',var_filt['Date'].dt.year),var_filt.insert(1,'Month',var_filt['Date'].dt.month)  
-        
-    months_that_pass = var_filt.groupby(['Year','Month']).apply(lambda x: x.iloc[:,3:].count()) >= num_days
+    # Count days with data for every station and month, grouping by 'Year' and 'Month' without copying var
+    if isinstance(var, (StationSegments, StationMonthly)):
+        months_that_pass = var.monthly_count() >= num_days
+    else:
+        months_that_pass = var.iloc[:,1:].groupby([var['Date'].dt.year.rename('Year'),
+                                                   var['Date'].dt.month.rename('Month')]).count() >= num_days
     years_that_pass = months_that_pass.groupby(level='Year').sum() >= num_mons
     stns_that_pass = years_that_pass.sum(axis=1) >= num_stns
     
     # Apply data quality standards to year's average value
-    var_mask = var.copy()
-    var_mask.loc[var_mask['Date'].dt.year.isin(list(stns_that_pass[stns_that_pass == False].index)),:] = np.nan
-    var_mask['Date'] = var['Date']
+    # Only copy var if some years are filtered out, 'Date' is kept
+    fail_yrs = var['Date'].dt.year.isin(list(stns_that_pass[stns_that_pass == False].index))
+    var_mask = var
+    if fail_yrs.any() and isinstance(var, (StationSegments, StationMonthly)):
+        var_mask = var.mask_days(fail_yrs.values)
+    elif fail_yrs.any():
+        var_mask = var.copy()
+        var_mask.loc[fail_yrs, var_mask.columns[1:]] = np.nan
     
     # Find bbox's max, min, or mean for each month and apply months to processed variable
     if method == 'max':
@@ -1338,20 +1316,24 @@ def timeseries_tmin_plot(var,meta,location_name,nlat,slat,wlon,elon,month1,month
     #############################################################################################################
 
     # Mask var based on data quality standards (num_days, num_mons, num_stns)
-    var_filt = var.copy()
-
-    # Add 'Year' and 'Month' to filter
-    if 'Year' not in var_filt.columns and 'Month' not in var_filt.columns:
-        var_filt.insert(0,'Year',var_filt['Date'].dt.year),var_filt.insert(1,'Month',var_filt['Date'].dt.month)
-
-    months_that_pass = var_filt.groupby(['Year','Month']).apply(lambda x: x.iloc[:,3:].count()) >= num_days
+    # Count days with data for every station and month, grouping by 'Year' and 'Month' without copying var
+    if isinstance(var, (StationSegments, StationMonthly)):
+        months_that_pass = var.monthly_count() >= num_days
+    else:
+        months_that_pass = var.iloc[:,1:].groupby([var['Date'].dt.year.rename('Year'),
+                                                   var['Date'].dt.month.rename('Month')]).count() >= num_days
     years_that_pass = months_that_pass.groupby(level='Year').sum() >= num_mons
     stns_that_pass = years_that_pass.sum(axis=1) >= num_stns
 
     # Apply data quality standards to year's average value
-    var_mask = var.copy()
-    var_mask.loc[var_mask['Date'].dt.year.isin(list(stns_that_pass[stns_that_pass == False].index)),:] = np.nan
-    var_mask['Date'] = var['Date']
+    # Only copy var if some years are filtered out, 'Date' is kept
+    fail_yrs = var['Date'].dt.year.isin(list(stns_that_pass[stns_that_pass == False].index))
+    var_mask = var
+    if fail_yrs.any() and isinstance(var, (StationSegments, StationMonthly)):
+        var_mask = var.mask_days(fail_yrs.values)
+    elif fail_yrs.any():
+        var_mask = var.copy()
+        var_mask.loc[fail_yrs, var_mask.columns[1:]] = np.nan
 
     # Find bbox's max, min, or mean for each month and apply months to processed variable
     if method == 'max':
@@ -1499,20 +1481,24 @@ def timeseries_pcpn_plot(var,meta,location_name,nlat,slat,wlon,elon,month1,month
     #############################################################################################################
 
     # Mask var based on data quality standards (num_days, num_mons, num_stns)
-    var_filt = var.copy()
-
-    # Add 'Year' and 'Month' to filter
-    if 'Year' not in var_filt.columns and 'Month' not in var_filt.columns:
-        var_filt.insert(0,'Year',var_filt['Date'].dt.year),var_filt.insert(1,'Month',var_filt['Date'].dt.month)
-
-    months_that_pass = var_filt.groupby(['Year','Month']).apply(lambda x: x.iloc[:,3:].count()) >= num_days
+    # Count days with data for every station and month, grouping by 'Year' and 'Month' without copying var
+    if isinstance(var, (StationSegments, StationMonthly)):
+        months_that_pass = var.monthly_count() >= num_days
+    else:
+        months_that_pass = var.iloc[:,1:].groupby([var['Date'].dt.year.rename('Year'),
+                                                   var['Date'].dt.month.rename('Month')]).count() >= num_days
     years_that_pass = months_that_pass.groupby(level='Year').sum() >= num_mons
     stns_that_pass = years_that_pass.sum(axis=1) >= num_stns
 
     # Apply data quality standards to year's average value
-    var_mask = var.copy()
-    var_mask.loc[var_mask['Date'].dt.year.isin(list(stns_that_pass[stns_that_pass == False].index)),:] = np.nan
-    var_mask['Date'] = var['Date']
+    # Only copy var if some years are filtered out, 'Date' is kept
+    fail_yrs = var['Date'].dt.year.isin(list(stns_that_pass[stns_that_pass == False].index))
+    var_mask = var
+    if fail_yrs.any() and isinstance(var, (StationSegments, StationMonthly)):
+        var_mask = var.mask_days(fail_yrs.values)
+    elif fail_yrs.any():
+        var_mask = var.copy()
+        var_mask.loc[fail_yrs, var_mask.columns[1:]] = np.nan
 
     # dataframe is masked by this line, next lines are to decide which method to use
 
@@ -1534,9 +1520,12 @@ def timeseries_pcpn_plot(var,meta,location_name,nlat,slat,wlon,elon,month1,month
     if method == 'alldays-mean':  # first part
         var_my = bbox_avg_my(var_mask)
     if method == 'raindays-mean': # first part
-        var_mask_raindays = var_mask[[col for col in var_mask.columns if col != 'Date']].applymap(
-                             lambda x: x if x > 0.00001 else np.nan) # set 0.'s and trace vals to NaN
-        var_mask_raindays['Date'] = var_mask['Date'] # add 'Date' back in for bbox_avg_my
+        if isinstance(var_mask, StationSegments):
+            var_mask_raindays = var_mask.keep_above(0.00001) # set 0.'s and trace vals to NaN
+        else:
+            var_mask_raindays = var_mask[[col for col in var_mask.columns if col != 'Date']].applymap(
+                                 lambda x: x if x > 0.00001 else np.nan) # set 0.'s and trace vals to NaN
+            var_mask_raindays['Date'] = var_mask['Date'] # add 'Date' back in for bbox_avg_my
         var_my = bbox_avg_my(var_mask_raindays)
         
     if method == 'alldays-mean' or method == 'raindays-mean': # second part
@@ -1673,20 +1662,24 @@ def timeseries_snow_plot(var,meta,location_name,nlat,slat,wlon,elon,month1,month
     #############################################################################################################
 
     # Mask var based on data quality standards (num_days, num_mons, num_stns)
-    var_filt = var.copy()
-
-    # Add 'Year' and 'Month' to filter
-    if 'Year' not in var_filt.columns and 'Month' not in var_filt.columns:
-        var_filt.insert(0,'Year',var_filt['Date'].dt.year),var_filt.insert(1,'Month',var_filt['Date'].dt.month)
-
-    months_that_pass = var_filt.groupby(['Year','Month']).apply(lambda x: x.iloc[:,3:].count()) >= num_days
+    # Count days with data for every station and month, grouping by 'Year' and 'Month' without copying var
+    if isinstance(var, (StationSegments, StationMonthly)):
+        months_that_pass = var.monthly_count() >= num_days
+    else:
+        months_that_pass = var.iloc[:,1:].groupby([var['Date'].dt.year.rename('Year'),
+                                                   var['Date'].dt.month.rename('Month')]).count() >= num_days
     years_that_pass = months_that_pass.groupby(level='Year').sum() >= num_mons
     stns_that_pass = years_that_pass.sum(axis=1) >= num_stns
 
     # Apply data quality standards to year's average value
-    var_mask = var.copy()
-    var_mask.loc[var_mask['Date'].dt.year.isin(list(stns_that_pass[stns_that_pass == False].index)),:] = np.nan
-    var_mask['Date'] = var['Date']
+    # Only copy var if some years are filtered out, 'Date' is kept
+    fail_yrs = var['Date'].dt.year.isin(list(stns_that_pass[stns_that_pass == False].index))
+    var_mask = var
+    if fail_yrs.any() and isinstance(var, (StationSegments, StationMonthly)):
+        var_mask = var.mask_days(fail_yrs.values)
+    elif fail_yrs.any():
+        var_mask = var.copy()
+        var_mask.loc[fail_yrs, var_mask.columns[1:]] = np.nan
 
     # dataframe is masked by this line, next lines are to decide which method to use
 
@@ -1708,9 +1701,12 @@ def timeseries_snow_plot(var,meta,location_name,nlat,slat,wlon,elon,month1,month
     if method == 'alldays-mean':  # first part
         var_my = bbox_avg_my(var_mask)
     if method == 'snowdays-mean': # first part
-        var_mask_snowdays = var_mask[[col for col in var_mask.columns if col != 'Date']].applymap(
-                             lambda x: x if x > 0.00001 else np.nan) # set 0.'s and trace vals to NaN
-        var_mask_snowdays['Date'] = var_mask['Date'] # add 'Date' back in for bbox_avg_my
+        if isinstance(var_mask, StationSegments):
+            var_mask_snowdays = var_mask.keep_above(0.00001) # set 0.'s and trace vals to NaN
+        else:
+            var_mask_snowdays = var_mask[[col for col in var_mask.columns if col != 'Date']].applymap(
+                                 lambda x: x if x > 0.00001 else np.nan) # set 0.'s and trace vals to NaN
+            var_mask_snowdays['Date'] = var_mask['Date'] # add 'Date' back in for bbox_avg_my
         var_my = bbox_avg_my(var_mask_snowdays)
         
     if method == 'alldays-mean' or method == 'snowdays-mean': # second part
@@ -1855,12 +1851,11 @@ def spatialmap_tmax_plot(var,meta,location_name,nlat,slat,wlon,elon,timespan,inc
     try: 
         params = {'bbox':[wlon-wlonbuf,slat-slatbuf,elon+elonbuf,nlat+nlatbuf],'sdate':sdate,'edate':edate,
                   'grid':'1','elems':[{'name':'maxt'}],'meta':'ll'} 
-        json_response = urllib.request.urlopen(urllib.request.Request('http://data.rcc-acis.org/GridData',
-                                urllib.parse.urlencode({'params':json.dumps(params)}).encode('utf-8'),
-                                                       {'Accept':'application/json'})).read()
+        # Parse grids while they are being read, straight into a float32 array of (time, lat, lon)
+        raw = stream.parse_griddata(transport.acis_request_stream('GridData',params),
+                                    (pd.Timestamp(edate) - pd.Timestamp(sdate)).days+1)
     except:
         print('Error in choosing date range to query. Check "timespan" and date range input parameters.')
-    raw = json.loads(json_response)
 
     ############################################################################################################# 
     # Process griddata
@@ -1873,18 +1868,15 @@ def spatialmap_tmax_plot(var,meta,location_name,nlat,slat,wlon,elon,timespan,inc
     # Process based on length of days queried
     if timespan == 'Single Day':
         # Only one day is queried
-        griddata = xr.DataArray(np.array(raw['data'][0][1]).flatten().reshape((len(lats),len(lons))),
+        griddata = xr.DataArray(raw['data'][0].reshape((len(lats),len(lons))),
                                 dims=['lat','lon'],coords=dict(lat=lats,lon=lons))
     elif timespan == 'Multiple Days':
         # More than one day is queried
-        date_str = list(dict(raw['data']).keys())                          # finds unique dates as strings
-        times = pd.date_range(start=date_str[0],end=date_str[-1],freq='D') # converts strings to datetime64[ns]
-        datatime = xr.DataArray(None,dims=['time','lat','lon'],coords=dict(time=times,lat=lats,lon=lons)
-                                ).astype(float)
-        for d in range(len(times)): # loops through each queried day
-            datatime[d,:,:] = np.array(raw['data'][d][1]).flatten().reshape((len(lats),len(lons)))
+        # All days are already in one array, reduce over time with float64 accumulation
+        datatime = raw['data'].reshape((len(raw['dates']),len(lats),len(lons)))
         # Stats for multiple days
-            griddata = datatime.mean(dim='time')
+        griddata = xr.DataArray(datatime.mean(axis=0,dtype=np.float64),
+                                dims=['lat','lon'],coords=dict(lat=lats,lon=lons))
 
     # Set missing values and negative values to NaN 
     griddata = griddata.where(griddata != -999, np.nan)
@@ -2018,12 +2010,11 @@ def spatialmap_pcpn_plot(var,meta,location_name,nlat,slat,wlon,elon,timespan,sta
     try: 
         params = {'bbox':[wlon-wlonbuf,slat-slatbuf,elon+elonbuf,nlat+nlatbuf],'sdate':sdate,'edate':edate,
                   'grid':'1','elems':[{'name':'pcpn'}],'meta':'ll'} 
-        json_response = urllib.request.urlopen(urllib.request.Request('http://data.rcc-acis.org/GridData',
-                                urllib.parse.urlencode({'params':json.dumps(params)}).encode('utf-8'),
-                                                       {'Accept':'application/json'})).read()
+        # Parse grids while they are being read, straight into a float32 array of (time, lat, lon)
+        raw = stream.parse_griddata(transport.acis_request_stream('GridData',params),
+                                    (pd.Timestamp(edate) - pd.Timestamp(sdate)).days+1)
     except:
         print('Error in choosing date range to query. Check "timespan" and date range input parameters.')
-    raw = json.loads(json_response)
 
     ############################################################################################################# 
     # Process griddata
@@ -2036,21 +2027,19 @@ def spatialmap_pcpn_plot(var,meta,location_name,nlat,slat,wlon,elon,timespan,sta
     # Process based on length of days queried
     if timespan == 'Single Day':
         # Only one day is queried
-        griddata = xr.DataArray(np.array(raw['data'][0][1]).flatten().reshape((len(lats),len(lons))),
+        griddata = xr.DataArray(raw['data'][0].reshape((len(lats),len(lons))),
                                 dims=['lat','lon'],coords=dict(lat=lats,lon=lons))
     elif timespan == 'Multiple Days':
         # More than one day is queried
-        date_str = list(dict(raw['data']).keys())                          # finds unique dates as strings
-        times = pd.date_range(start=date_str[0],end=date_str[-1],freq='D') # converts strings to datetime64[ns]
-        datatime = xr.DataArray(None,dims=['time','lat','lon'],coords=dict(time=times,lat=lats,lon=lons)
-                                ).astype(float)
-        for d in range(len(times)): # loops through each queried day
-            datatime[d,:,:] = np.array(raw['data'][d][1]).flatten().reshape((len(lats),len(lons)))
+        # All days are already in one array, reduce over time with float64 accumulation
+        datatime = raw['data'].reshape((len(raw['dates']),len(lats),len(lons)))
         # Stats for multiple days
         if stats == 'Mean':
-            griddata = datatime.mean(dim='time')
+            griddata = xr.DataArray(datatime.mean(axis=0,dtype=np.float64),
+                                    dims=['lat','lon'],coords=dict(lat=lats,lon=lons))
         elif stats == 'Sum':
-            griddata = datatime.sum(dim='time')
+            griddata = xr.DataArray(datatime.sum(axis=0,dtype=np.float64),
+                                    dims=['lat','lon'],coords=dict(lat=lats,lon=lons))
 
     # Set missing values and negative values to NaN 
     griddata = griddata.where(griddata != -999, np.nan)
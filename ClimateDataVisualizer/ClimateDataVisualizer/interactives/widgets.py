@@ -18,6 +18,7 @@ from mpl_toolkits.axes_grid1.inset_locator import inset_axes
 import cartopy, cartopy.mpl.geoaxes, cartopy.io.img_tiles
 from ClimateDataVisualizer.dataquery import NOAA_ACIS_stnmeta as stnmeta
 from ClimateDataVisualizer.dataquery import NOAA_ACIS_stndata as stndata
+from ClimateDataVisualizer.dataquery.NOAA_ACIS_stnmatrix import StationSegments
 from ClimateDataVisualizer.processing.bbox_dy import bbox_avg_dy
 from ClimateDataVisualizer.inset_axes.inset_axes import inset_map, inset_timeseries
 from ClimateDataVisualizer.interactives import plots
@@ -33,6 +34,30 @@ url_spatialmap  = "https://sites.google.com/view/ajtclimate/climate-data-viz/hel
 url_map         = "https://sites.google.com/view/ajtclimate/climate-data-viz/help-map-of-stations"
 url_yaxis       = "https://sites.google.com/view/ajtclimate/climate-data-viz/help-y-axis"
 
+#======================================================================================================
+# Station data of a query as a DataFrame for the Excel downloads
+#======================================================================================================
+
+def stations_frame(var):
+
+    '''
+    Returns the station data of a query as a DataFrame with dates as strings, so they show up in Excel.
+    Station segments are only expanded into a DataFrame here, for the download.
+
+    Parameters
+    -------------
+    var
+     class: 'pandas.DataFrame', Pandas df output from stndata function, or 'StationSegments'.
+
+    Returns
+    ---------------------
+    output: class: 'pandas.DataFrame'
+    '''
+
+    stns_df = var.to_frame() if isinstance(var, StationSegments) else var
+
+    return stns_df.assign(**{stns_df.columns[0]: stns_df.iloc[:,0].astype(str)})
+
 #////////////////////////////////////////////////////////////////////////////////////////////////////////////////
 #
 # ANNUAL CYCLE WIDGETS
@@ -228,7 +253,7 @@ def annualcycle_tmax_widget(var,meta,location_name,nlat,slat,wlon,elon):
                                    'are queried. Do not click download button again.')
             xcl_filename = 'data.xlsx'
             with pd.ExcelWriter(xcl_filename) as w:
-                var.assign(**{var.columns[0]: var.iloc[:,0].astype(str)}).to_excel(w,sheet_name='stations',index=False)
+                stations_frame(var).to_excel(w,sheet_name='stations',index=False)
                 meta.to_excel(w,sheet_name='metadata',index=False)
                 if incl_hist == True:
                    pd.concat([pd.DataFrame({'month':var_dy['month'],'day':var_dy['day'],'max':var_max,'95th':var_95,
@@ -443,7 +468,7 @@ def annualcycle_tmin_widget(var,meta,location_name,nlat,slat,wlon,elon):
                                    'are queried. Do not click download button again.')
             xcl_filename = 'data.xlsx'
             with pd.ExcelWriter(xcl_filename) as w:
-                var.assign(**{var.columns[0]: var.iloc[:,0].astype(str)}).to_excel(w,sheet_name='stations',index=False)
+                stations_frame(var).to_excel(w,sheet_name='stations',index=False)
                 meta.to_excel(w,sheet_name='metadata',index=False)
                 if incl_hist == True:
                    pd.concat([pd.DataFrame({'month':var_dy['month'],'day':var_dy['day'],'max':var_max,'95th':var_95,
@@ -674,8 +699,7 @@ def annualcycle_pcpn_widget(var,meta,location_name,nlat,slat,wlon,elon):
                                    'are queried. Do not click download button again.')
             xcl_filename = 'data.xlsx'
             with pd.ExcelWriter(xcl_filename) as w:
-                var.assign(**{var.columns[0]: var.iloc[:,0].astype(str)}
-                           ).to_excel(w,sheet_name='stations',index=False)
+                stations_frame(var).to_excel(w,sheet_name='stations',index=False)
                 meta.to_excel(w,sheet_name='metadata',index=False)
                 if incl_hist == True:
                     if rain_type == 'all' or rain_type == 'rain':
@@ -914,8 +938,7 @@ def annualcycle_snow_widget(var,meta,location_name,nlat,slat,wlon,elon):
                                    'are queried. Do not click download button again.')
             xcl_filename = 'data.xlsx'
             with pd.ExcelWriter(xcl_filename) as w:
-                var.assign(**{var.columns[0]: var.iloc[:,0].astype(str)}
-                           ).to_excel(w,sheet_name='stations',index=False)
+                stations_frame(var).to_excel(w,sheet_name='stations',index=False)
                 meta.to_excel(w,sheet_name='metadata',index=False)
                 if incl_hist == True:
                     if snow_type == 'all' or snow_type == 'snow':
@@ -1131,8 +1154,7 @@ def cumulative_pcpn_widget(var,meta,location_name,nlat,slat,wlon,elon):
                                    'are queried. Do not click download button again.')
             xcl_filename = 'data.xlsx'
             with pd.ExcelWriter(xcl_filename) as w:
-                var.assign(**{var.columns[0]: var.iloc[:,0].astype(str)}
-                           ).to_excel(w,sheet_name='stations',index=False)
+                stations_frame(var).to_excel(w,sheet_name='stations',index=False)
                 meta.to_excel(w,sheet_name='metadata',index=False)
                 if incl_hist == True:
                     pd.concat([pd.DataFrame({'month':var_cs['month'],'day':var_cs['day']}),
@@ -1333,8 +1355,7 @@ def cumulative_snow_widget(var,meta,location_name,nlat,slat,wlon,elon):
                                    'are queried. Do not click download button again.')
             xcl_filename = 'data.xlsx'
             with pd.ExcelWriter(xcl_filename) as w:
-                var.assign(**{var.columns[0]: var.iloc[:,0].astype(str)}
-                           ).to_excel(w,sheet_name='stations',index=False)
+                stations_frame(var).to_excel(w,sheet_name='stations',index=False)
                 meta.to_excel(w,sheet_name='metadata',index=False)
                 if incl_hist == True:
                     pd.concat([pd.DataFrame({'month':var_cs['month'],'day':var_cs['day']}),
@@ -1552,8 +1573,7 @@ def timeseries_tmax_widget(var,meta,location_name,nlat,slat,wlon,elon):
                                    'are queried. Do not click download button again.')
             xcl_filename = 'data.xlsx'
             with pd.ExcelWriter(xcl_filename) as w:
-                var.assign(**{var.columns[0]: var.iloc[:,0].astype(str)}
-                           ).to_excel(w,sheet_name='stations',index=False)
+                stations_frame(var).to_excel(w,sheet_name='stations',index=False)
                 meta.to_excel(w,sheet_name='metadata',index=False)
                 var_my.to_excel(w,sheet_name='preprocessing',index=False)
                 ts.rename(columns={'Value':method}).to_excel(w,sheet_name='timeseries',index=False)
@@ -1762,8 +1782,7 @@ def timeseries_tmin_widget(var,meta,location_name,nlat,slat,wlon,elon):
                                    'are queried. Do not click download button again.')
             xcl_filename = 'data.xlsx'
             with pd.ExcelWriter(xcl_filename) as w:
-                var.assign(**{var.columns[0]: var.iloc[:,0].astype(str)}
-                           ).to_excel(w,sheet_name='stations',index=False)
+                stations_frame(var).to_excel(w,sheet_name='stations',index=False)
                 meta.to_excel(w,sheet_name='metadata',index=False)
                 var_my.to_excel(w,sheet_name='preprocessing',index=False)
                 ts.rename(columns={'Value':method}).to_excel(w,sheet_name='timeseries',index=False)
@@ -1985,8 +2004,7 @@ def timeseries_pcpn_widget(var,meta,location_name,nlat,slat,wlon,elon):
                                    'are queried. Do not click download button again.')
             xcl_filename = 'data.xlsx'
             with pd.ExcelWriter(xcl_filename) as w:
-                var.assign(**{var.columns[0]: var.iloc[:,0].astype(str)}
-                           ).to_excel(w,sheet_name='stations',index=False)
+                stations_frame(var).to_excel(w,sheet_name='stations',index=False)
                 meta.to_excel(w,sheet_name='metadata',index=False)
                 ts.rename(columns={'Value':method}).to_excel(w,sheet_name='timeseries',index=False)
             xcl_opts(xcl_filename=xcl_filename,xcl_output=xcl_output)
@@ -2207,8 +2225,7 @@ def timeseries_snow_widget(var,meta,location_name,nlat,slat,wlon,elon):
                                    'are queried. Do not click download button again.')
             xcl_filename = 'data.xlsx'
             with pd.ExcelWriter(xcl_filename) as w:
-                var.assign(**{var.columns[0]: var.iloc[:,0].astype(str)}
-                           ).to_excel(w,sheet_name='stations',index=False)
+                stations_frame(var).to_excel(w,sheet_name='stations',index=False)
                 meta.to_excel(w,sheet_name='metadata',index=False)
                 ts.rename(columns={'Value':method}).to_excel(w,sheet_name='timeseries',index=False)
             xcl_opts(xcl_filename=xcl_filename,xcl_output=xcl_output)
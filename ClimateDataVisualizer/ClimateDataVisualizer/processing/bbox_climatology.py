@@ -0,0 +1,270 @@
+#######################################################################################################
+#
+# Climatology of days of the year by year, computed once per query for the annual cycle plots
+#
+#######################################################################################################
+
+import threading, warnings
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from ClimateDataVisualizer.processing.bbox_dy import bbox_avg_dy, bbox_filter_dy
+
+# Number of climatologies kept in memory, least recently used ones are removed beyond this
+climatology_cache_size = 8
+
+# Number of historical periods (start and end year) whose statistics are kept for each climatology
+climatology_period_size = 16
+
+#======================================================================================================
+# Change climatology cache settings
+#======================================================================================================
+
+def configure_climatology(cache_size: int = None, period_size: int = None):
+
+    '''
+    Changes the settings of the climatology cache. Any parameter left as None keeps its current value.
+
+    Parameters
+    -------------
+    cache_size
+     class: 'integer', Number of climatologies (query, minimum number of stations, leap) kept in
+                       memory. Default is 8.
+
+    period_size
+     class: 'integer', Number of historical periods whose statistics are kept for each climatology.
+                       Default is 16.
+    '''
+
+    global climatology_cache_size, climatology_period_size
+
+    if cache_size is not None: climatology_cache_size = cache_size
+    if period_size is not None: climatology_period_size = period_size
+
+    with cubes_lock:
+     while len(cubes) > max(0,climatology_cache_size):
+      cubes.popitem(last=False)
+
+#######################################################################################################
+#
+# CLIMATOLOGY CUBE
+#
+#######################################################################################################
+
+class ClimatologyCube:
+
+    '''
+    Days of the year by year average of a query (see bbox_avg_dy()), after removing the days with fewer
+    than 'num_stn' stations with data. The statistics across years of each day of the year (mean, 5th
+    and 95th percentiles, minimum and maximum) are computed once for each historical period, so
+    re-rendering a plot with other display settings only reads them back.
+
+    Parameters
+    -------------
+    var
+     class: 'pandas.DataFrame', Pandas df output from stndata function, or 'StationSegments'.
+
+    num_stn
+     class: 'integer', Minimum number of stations with data on a day for the day to be kept.
+
+    leap
+     class: 'bool', If True, includes leap days as a day of the year row.
+    '''
+
+    def __init__(self, var, num_stn: int, leap: bool):
+        self.num_stn, self.leap = num_stn, leap
+
+        # Apply NaN filter based on minimum number of stations collecting data on a given day
+        var_filt = bbox_filter_dy(var,num_stn)
+
+        # Dataframe of every day of the every year, 'month' and 'day' then one column per year
+        self.frame = bbox_avg_dy(var_filt,leap=leap)
+        self.years = [str(col) for col in self.frame.columns[2:]]
+        self.values = self.frame.iloc[:,2:].to_numpy(dtype=np.float64)
+        self.values.flags.writeable = False
+
+        # Number of days with data of every year
+        self.days_with_data = (~np.isnan(self.values)).sum(axis=0)
+        self.periods = OrderedDict()
+
+        # Years of every day of the year sorted by value once (NaN last), the values of any window of
+        # years are then ranked without sorting again, see window_percentiles()
+        self.order = np.argsort(self.values,axis=1,kind='stable')
+        self.ordered = np.take_along_axis(self.values,self.order,axis=1)
+        self.ordered.flags.writeable = False
+
+    #==================================================================================================
+    # Years with data
+    #==================================================================================================
+
+    def earliest(self):
+        # Earliest year with data, None if no year has data
+        with_data = np.flatnonzero(self.days_with_data > 0)
+        return int(self.years[with_data[0]]) if len(with_data) > 0 else None
+
+    def latest(self):
+        # Latest year (but not the last year of the query) with fewer than 365 NaN values, None if no
+        # year has this many days with data
+        for c in range(2,min(len(self.frame),len(self.years))+1):
+         if len(self.frame) - self.days_with_data[-c] < 365:
+          return int(self.years[-c])
+        return None
+
+    #==================================================================================================
+    # Percentiles across the years of a historical period
+    #==================================================================================================
+
+    def window_percentiles(self, syr, eyr, q: list):
+
+        '''
+        Returns percentiles across the years 'syr' to 'eyr' of every day of the year, skipping NaN
+        values, as np.nanpercentile() with the default linear interpolation (same values to the last
+        bit). The years of the period are picked out of the rows sorted once in __init__, so no period
+        is sorted again. Days without data in the period are NaN.
+
+        Parameters
+        -------------
+        syr, eyr
+         class: 'integer' or 'string', First and last year of the period.
+
+        q
+         class: 'list', Percentiles from 0 (minimum) to 100 (maximum).
+
+        Returns
+        ---------------------
+        output: class: 'list', One 'numpy.ndarray' of one value per day of the year for each percentile.
+        '''
+
+        a = self.frame.columns.get_loc(str(syr))-2
+        b = self.frame.columns.get_loc(str(eyr))-1
+
+        # Values of the period in sorted order, and the number of them up to each position of the rows
+        member = (self.order >= a) & (self.order < b) & ~np.isnan(self.ordered)
+        rank = np.cumsum(member,axis=1)
+        n = rank[:,-1] if rank.shape[1] > 0 else np.zeros(len(rank),dtype=int)
+        rows = np.arange(len(n))
+
+        def kth(k):
+         # k-th (from 0) smallest value of the period of every row
+         return self.ordered[rows,(rank > k[:,None]).argmax(axis=1)] if rank.shape[1] > 0 else np.full(len(k),np.nan)
+
+        percentiles = []
+        for quantile in np.true_divide(q,100):
+         # Index of the percentile between two values, clipped to the last value as numpy does
+         virtual = (n-1)*quantile
+         lo = np.floor(virtual)
+         above = virtual >= n-1
+         lo_idx = np.where(above,n-1,lo).clip(0).astype(np.intp)
+         hi_idx = np.where(above,n-1,lo+1).clip(0).astype(np.intp)
+         gamma = virtual - np.where(above,-1,lo)
+         v_lo, v_hi = kth(lo_idx), kth(hi_idx)
+         # Linear interpolation computed as numpy's _lerp(), from the upper value above halfway
+         diff = v_hi - v_lo
+         value = np.where(gamma >= 0.5, v_hi - diff*(1-gamma), v_lo + diff*gamma)
+         value[n == 0] = np.nan
+         percentiles.append(value)
+
+        return percentiles
+
+    #==================================================================================================
+    # Statistics across the years of a historical period
+    #==================================================================================================
+
+    def stats(self, syr, eyr):
+
+        '''
+        Returns the statistics across the years 'syr' to 'eyr' of every day of the year. Computed on the
+        first call for a period and kept for the 'climatology_period_size' most recent periods.
+
+        Returns
+        ---------------------
+        output: class: 'tuple', (max, 95th percentile, mean, 5th percentile, min) as 'numpy.ndarray' of
+                                one value per day of the year. The arrays are shared with the cache
+                                and read-only, copy them before changing them.
+        '''
+
+        # Cubes are shared by every thread using the cache, so periods are read and added under its lock
+        key = (str(syr),str(eyr))
+        with cubes_lock:
+         if key in self.periods:
+          self.periods.move_to_end(key)
+          return self.periods[key]
+
+        # Percentiles from the sorted rows, the mean is a single vectorized pass over the period
+        period = self.values[:,self.frame.columns.get_loc(key[0])-2:self.frame.columns.get_loc(key[1])-1]
+        with warnings.catch_warnings():
+         warnings.simplefilter('ignore',category=RuntimeWarning)
+         var_avg = np.nanmean(period,axis=1)
+        var_max, var_95, var_05, var_min = self.window_percentiles(syr,eyr,[100,95,5,0])
+
+        stats = (var_max, var_95, var_avg, var_05, var_min)
+        for array in stats:
+         array.flags.writeable = False
+
+        with cubes_lock:
+         self.periods[key] = stats
+         self.periods.move_to_end(key)
+         while len(self.periods) > max(1,climatology_period_size):
+          self.periods.popitem(last=False)
+
+        return stats
+
+#######################################################################################################
+#
+# CACHE OF CLIMATOLOGY CUBES
+#
+#######################################################################################################
+
+# Climatologies by (query, num_stn, leap) in order of use, with the query they were computed from
+cubes = OrderedDict()
+cubes_lock = threading.Lock()
+
+def climatology_cube(var, num_stn: int, leap: bool):
+
+    '''
+    Returns the ClimatologyCube of a query, computed on first use and kept in memory for the
+    'climatology_cache_size' most recently used (query, num_stn, leap). A query is recognized by the
+    object itself (the DataFrame or StationSegments returned by the stndata functions), so a new query
+    gets a new climatology. The query must not be modified in place once it is used here, and the
+    cube's 'frame' is shared with every later use of the same query, so it must not be modified either.
+
+    Parameters
+    -------------
+    var
+     class: 'pandas.DataFrame', Pandas df output from stndata function, or 'StationSegments'.
+
+    num_stn
+     class: 'integer', Minimum number of stations with data on a day for the day to be kept.
+
+    leap
+     class: 'bool', If True, includes leap days as a day of the year row.
+
+    Returns
+    ---------------------
+    output: class: 'ClimatologyCube'
+    '''
+
+    key = (id(var), int(num_stn), bool(leap))
+
+    # The query is kept with its climatology, so its id is not reused while the entry exists
+    with cubes_lock:
+     entry = cubes.get(key)
+     if entry is not None and entry[0] is var:
+      cubes.move_to_end(key)
+      return entry[1]
+
+    cube = ClimatologyCube(var, num_stn, leap)
+
+    with cubes_lock:
+     if climatology_cache_size > 0:
+      cubes[key] = (var, cube)
+      cubes.move_to_end(key)
+      while len(cubes) > climatology_cache_size:
+       cubes.popitem(last=False)
+
+    return cube
+
+def clear_climatology():
+    # Removes all climatologies from memory
+    with cubes_lock:
+     cubes.clear()
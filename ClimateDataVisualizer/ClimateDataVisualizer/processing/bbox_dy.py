@@ -7,6 +7,51 @@
 import numpy as np
 import pandas as pd
 import warnings
+from ClimateDataVisualizer.dataquery.NOAA_ACIS_stnmatrix import StationSegments
+from ClimateDataVisualizer.processing.bbox_kernels import kernel_frame
+
+#######################################################################################################
+#
+# FILTERING DAYS IN BBOX FUNCTIONS
+#
+#######################################################################################################
+
+#======================================================================================================
+# Set days with fewer than a minimum number of stations collecting data to NaN
+#======================================================================================================
+
+def bbox_filter_dy(df: pd.DataFrame, num_stn: int):
+
+    '''
+    Sets every station to NaN on the days where fewer than 'num_stn' stations collected data. The input
+    is only copied if some days are filtered out, and 'StationSegments' are masked without densifying.
+
+    Parameters
+    -------------
+    df
+     class: 'pandas.DataFrame', Pandas df output from stndata function. Must contain 'Date' as
+                                left-most column. 'StationSegments' are also accepted.
+
+    num_stn
+     class: 'integer', Minimum number of stations with data on a day for the day to be kept.
+
+    Returns
+    ---------------------
+    output: class: 'pandas.DataFrame' or 'StationSegments', 'df' itself if no day is filtered out.
+    '''
+
+    if isinstance(df, StationSegments):
+     few_stns = df.reduce('count') < num_stn
+     return df.mask_days(few_stns) if few_stns.any() else df
+
+    few_stns = df.iloc[:,1:].count(axis=1) < num_stn
+    if not few_stns.any():
+     return df
+
+    df_filt = df.copy()
+    df_filt.loc[few_stns, df_filt.columns[1:]] = np.nan
+
+    return df_filt
 
 #######################################################################################################
 #
@@ -18,25 +63,41 @@ import warnings
 # Read in Pandas output from stndata function and return as Pandas DataFrame of days by year
 #======================================================================================================
 
-def bbox_avg_dy(df: pd.DataFrame, leap: bool = False):
+def bbox_avg_dy(df: pd.DataFrame, leap: bool = False, kernel = None):
 
     '''
     Reads in Pandas dataframe output from stndata functions (includes Date and stations as columns) 
     and calculates the average across all stations within the bounding box for every day of the year
     and for every year in the historical period. The final output dataframe has day of year as rows
-    and each year as a separate column. 
+    and each year as a separate column. The average across stations is taken once for all days, and
+    each day is placed at its (day of year, year) position of a single array. Years that do not start
+    on Jan. 1 or end on Dec. 31 are filled in with NaN, and Feb. 29 is averaged into Feb. 28 if leap =
+    False. Expects a 'Date' column of consecutive days as returned by the stndata functions.
     
     Parameters
     -------------
     df
      class: 'pandas.DataFrame', Pandas df output from stndata function. Must contain 'Date' as 
-                                left-most column.
+                                left-most column. 'StationSegments' (see 'NOAA_ACIS_stnmatrix.py')
+                                are also accepted and averaged across stations without densifying.
 
     leap
      class: 'bool', If True, includes leap days as a day of the year row. 
                     This script can currently only support leap = False. 
 
+    kernel           Default = None
+     class: 'function', Reduction kernel across stations in place of the mean, e.g. kernel_median or
+                        gridded_mean(metadata). See 'bbox_kernels.py'.
+
     '''
+    # Stations are reduced with the kernel first, the reduction is processed like one station
+    if kernel is not None:
+     df = kernel_frame(df, kernel)
+
+    # Station segments are averaged across stations first, the average is processed like one station
+    if isinstance(df, StationSegments):
+     df = df.reduce_frame('mean')
+
     #------------------------------------------------------------------------------------------------
     # Define time indexing arrays
     #------------------------------------------------------------------------------------------------
@@ -53,74 +114,90 @@ def bbox_avg_dy(df: pd.DataFrame, leap: bool = False):
      day = np.concatenate([np.arange(1,m+1) for m in [31,29,31,30,31,30,31,31,30,31,30,31]])
 
     #------------------------------------------------------------------------------------------------
-    # Variables: average all stations by year for every day of the year
+    # Average all stations once for every day, then find the year and the position within its year
+    # of every day
     #------------------------------------------------------------------------------------------------
 
-    # Initialize variable                                     
-    df_dy = pd.DataFrame({'month': month, 'day': day})
-
-    # Loop through years and extract average for every day of that year
-    for yr in range(df['Date'].min().year,df['Date'].max().year+1):
-     
-     # Extract mean for each day for the given year (axis=1 takes mean for each day across all stations)    
-     yr_df_init = df.drop('Date',axis=1).loc[df['Date'].dt.year == yr].mean(axis=1).reset_index(drop=True)
-
-     # If not a full year, fill in remaining days with NaN
-     warnings.simplefilter(action='ignore',category=FutureWarning) # ignore future warning about pd.concat
-
-     # Data for end of year only - i.e., if first year in record does not start on Jan. 1
-     if yr == df['Date'].min().year and df['Date'].loc[df['Date'].dt.year == yr].dt.month.iloc[0] != 1 or \
-                                        df['Date'].loc[df['Date'].dt.year == yr].dt.day.iloc[0] != 1:
-       if yr not in leapyears: # fill in to 365 days
-          yr_df_init = pd.Series(pd.concat([pd.Series([np.nan]*(365-len(yr_df_init))),yr_df_init],axis=0
-                                 ).reset_index(drop=True),dtype=float)
-       elif yr in leapyears: # fill in to 366 days
-          yr_df_init = pd.Series(pd.concat([pd.Series([np.nan]*(366-len(yr_df_init))),yr_df_init],axis=0
-                                 ).reset_index(drop=True),dtype=float)
-
-     # Data for beginning of year only - i.e., if last year in record does not end at Dec. 31
-     if yr == df['Date'].max().year and df['Date'].loc[df['Date'].dt.year == yr].dt.month.iloc[-1] != 12 or \
-                                        df['Date'].loc[df['Date'].dt.year == yr].dt.day.iloc[-1] != 31:
-        if yr not in leapyears: # fill in to 365 days
-           yr_df_init = pd.Series(pd.concat([yr_df_init,pd.Series([np.nan]*(365-len(yr_df_init)))],axis=0,
-                                  ).reset_index(drop=True),dtype=float)
-        elif yr in leapyears: # fill in to 366 days
-           yr_df_init = pd.Series(pd.concat([yr_df_init,pd.Series([np.nan]*(366-len(yr_df_init)))],axis=0
-                                  ).reset_index(drop=True),dtype=float)
-
-     # Manage if allowing leap days or not
-     if leap == False: 
-
-        # If year is leap year, average Feb. 29 (index 59) into Feb. 28 (index 58)
-        if yr in leapyears and len(yr_df_init) == 366: # leap year with 366 values 
-           # Remove leap day
-           yr_df = yr_df_init.drop(59).reset_index(drop=True)
-           # Average Feb. 29 and Feb. 28
-           warnings.filterwarnings('ignore', category=RuntimeWarning) # mute 'mean of empty slice'
-           yr_df[58] = np.nanmean([yr_df[58],yr_df_init[59]])
-        # If year is not leap year, do nothing
-        else: # non-leap year
-           yr_df = yr_df_init
-
-     elif leap == True:
-
-        # If year is not a leap year, add NaN to Feb. 29
-        if yr not in leapyears: 
-           # Add NaN for Feb 29  
-           yr_df = pd.Series([*yr_df_init[:59], np.nan, *yr_df_init[59:]])
-        else: # leap year 
-           yr_df = yr_df_init
-
-        # Check for leap years not recorded in original data
-        if yr in leapyears and len(yr_df) == 365:
-           yr_df = pd.Series([*yr_df_init[:59], np.nan, *yr_df_init[59:]])
-
-     # Pass along values
-     df_dy[str(yr)] = yr_df.values
+    # Mean for each day across all stations (axis=1)
+    dates = pd.to_datetime(df['Date'])
+    avg = df.drop('Date',axis=1).mean(axis=1).to_numpy()
+
+    # Days of each year in order of appearance
+    years = dates.dt.year.to_numpy()
+    order = np.argsort(years,kind='stable')
+    yrs = np.arange(years.min(),years.max()+1)
+    yi = years[order] - yrs[0]
+    count = np.bincount(yi,minlength=len(yrs))
+    first = np.cumsum(count) - count
+    k = np.arange(len(order)) - first[yi]
+
+    #------------------------------------------------------------------------------------------------
+    # Length and offset of every year, a year is filled in with NaN to 365 or 366 days if it does not
+    # start on Jan. 1 (at its beginning) or end on Dec. 31 (at its end)
+    #------------------------------------------------------------------------------------------------
+
+    has = count > 0
+    first_date = pd.DatetimeIndex(dates.to_numpy()[order[first[has]]])
+    last_date = pd.DatetimeIndex(dates.to_numpy()[order[first[has]+count[has]-1]])
+    inleap = np.isin(yrs,leapyears)
+    full = np.where(inleap,366,365)
+
+    # Data for end of year only - i.e., if first year in record does not start on Jan. 1
+    pad_start = np.zeros(len(yrs),dtype=bool)
+    pad_start[has] = ((yrs[has] == yrs[0]) & (first_date.month != 1)) | (first_date.day != 1)
+    offset = np.where(pad_start,np.maximum(full-count,0),0)
+    length = count + offset
+
+    # Data for beginning of year only - i.e., if last year in record does not end at Dec. 31
+    pad_end = np.zeros(len(yrs),dtype=bool)
+    pad_end[has] = ((yrs[has] == yrs[-1]) & (last_date.month != 12)) | (last_date.day != 31)
+    length = np.where(pad_end,np.maximum(length,full),length)
+
+    #------------------------------------------------------------------------------------------------
+    # Row of every day in the output, folding or adding Feb. 29 (index 59) by index arithmetic
+    #------------------------------------------------------------------------------------------------
+
+    pos = offset[yi] + k
+    feb29 = np.zeros(len(pos),dtype=bool)
+
+    if leap == False:
+     # Leap years with 366 values average Feb. 29 into Feb. 28 (index 58), later days move up one row
+     fold = inleap & (length == 366)
+     out_length = np.where(fold,365,length)
+     feb29 = fold[yi] & (pos == 59)
+     row = pos - (fold[yi] & (pos > 59))
+    elif leap == True:
+     # Years without Feb. 29 get NaN there, later days move down one row
+     add = ~inleap | (length == 365)
+     out_length = length + add
+     row = pos + (add[yi] & (pos >= 59))
+
+    # Every year must fill the day of year rows exactly
+    if (out_length[has] != len(month)).any():
+     bad = yrs[has][out_length[has] != len(month)][0]
+     raise ValueError('Year '+str(bad)+' has '+str(out_length[yrs == bad][0])+' days of year instead of '+
+                      str(len(month)))
+
+    #------------------------------------------------------------------------------------------------
+    # Scatter daily averages into a day of year x year array
+    #------------------------------------------------------------------------------------------------
+
+    values = np.full((len(month),len(yrs)),np.nan,dtype=avg.dtype)
+    values[row[~feb29],yi[~feb29]] = avg[order][~feb29]
+
+    # Average Feb. 29 and Feb. 28
+    if feb29.any():
+     leap_days = np.full(len(yrs),np.nan,dtype=avg.dtype)
+     leap_days[yi[feb29]] = avg[order][feb29]
+     with warnings.catch_warnings():
+      warnings.simplefilter('ignore',category=RuntimeWarning) # mute 'mean of empty slice'
+      values[58,fold] = np.nanmean(np.stack([values[58,fold],leap_days[fold]]),axis=0)
 
     #------------------------------------------------------------------------------------------------
     # Return final variable 
     #------------------------------------------------------------------------------------------------
 
-    return df_dy
+    df_dy = pd.concat([pd.DataFrame({'month': month, 'day': day}),
+                       pd.DataFrame(values.astype(np.float64),columns=[str(yr) for yr in yrs])],axis=1)
 
+    return df_dy
@@ -0,0 +1,326 @@
+#######################################################################################################
+#
+# Reduction kernels for aggregating stations within a bounding box for every day
+#
+#######################################################################################################
+
+import time, argparse
+import numpy as np
+import pandas as pd
+from ClimateDataVisualizer.dataquery.NOAA_ACIS_stnmatrix import StationSegments, StationMonthly
+
+# Number of days reduced at once, bounds the memory of kernels that sort or copy the values
+block_days = 4096
+
+#######################################################################################################
+#
+# APPLYING KERNELS
+#
+#######################################################################################################
+
+#======================================================================================================
+# Reduce all stations for every day with a kernel, return as Pandas DataFrame with Date and one column
+#======================================================================================================
+
+def kernel_frame(df: pd.DataFrame, kernel):
+
+    '''
+    Reduces the stations of a stndata DataFrame (or 'StationSegments') for every day with a reduction
+    kernel, 'block_days' days at a time. The result has the layout of a single station, so bbox_avg_dy()
+    and bbox_reduce_my() process it like the reduction of StationSegments.reduce_frame().
+
+    A kernel is any function called as kernel(values, columns), where 'values' is a float64 array of
+    shape (days, stations) with NaN where a station has no data, and 'columns' is the list of station
+    column names ('sid: name, state'). It returns one float64 value per day. See kernel_mean(),
+    kernel_median(), kernel_count(), trimmed_mean(), weighted_mean() and gridded_mean().
+
+    Parameters
+    -------------
+    df
+     class: 'pandas.DataFrame', Pandas df output from stndata function. Must contain 'Date'.
+                                'StationSegments' are accepted and filled into blocks of days from
+                                their segments, without densifying all days at once.
+
+    kernel
+     class: 'function', Reduction kernel.
+
+    Returns
+    ---------------------
+    output: class: 'pandas.DataFrame', 'Date' and a single column named after the kernel.
+    '''
+
+    if isinstance(df, StationMonthly):
+     raise ValueError('Reduction kernels need daily values, query with bbox_multistn_daily()')
+
+    name = getattr(kernel,'__name__','kernel')
+
+    #-------------------------------------------------------------------------------------------------
+    # Station segments, filled into blocks of days
+    #-------------------------------------------------------------------------------------------------
+
+    if isinstance(df, StationSegments):
+     ndays, columns = len(df.dates), list(df.names)
+     reduced = np.full(ndays,np.nan)
+     for b0 in range(0,ndays,block_days):
+      b1 = min(ndays,b0+block_days)
+      block = np.full((b1-b0,len(columns)),np.nan)
+      for c in range(len(columns)):
+       values, span = df.segment(c)
+       lo, hi = max(b0,span.start), min(b1,span.stop)
+       if lo < hi:
+        block[lo-b0:hi-b0,c] = values[lo-span.start:hi-span.start]
+      reduced[b0:b1] = kernel(block,columns)
+     return pd.DataFrame({'Date': df.dates, name: reduced})
+
+    #-------------------------------------------------------------------------------------------------
+    # DataFrame with 'Date' and one column per station
+    #-------------------------------------------------------------------------------------------------
+
+    columns = [col for col in df.columns if col != 'Date']
+    stations = df[columns].to_numpy()
+    reduced = np.full(len(df),np.nan)
+    for b0 in range(0,len(df),block_days):
+     reduced[b0:b0+block_days] = kernel(stations[b0:b0+block_days].astype(np.float64),columns)
+
+    return pd.DataFrame({'Date': df['Date'].to_numpy(), name: reduced})
+
+#######################################################################################################
+#
+# BUILT-IN KERNELS
+#
+#######################################################################################################
+
+#======================================================================================================
+# Mean, median and number of stations with data
+#======================================================================================================
+
+def kernel_mean(values: np.ndarray, columns: list = None):
+
+    '''
+    Mean of the stations with data on each day, NaN on days without data.
+    '''
+
+    valid = ~np.isnan(values)
+    n = valid.sum(axis=1)
+    total = np.where(valid,values,0).sum(axis=1)
+
+    return np.divide(total,n,out=np.full(len(n),np.nan),where=n > 0)
+
+def kernel_count(values: np.ndarray, columns: list = None):
+
+    '''
+    Number of stations with data on each day, as float.
+    '''
+
+    return (~np.isnan(values)).sum(axis=1).astype(np.float64)
+
+def kernel_median(values: np.ndarray, columns: list = None):
+
+    '''
+    Median of the stations with data on each day, NaN on days without data. Rows are sorted once (NaN
+    last), and the middle values are taken at the number of valid values of each row.
+    '''
+
+    if values.shape[1] == 0:
+     return np.full(len(values),np.nan)
+
+    ordered = np.sort(values,axis=1)
+    n = (~np.isnan(values)).sum(axis=1)
+    lo = np.take_along_axis(ordered,np.maximum((n-1)//2,0)[:,None],axis=1)[:,0]
+    hi = np.take_along_axis(ordered,np.minimum(n//2,ordered.shape[1]-1)[:,None],axis=1)[:,0]
+    median = (lo + hi)/2
+    median[n == 0] = np.nan
+
+    return median
+
+#======================================================================================================
+# Trimmed mean
+#======================================================================================================
+
+def trimmed_mean(proportion: float = 0.1):
+
+    '''
+    Returns a kernel of the mean after removing 'proportion' of the stations with data from each end of
+    the sorted values of every day (the lowest and highest stations), as scipy.stats.trim_mean. The
+    number removed from each end is rounded down, so days with few stations are not trimmed.
+
+    Parameters
+    -------------
+    proportion         Default = 0.1
+     class: 'float', Fraction of stations removed from each end, from 0 to below 0.5.
+
+    Returns
+    ---------------------
+    output: class: 'function', Reduction kernel.
+    '''
+
+    if not 0 <= proportion < 0.5:
+     raise ValueError("'proportion' must be at least 0 and below 0.5")
+
+    def kernel(values: np.ndarray, columns: list = None):
+     ordered = np.sort(values,axis=1)
+     n = (~np.isnan(values)).sum(axis=1)
+     k = np.floor(n*proportion).astype(int)
+     # Sum of the sorted values between k and n-k from their running sum, NaN are sorted last
+     running = np.zeros((ordered.shape[0],ordered.shape[1]+1))
+     np.cumsum(np.where(np.isnan(ordered),0,ordered),axis=1,out=running[:,1:])
+     total = np.take_along_axis(running,(n-k)[:,None],axis=1)[:,0] - np.take_along_axis(running,k[:,None],axis=1)[:,0]
+     kept = n - 2*k
+     return np.divide(total,kept,out=np.full(len(n),np.nan),where=kept > 0)
+
+    kernel.__name__ = 'trimmed_mean_'+str(proportion)
+
+    return kernel
+
+#======================================================================================================
+# Weighted mean with one weight per station
+#======================================================================================================
+
+def weighted_mean(weights: dict):
+
+    '''
+    Returns a kernel of the weighted mean of the stations with data on each day. Weights of stations
+    without data on a day are left out, so the weights of each day are normalized by the stations
+    reporting.
+
+    Parameters
+    -------------
+    weights
+     class: 'dict', Weight of each station column name ('sid: name, state'). Stations not listed have
+                    weight 0.
+
+    Returns
+    ---------------------
+    output: class: 'function', Reduction kernel.
+    '''
+
+    def kernel(values: np.ndarray, columns: list):
+     w = np.array([weights.get(col,0.) for col in columns],dtype=np.float64)
+     valid = ~np.isnan(values)
+     total = np.where(valid,values,0) @ w
+     norm = valid @ w
+     return np.divide(total,norm,out=np.full(len(norm),np.nan),where=norm > 0)
+
+    kernel.__name__ = 'weighted_mean'
+
+    return kernel
+
+#======================================================================================================
+# Gridded declustering: stations are averaged within grid cells first, then cells are averaged
+#======================================================================================================
+
+def station_latlon(metadata: pd.DataFrame):
+
+    '''
+    Returns the latitude and longitude of each station column name ('sid: name, state') of a metadata
+    DataFrame with 'sids', 'name', 'state', 'lat' and 'lon' columns. If two stations share a name the
+    later one is used, as in the stndata DataFrames.
+
+    Returns
+    ---------------------
+    output: class: 'dict', (lat, lon) of each station column name.
+    '''
+
+    names = metadata['sids'].astype(str)+': '+metadata['name'].astype(str)+', '+metadata['state'].astype(str)
+
+    return {name: (float(lat), float(lon)) for name, lat, lon in zip(names,metadata['lat'],metadata['lon'])}
+
+def gridded_mean(metadata: pd.DataFrame, cell_deg: float = 0.5, area: bool = True):
+
+    '''
+    Returns a kernel of the declustered mean of the stations with data on each day: the stations in
+    each 'cell_deg' latitude/longitude grid cell are averaged first, then the cells with data are
+    averaged, weighted by their area (cosine of latitude) if 'area' = True. A dozen stations in one city
+    then count as much as a single station in a cell of its own, so clustered stations do not skew the
+    average. Stations missing from 'metadata' are left out.
+
+    Parameters
+    -------------
+    metadata
+     class: 'pandas.DataFrame', Station metadata with 'sids', 'name', 'state', 'lat' and 'lon' columns.
+
+    cell_deg           Default = 0.5
+     class: 'float', Size in degrees of the grid cells.
+
+    area               Default = True
+     class: 'bool', If True, cells are weighted by the cosine of the latitude of their center.
+
+    Returns
+    ---------------------
+    output: class: 'function', Reduction kernel.
+    '''
+
+    latlon = station_latlon(metadata)
+
+    def kernel(values: np.ndarray, columns: list):
+     # Grid cell of each station column, stations without location are left out
+     ll = np.array([latlon.get(col,(np.nan,np.nan)) for col in columns],dtype=np.float64).reshape(-1,2)
+     located = np.flatnonzero(~np.isnan(ll).any(axis=1))
+     if len(located) == 0:
+      return np.full(len(values),np.nan)
+     cells, cell_of = np.unique(np.floor(ll[located]/cell_deg).astype(np.int64),axis=0,return_inverse=True)
+     # Stations ordered by cell, the sums and counts of each cell are then sums over adjacent columns
+     order = np.argsort(cell_of.reshape(-1),kind='stable')
+     starts = np.flatnonzero(np.r_[True,np.diff(cell_of.reshape(-1)[order]) != 0])
+     stations = values[:,located[order]]
+     valid = ~np.isnan(stations)
+     sums = np.add.reduceat(np.where(valid,stations,0),starts,axis=1)
+     counts = np.add.reduceat(valid,starts,axis=1,dtype=np.int64)
+     cell_mean = np.divide(sums,counts,out=np.zeros_like(sums),where=counts > 0)
+     # Average of the cells with data on each day
+     w = np.cos(np.deg2rad((cells[:,0]+0.5)*cell_deg)) if area == True else np.ones(len(cells))
+     norm = (counts > 0) @ w
+     return np.divide(cell_mean @ w,norm,out=np.full(len(norm),np.nan),where=norm > 0)
+
+    kernel.__name__ = 'gridded_mean'
+
+    return kernel
+
+#######################################################################################################
+#
+# BENCHMARK
+#
+#######################################################################################################
+
+def benchmark_kernels(nstations: int = 1000, ndays: int = 50000, missing: float = 0.3, seed: int = 0):
+
+    '''
+    Times kernel_frame() with every built-in kernel on random station data with a fraction 'missing'
+    of NaN values, and prints the seconds taken by each kernel.
+
+    Returns
+    ---------------------
+    output: class: 'dict', Seconds taken by each kernel.
+    '''
+
+    rng = np.random.default_rng(seed)
+    values = rng.normal(size=(ndays,nstations)).astype(np.float32)
+    values[rng.random(values.shape,dtype=np.float32) < missing] = np.nan
+    columns = ['S'+str(c)+': STATION '+str(c)+', MO' for c in range(nstations)]
+    df = pd.DataFrame(values,columns=columns)
+    df.insert(0,'Date',pd.date_range('1880-01-01',periods=ndays,freq='d'))
+    metadata = pd.DataFrame({'sids': ['S'+str(c) for c in range(nstations)],
+                             'name': ['STATION '+str(c) for c in range(nstations)], 'state': 'MO',
+                             'lat': rng.uniform(36,41,nstations), 'lon': rng.uniform(-95,-89,nstations)})
+
+    kernels = [kernel_mean, kernel_count, kernel_median, trimmed_mean(0.1),
+               weighted_mean({col: 1. for col in columns}), gridded_mean(metadata)]
+
+    seconds = {}
+    for kernel in kernels:
+     t0 = time.perf_counter()
+     kernel_frame(df,kernel)
+     seconds[kernel.__name__] = time.perf_counter() - t0
+     print(kernel.__name__+': '+str(round(seconds[kernel.__name__],2))+' s for '+str(nstations)+
+           ' stations x '+str(ndays)+' days')
+
+    return seconds
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Benchmark the station reduction kernels')
+    parser.add_argument('--stations',type=int,default=1000)
+    parser.add_argument('--days',type=int,default=50000)
+    args = parser.parse_args()
+
+    benchmark_kernels(nstations=args.stations,ndays=args.days)
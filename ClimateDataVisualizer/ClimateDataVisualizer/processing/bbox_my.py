@@ -6,194 +6,201 @@
 
 import numpy as np
 import pandas as pd
+from ClimateDataVisualizer.dataquery.NOAA_ACIS_stnmatrix import StationSegments, StationMonthly
+from ClimateDataVisualizer.processing.bbox_kernels import kernel_frame
 
 #======================================================================================================
-# Read in Pandas output from stndata function and return as Pandas DataFrame of months by year
+# Reduce Pandas output from stndata function across stations and by month, return as Pandas DataFrame
+# of months by year
 #======================================================================================================
 
-def bbox_max_my(df: pd.DataFrame):
+def bbox_reduce_my(df: pd.DataFrame, how = 'max', kernel = None):
 
     '''
-    Reads in Pandas dataframe output from stndata functions (includes Date and stations as columns) 
-    and calculates the maximum individual station value across all stations within the bounding box
-    for every month of the year and for every year in the historical period. The final output 
-    dataframe has month of year as rows and each year as a separate column.
+    Reads in Pandas dataframe output from stndata functions (includes Date and stations as columns),
+    reduces all stations within the bounding box for every day, then reduces the days of every month
+    of the year for every year in the historical period. All months are reduced in a single grouped
+    pass over a (year, month) code of every day. The final output dataframe has month of year as rows
+    and each year as a separate column. Years that do not start on Jan. 1 or end on Dec. 31 are filled
+    in with NaN at their beginning or end.
 
     Parameters
     -------------
     df
-     class: 'pandas.DataFrame', Pandas df output from stndata function. Must contain 'Date' as 
-                                left-most column.
-
+     class: 'pandas.DataFrame', Pandas df output from stndata function. Must contain 'Date' as
+                                left-most column. 'StationSegments' (see 'NOAA_ACIS_stnmatrix.py')
+                                are also accepted and reduced across stations without densifying,
+                                as are 'StationMonthly' of monthly maximums or minimums for 'max' or
+                                'min'.
+
+    how                Default = 'max'
+     class: 'string' or 'function', Reduction across stations and across the days of each month.
+                                    'max', 'min', 'mean', 'sum' or 'median' skip NaN values. A numpy
+                                    ufunc (e.g. np.fmax) is applied with its reduce() method, and any
+                                    other function is called as how(values, axis=...), e.g.
+                                    np.nanpercentile with functools.partial.
+
+    kernel             Default = None
+     class: 'function', Reduction kernel across stations in place of 'how', e.g. kernel_median or
+                        gridded_mean(metadata), 'how' then only reduces the days of each month. See
+                        'bbox_kernels.py'.
+
+    Returns
+    ---------------------
+    output: class: 'pandas.DataFrame'
     '''
 
-    #------------------------------------------------------------------------------------------------
-    # 
-    #------------------------------------------------------------------------------------------------
+    # Stations are reduced with the kernel first, the reduction is processed like one station
+    if kernel is not None:
+     df = kernel_frame(df, kernel)
 
-    # Initialize variable
-    df_my = pd.DataFrame({'Month': np.arange(1,13)})
-
-    # Loop through years and calculate maximum individual station value for every month of that year
-    for yr in range(df['Date'].min().year,df['Date'].max().year+1):
-
-     # Extract max for each month for the given year
-     yr_df_init = pd.DataFrame({'Val': df.drop('Date',axis=1).loc[df['Date'].dt.year == yr].max(
-                                                                   axis=1).reset_index(drop=True)})
-    
-     # Add 'Year' and 'Month' 
-     yr_df_init['Year'] = df['Date'].loc[df['Date'].dt.year == yr].reset_index(drop=True).dt.year
-     yr_df_init['Month'] = df['Date'].loc[df['Date'].dt.year == yr].reset_index(drop=True).dt.month
-    
-     # Use groupby to find the max for each month and save to df_my
-     yr_df_vals = yr_df_init.groupby(['Year', 'Month'])['Val'].max().values
-
-     # Data is full year
-     if len(yr_df_vals) == 12:
-       yr_df = yr_df_vals
-
-     # Data for beginning of year only - i.e., if last year in record does not end at Dec. 31
-     if yr == df['Date'].max().year and df['Date'].loc[df['Date'].dt.year == yr].dt.month.iloc[-1] != 12 or \
-                                        df['Date'].loc[df['Date'].dt.year == yr].dt.day.iloc[-1] != 31:
-        yr_df = pd.Series(pd.concat([pd.Series(yr_df_vals),pd.Series([np.nan]*(12-len(yr_df_vals)))],
-                                    axis=0).reset_index(drop=True),dtype=float)
-
-     # Data for end of year only - i.e., if first year in record does not start on Jan. 1
-     if yr == df['Date'].min().year and df['Date'].loc[df['Date'].dt.year == yr].dt.month.iloc[0] != 1 or \
-                                        df['Date'].loc[df['Date'].dt.year == yr].dt.day.iloc[0] != 1:
-        yr_df = pd.Series(pd.concat([pd.Series([np.nan]*(12-len(yr_df_vals))),pd.Series(yr_df_vals)],
-                                    axis=0).reset_index(drop=True),dtype=float)
-
-     df_my[str(yr)] = yr_df
+    # Station segments, and monthly values, are reduced across stations first, the reduction is
+    # processed like one station
+    if isinstance(df, StationMonthly) or (isinstance(df, StationSegments) and isinstance(how,str) and
+                                          how in ('max','min','mean','sum')):
+     df = df.reduce_frame(how)
+    elif isinstance(df, StationSegments):
+     df = df.to_matrix().frame()
 
     #------------------------------------------------------------------------------------------------
-    # Return final variable 
+    # Reduce across stations for every day
     #------------------------------------------------------------------------------------------------
 
-    return df_my
-
-def bbox_min_my(df: pd.DataFrame):
-
-    '''
-    Reads in Pandas dataframe output from stndata functions (includes Date and stations as columns) 
-    and calculates the minimum individual station value across all stations within the bounding box
-    for every month of the year and for every year in the historical period. The final output 
-    dataframe has month of year as rows and each year as a separate column.
-
-    Parameters
-    -------------
-    df
-     class: 'pandas.DataFrame', Pandas df output from stndata function. Must contain 'Date' as 
-                                left-most column.
+    dates = pd.to_datetime(df['Date'])
+    stations = df.drop('Date',axis=1)
 
-    '''
+    if isinstance(how,str):
+     daily = getattr(stations,how)(axis=1)
+    elif isinstance(how,np.ufunc):
+     daily = pd.Series(how.reduce(stations.to_numpy(),axis=1))
+    else:
+     daily = pd.Series(how(stations.to_numpy(),axis=1))
 
     #------------------------------------------------------------------------------------------------
-    # 
+    # Reduce the days of every (year, month) in a single grouped pass
     #------------------------------------------------------------------------------------------------
 
-    # Initialize variable
-    df_my = pd.DataFrame({'Month': np.arange(1,13)})
+    years = dates.dt.year.to_numpy()
+    months = dates.dt.month.to_numpy()
+    yrs = np.arange(years.min(),years.max()+1)
+    code = (years - yrs[0])*12 + months - 1
+
+    grouped = pd.Series(daily.to_numpy()).groupby(code)
+    if isinstance(how,str):
+     monthly = getattr(grouped,how)()
+    elif isinstance(how,np.ufunc):
+     monthly = grouped.agg(how.reduce)
+    else:
+     monthly = grouped.agg(lambda x: how(x.to_numpy(),axis=0))
 
-    # Loop through years and calculate minimum individual station value for every month of that year
-    for yr in range(df['Date'].min().year,df['Date'].max().year+1):
+    # Year and month of each reduced month, in order
+    yi, mi = np.divmod(monthly.index.to_numpy(),12)
 
-     # Extract min for each month for the given year
-     yr_df_init = pd.DataFrame({'Val': df.drop('Date',axis=1).loc[df['Date'].dt.year == yr].min(
-                                                                   axis=1).reset_index(drop=True)})
+    #------------------------------------------------------------------------------------------------
+    # Row of every reduced month, months of a year fill the rows in order and partial years are padded
+    # with NaN at the beginning or at the end
+    #------------------------------------------------------------------------------------------------
 
-     # Add 'Year' and 'Month' 
-     yr_df_init['Year'] = df['Date'].loc[df['Date'].dt.year == yr].reset_index(drop=True).dt.year
-     yr_df_init['Month'] = df['Date'].loc[df['Date'].dt.year == yr].reset_index(drop=True).dt.month
+    # Months reduced for each year, and position of each month among them
+    nmonths = np.bincount(yi,minlength=len(yrs))
+    rank = np.arange(len(yi)) - (np.cumsum(nmonths) - nmonths)[yi]
 
-     # Use groupby to find the min for each month and save to df_my
-     yr_df_vals = yr_df_init.groupby(['Year', 'Month'])['Val'].min().values
+    # First and last date of each year in the order of 'df'
+    order = np.argsort(years,kind='stable')
+    count = np.bincount(years - yrs[0],minlength=len(yrs))
+    has = count > 0
+    first = (np.cumsum(count) - count)[has]
+    first_date = pd.DatetimeIndex(dates.to_numpy()[order[first]])
+    last_date = pd.DatetimeIndex(dates.to_numpy()[order[first+count[has]-1]])
 
-     # Data is full year
-     if len(yr_df_vals) == 12:
-       yr_df = yr_df_vals
+    # Data for end of year only - i.e., if first year in record does not start on Jan. 1 (months are
+    # moved to the end of the year, also if the year does not end at Dec. 31 either)
+    pad_start = np.zeros(len(yrs),dtype=bool)
+    pad_start[has] = ((yrs[has] == yrs[0]) & (first_date.month != 1)) | (first_date.day != 1)
+    offset = np.where(pad_start,12-nmonths,0)
 
-     # Data for beginning of year only - i.e., if last year in record does not end at Dec. 31
-     if yr == df['Date'].max().year and df['Date'].loc[df['Date'].dt.year == yr].dt.month.iloc[-1] != 12 or \
-                                        df['Date'].loc[df['Date'].dt.year == yr].dt.day.iloc[-1] != 31:
-        yr_df = pd.Series(pd.concat([pd.Series(yr_df_vals),pd.Series([np.nan]*(12-len(yr_df_vals)))],
-                                    axis=0).reset_index(drop=True),dtype=float)
+    #------------------------------------------------------------------------------------------------
+    # Scatter reduced months into a month of year x year array
+    #------------------------------------------------------------------------------------------------
 
-     # Data for end of year only - i.e., if first year in record does not start on Jan. 1
-     if yr == df['Date'].min().year and df['Date'].loc[df['Date'].dt.year == yr].dt.month.iloc[0] != 1 or \
-                                        df['Date'].loc[df['Date'].dt.year == yr].dt.day.iloc[0] != 1:
-        yr_df = pd.Series(pd.concat([pd.Series([np.nan]*(12-len(yr_df_vals))),pd.Series(yr_df_vals)],
-                                    axis=0).reset_index(drop=True),dtype=float)
+    values = np.full((12,len(yrs)),np.nan)
+    values[offset[yi]+rank,yi] = monthly.to_numpy(dtype=np.float64)
 
-     df_my[str(yr)] = yr_df
+    df_my = pd.concat([pd.DataFrame({'Month': np.arange(1,13)}),
+                       pd.DataFrame(values,columns=[str(yr) for yr in yrs])],axis=1)
 
     #------------------------------------------------------------------------------------------------
-    # Return final variable 
+    # Return final variable
     #------------------------------------------------------------------------------------------------
 
     return df_my
 
+#======================================================================================================
+# Read in Pandas output from stndata function and return as Pandas DataFrame of months by year
+#======================================================================================================
 
-
-def bbox_avg_my(df: pd.DataFrame):
+def bbox_max_my(df: pd.DataFrame):
 
     '''
-    Reads in Pandas dataframe output from stndata functions (includes Date and stations as columns) 
-    and calculates the average value that integrates all stations within the bounding box
-    for every month of the year and for every year in the historical period. The final output 
-    dataframe has month of year as rows and each year as a separate column.
+    Reads in Pandas dataframe output from stndata functions (includes Date and stations as columns)
+    and calculates the maximum individual station value across all stations within the bounding box
+    for every month of the year and for every year in the historical period. The final output
+    dataframe has month of year as rows and each year as a separate column. See bbox_reduce_my().
 
     Parameters
     -------------
     df
-     class: 'pandas.DataFrame', Pandas df output from stndata function. Must contain 'Date' as 
-                                left-most column.
+     class: 'pandas.DataFrame', Pandas df output from stndata function. Must contain 'Date' as
+                                left-most column. 'StationSegments' (see 'NOAA_ACIS_stnmatrix.py')
+                                are also accepted and reduced across stations without densifying,
+                                as are 'StationMonthly' of monthly maximums.
 
     '''
 
-    #------------------------------------------------------------------------------------------------
-    # 
-    #------------------------------------------------------------------------------------------------
-
-    # Initialize variable
-    df_my = pd.DataFrame({'Month': np.arange(1,13)})
+    return bbox_reduce_my(df,'max')
 
-    # Loop through years and calculate mean value for every month of that year
-    for yr in range(df['Date'].min().year,df['Date'].max().year+1):
+def bbox_min_my(df: pd.DataFrame):
 
-     # Extract mean for each month for the given year
-     yr_df_init = pd.DataFrame({'Val': df.drop('Date',axis=1).loc[df['Date'].dt.year == yr].mean(
-                                                                   axis=1).reset_index(drop=True)})
+    '''
+    Reads in Pandas dataframe output from stndata functions (includes Date and stations as columns)
+    and calculates the minimum individual station value across all stations within the bounding box
+    for every month of the year and for every year in the historical period. The final output
+    dataframe has month of year as rows and each year as a separate column. See bbox_reduce_my().
 
-     # Add 'Year' and 'Month' 
-     yr_df_init['Year'] = df['Date'].loc[df['Date'].dt.year == yr].reset_index(drop=True).dt.year
-     yr_df_init['Month'] = df['Date'].loc[df['Date'].dt.year == yr].reset_index(drop=True).dt.month
+    Parameters
+    -------------
+    df
+     class: 'pandas.DataFrame', Pandas df output from stndata function. Must contain 'Date' as
+                                left-most column. 'StationSegments' (see 'NOAA_ACIS_stnmatrix.py')
+                                are also accepted and reduced across stations without densifying,
+                                as are 'StationMonthly' of monthly minimums.
 
-     # Use groupby to find the mean for each month and save to df_my
-     yr_df_vals = yr_df_init.groupby(['Year', 'Month'])['Val'].mean().values
+    '''
 
-     # Data is full year
-     if len(yr_df_vals) == 12:
-       yr_df = yr_df_vals
+    return bbox_reduce_my(df,'min')
 
-     # Data for beginning of year only - i.e., if last year in record does not end at Dec. 31
-     if yr == df['Date'].max().year and df['Date'].loc[df['Date'].dt.year == yr].dt.month.iloc[-1] != 12 or \
-                                        df['Date'].loc[df['Date'].dt.year == yr].dt.day.iloc[-1] != 31:
-        yr_df = pd.Series(pd.concat([pd.Series(yr_df_vals),pd.Series([np.nan]*(12-len(yr_df_vals)))],
-                                    axis=0).reset_index(drop=True),dtype=float)
+def bbox_avg_my(df: pd.DataFrame, kernel = None):
 
-     # Data for end of year only - i.e., if first year in record does not start on Jan. 1
-     if yr == df['Date'].min().year and df['Date'].loc[df['Date'].dt.year == yr].dt.month.iloc[0] != 1 or \
-                                        df['Date'].loc[df['Date'].dt.year == yr].dt.day.iloc[0] != 1:
-        yr_df = pd.Series(pd.concat([pd.Series([np.nan]*(12-len(yr_df_vals))),pd.Series(yr_df_vals)],
-                                    axis=0).reset_index(drop=True),dtype=float)
+    '''
+    Reads in Pandas dataframe output from stndata functions (includes Date and stations as columns)
+    and calculates the average value that integrates all stations within the bounding box
+    for every month of the year and for every year in the historical period. The final output
+    dataframe has month of year as rows and each year as a separate column. See bbox_reduce_my().
 
-     df_my[str(yr)] = yr_df
+    Parameters
+    -------------
+    df
+     class: 'pandas.DataFrame', Pandas df output from stndata function. Must contain 'Date' as
+                                left-most column. 'StationSegments' (see 'NOAA_ACIS_stnmatrix.py')
+                                are also accepted and reduced across stations without densifying.
 
-    #------------------------------------------------------------------------------------------------
-    # Return final variable 
-    #------------------------------------------------------------------------------------------------
+    kernel
+     class: 'function', Reduction kernel across stations in place of the mean. Default is None.
 
-    return df_my
+    '''
 
+    # The mean of daily means across stations cannot be taken from monthly values
+    if isinstance(df, StationMonthly):
+     raise ValueError('The bounding box average needs daily values, query with bbox_multistn_daily()')
 
+    return bbox_reduce_my(df,'mean',kernel=kernel)
@@ -0,0 +1,286 @@
+#######################################################################################################
+#
+# Local stand-in for the NOAA ACIS web services (StnMeta, StnData, MultiStnData) used by the tests
+#
+#######################################################################################################
+
+import json, gzip, zlib, threading, time, random, functools
+import urllib.parse
+import pandas as pd
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Every station has data on these days only, days outside its valid date range are 'M'
+record_sdate = '1980-01-01'
+record_edate = '2010-12-31'
+
+# Stations served by StnMeta, the first station has a second station id of another type
+stations = [
+ {'uid': 1, 'name': 'STN A', 'state': 'MO', 'sids': ['100001 2','USC00100001 6'], 'll': [-90.1,38.6],
+  'valid_daterange': [['1990-03-05','2001-12-31']]},
+ {'uid': 2, 'name': 'STN B', 'state': 'MO', 'sids': ['100002 2'], 'll': [-90.2,38.7],
+  'valid_daterange': [['1995-01-01','2003-06-30']]},
+ {'uid': 3, 'name': 'STN C', 'state': 'IL', 'sids': ['100003 1'], 'll': [-90.0,38.5],
+  'valid_daterange': [['1992-02-29','1996-12-31']]},
+ {'uid': 4, 'name': 'STN D', 'state': 'IL', 'sids': ['100004 2'], 'll': [-89.9,38.65],
+  'valid_daterange': [['1998-07-15','2003-06-30']]},
+]
+
+#======================================================================================================
+# Raw daily values of a station
+#======================================================================================================
+
+@functools.lru_cache(maxsize=None)
+def station_series(sid: str, elem: str):
+
+    '''
+    Returns the raw daily values ('45', 'M', 'T', 'S', '2.00A') of a station from 'record_sdate' to
+    'record_edate', the same on every call. Elements 'pcpn', 'snow' and 'snwd' include traces and
+    multi-day accumulations, some of them longer than a few days and some left open at the end of the
+    valid date range. The list is shared by every call and must not be changed.
+    '''
+
+    rng = random.Random(zlib.crc32((sid+':'+elem).encode()))
+    dates = pd.date_range(record_sdate,record_edate,freq='D')
+    stn = next(stn for stn in stations if stn['sids'][0].split(' ')[0] == sid)
+    first = (pd.Timestamp(stn['valid_daterange'][0][0]) - dates[0]).days
+    last = (pd.Timestamp(stn['valid_daterange'][0][1]) - dates[0]).days
+
+    values = ['M']*first
+    while len(values) <= last:
+     x = rng.random()
+     if elem not in ('pcpn','snow','snwd'):
+      values.append('M' if x < 0.05 else str(rng.randint(-10,100)))
+     elif x < 0.05:
+      values.append('M')
+     elif x < 0.10:
+      values.append('T')
+     elif x < 0.13:
+      values += ['S']*rng.randint(1,6) + ['%.2fA' % (rng.random()*3)]
+     elif x < 0.135:
+      values.append('S')
+     elif x < 0.14:
+      values.append('%.2fA' % rng.random())
+     else:
+      values.append('%.2f' % (rng.random()*(x > 0.6)))
+    values = values[:last+1]
+
+    return values + ['M']*(len(dates)-len(values))
+
+#######################################################################################################
+#
+# STUB SERVER
+#
+#######################################################################################################
+
+class StubACIS:
+
+    '''
+    NOAA ACIS stand-in served by http.server on localhost. Answers StnMeta (by bbox or sids), StnData
+    and MultiStnData (daily, or monthly with 'reduce') with the values of station_series(), gzip
+    compressed when asked, over keep-alive connections. Every request is recorded in 'calls' as (endpoint, params). Faults are injected with
+    fail().
+
+    Parameters
+    -------------
+    latency
+     class: 'float', Seconds to wait before answering each request. Default is 0.
+    '''
+
+    def __init__(self, latency: float = 0):
+        self.latency = latency
+        self.calls, self.faults = [], []
+        self.lock = threading.Lock()
+        self.server = None
+
+    #==================================================================================================
+    # Start and stop the server
+    #==================================================================================================
+
+    def start(self, port: int = 0):
+        stub = self
+        class Handler(StubHandler):
+         pass
+        Handler.stub = stub
+        self.server = ThreadingHTTPServer(('127.0.0.1',port),Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever,daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:'+str(self.server.server_address[1])
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset(self):
+        with self.lock:
+         self.calls, self.faults = [], []
+
+    #==================================================================================================
+    # Faults
+    #==================================================================================================
+
+    def fail(self, endpoint: str, action, times: int = None, sid: str = None, retry_after: str = None):
+
+        '''
+        Answers the next 'times' requests to 'endpoint' (every request if None) with 'action' instead
+        of data: an HTTP status code, or 'drop' to close the connection without an answer. With 'sid',
+        only requests naming that station id (StnData 'sid' or one of the MultiStnData 'sids') fail.
+        'retry_after' is sent as the Retry-After header of a status code.
+        '''
+
+        with self.lock:
+         self.faults.append({'endpoint': endpoint, 'action': action, 'times': times, 'sid': sid,
+                             'retry_after': retry_after})
+
+    def fault_for(self, endpoint: str, params: dict):
+        # First fault matching the request, counted as used
+        sids = str(params.get('sid',params.get('sids',''))).split(',')
+        with self.lock:
+         for fault in self.faults:
+          if fault['endpoint'] != endpoint or (fault['sid'] is not None and fault['sid'] not in sids):
+           continue
+          if fault['times'] is not None:
+           if fault['times'] == 0:
+            continue
+           fault['times'] -= 1
+          return fault
+        return None
+
+    def count(self, endpoint: str):
+        # Number of requests received by an endpoint, including failed ones
+        with self.lock:
+         return sum(call[0] == endpoint for call in self.calls)
+
+    #==================================================================================================
+    # Answers of each endpoint
+    #==================================================================================================
+
+    def answer(self, endpoint: str, params: dict):
+        if endpoint == 'StnMeta':
+         return {'meta': self.stnmeta(params)}
+        if endpoint == 'StnData':
+         return {'meta': {}, 'data': self.days(params['sid'],params['elems'].split(','),
+                                               params['sdate'],params['edate'],True)}
+        if endpoint == 'MultiStnData':
+         data = []
+         for sid in params['sids'].split(','):
+          stn = next((stn for stn in stations if stn['sids'][0].split(' ')[0] == sid),None)
+          if stn is not None and isinstance(params['elems'],list):
+           data.append({'meta': {'sids': stn['sids']},
+                        'data': self.months(sid,params['elems'][0],params['sdate'],params['edate'])})
+          elif stn is not None:
+           data.append({'meta': {'sids': stn['sids']},
+                        'data': self.days(sid,params['elems'].split(','),params['sdate'],params['edate'])})
+         return {'data': data}
+        raise ValueError('Unknown endpoint '+endpoint)
+
+    def stnmeta(self, params: dict):
+        if 'sids' in params:
+         sids = params['sids'].split(',')
+         return [stn for sid in sids for stn in stations if stn['sids'][0].split(' ')[0] == sid]
+        lon1, slat, lon2, nlat = map(float,params['bbox'].split(','))
+        return [stn for stn in stations if min(lon1,lon2) <= stn['ll'][0] <= max(lon1,lon2)
+                                           and slat <= stn['ll'][1] <= nlat]
+
+    def days(self, sid: str, elems: list, sdate: str, edate: str, dated: bool = False):
+        # Daily values from 'sdate' to 'edate', one list of element values per day, with the date first
+        # for StnData
+        start = (pd.Timestamp(sdate) - pd.Timestamp(record_sdate)).days
+        end = (pd.Timestamp(edate) - pd.Timestamp(record_sdate)).days
+        series = [station_series(sid,elem) for elem in elems]
+        rows = []
+        for d in range(start,end+1):
+         day = [series[k][d] if 0 <= d < len(series[k]) else 'M' for k in range(len(elems))]
+         if dated == True:
+          day = [str((pd.Timestamp(record_sdate)+pd.Timedelta(days=d)).date())] + day
+         rows.append(day)
+        return rows
+
+    def months(self, sid: str, elem: dict, sdate: str, edate: str):
+        # Monthly reduced value and number of missing days ('mcnt') from month 'sdate' to month 'edate'.
+        # Days 'M' and 'S' are missing and traces count as 0. The value is flagged 'A' if it is a
+        # multi-day total ('max'/'min') or includes one ('sum'/'mean'), and 'T' if it is 0 from a trace
+        how = elem['reduce']['reduce']
+        series = station_series(sid,elem['name'])
+        rows = []
+        for month in pd.period_range(sdate,edate,freq='M'):
+         start = (month.start_time - pd.Timestamp(record_sdate)).days
+         month_values = [series[d] if 0 <= d < len(series) else 'M' for d in range(start,start+month.days_in_month)]
+         days = [v for v in month_values if v not in ('M','S')]
+         if len(days) == 0:
+          rows.append([['M',month.days_in_month]])
+          continue
+         numbers = [0.0 if v == 'T' else float(v.rstrip('A')) for v in days]
+         if how in ('max','min'):
+          pick = numbers.index(max(numbers) if how == 'max' else min(numbers))
+          value, accumulated = numbers[pick], days[pick].endswith('A')
+         else:
+          value = sum(numbers) if how == 'sum' else sum(numbers)/len(numbers)
+          accumulated = any(v.endswith('A') for v in days)
+         flag = 'A' if accumulated else 'T' if value == 0 and 'T' in days else ''
+         rows.append([['T' if flag == 'T' else '%.2f' % value + flag, month.days_in_month - len(days)]])
+        return rows
+
+#======================================================================================================
+# Request handler of the stub server
+#======================================================================================================
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    stub = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length'])).decode()
+        params = json.loads(urllib.parse.parse_qs(body)['params'][0])
+        endpoint = self.path.rsplit('/',1)[-1]
+        with self.stub.lock:
+         self.stub.calls.append((endpoint,params))
+        if self.stub.latency > 0:
+         time.sleep(self.stub.latency)
+
+        fault = self.stub.fault_for(endpoint,params)
+        if fault is not None and fault['action'] == 'drop':
+         self.close_connection = True
+         return
+        if fault is not None:
+         self.send_response(fault['action'])
+         if fault['retry_after'] is not None:
+          self.send_header('Retry-After',fault['retry_after'])
+         self.send_header('Content-Length','0')
+         self.end_headers()
+         return
+
+        out = json.dumps(self.stub.answer(endpoint,params)).encode()
+        self.send_response(200)
+        if 'gzip' in self.headers.get('Accept-Encoding',''):
+         out = gzip.compress(out)
+         self.send_header('Content-Encoding','gzip')
+        self.send_header('Content-Type','application/json')
+        self.send_header('Content-Length',str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+#======================================================================================================
+# Serve the stub on its own, e.g. to benchmark queries offline with
+# NOAA_ACIS_transport.configure_transport(url='http://127.0.0.1:8765', rate=0)
+#======================================================================================================
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Local stand-in for the NOAA ACIS web services')
+    parser.add_argument('--port',type=int,default=8765)
+    parser.add_argument('--latency',type=float,default=0,help='seconds to wait before each answer')
+    args = parser.parse_args()
+    stub = StubACIS(latency=args.latency).start(port=args.port)
+    print('Serving NOAA ACIS stub at '+stub.url+' (Ctrl+C to stop)')
+    try:
+     threading.Event().wait()
+    except KeyboardInterrupt:
+     stub.stop()
@@ -0,0 +1,45 @@
+#######################################################################################################
+#
+# Shared fixtures: the package is imported from this checkout and NOAA ACIS is replaced by a local stub
+#
+#######################################################################################################
+
+import os, sys
+import pytest
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)))
+
+from acis_stub import StubACIS
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_transport as transport
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_cache as stncache
+
+@pytest.fixture(scope='session')
+def stub_server():
+    stub = StubACIS().start()
+    yield stub
+    stub.stop()
+
+@pytest.fixture
+def acis(stub_server, tmp_path):
+
+    '''
+    Stub server with no recorded calls or faults. The transport is pointed at it without rate limiting
+    and with short retry waits, and the on-disk cache is kept in a temporary folder. Both are restored
+    afterwards.
+    '''
+
+    settings = dict(url=transport.acis_url, timeout_s=transport.timeout, max_conn=transport.max_connections,
+                    rate=transport.rate_limit, burst=transport.rate_burst, n_retries=transport.retries,
+                    backoff_s=transport.backoff, backoff_max_s=transport.backoff_max)
+    cache_path = stncache.cache_path
+
+    stub_server.reset()
+    transport.configure_transport(url=stub_server.url, timeout_s=10, rate=0, n_retries=3,
+                                  backoff_s=0.01, backoff_max_s=0.05)
+    stncache.configure_cache(path=str(tmp_path/'acis_stndata.sqlite'))
+
+    yield stub_server
+
+    transport.configure_transport(**settings)
+    stncache.configure_cache(path=cache_path)
@@ -0,0 +1,188 @@
+#######################################################################################################
+#
+# Station catalogs: queries against brute force, saved files, and incremental builds from the stub
+#
+#######################################################################################################
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import acis_stub
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_catalog as stncatalog
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_stnmeta as stnmeta
+
+# Region of the stub stations in four tiles of 0.25 degrees, station 100004 lies on the edge of two
+region = (38.4, 38.9, -90.3, -89.8)
+
+@pytest.fixture
+def settings(tmp_path):
+    # Catalogs in a temporary folder, settings restored afterwards
+    saved = dict(folder=stncatalog.catalog_folder, max_age=stncatalog.catalog_max_age,
+                 lag_days=stncatalog.catalog_lag_days, cell=stncatalog.cell_deg)
+    stncatalog.configure_catalog(folder=str(tmp_path))
+    yield tmp_path
+    stncatalog.configure_catalog(**saved)
+
+def random_catalog(seed: int, n: int = 3000):
+    # Stations over the globe, a cluster in one cell and stations on cell edges and the date line
+    rng = np.random.default_rng(seed)
+    lat = np.round(rng.uniform(-90,90,n),1)
+    lon = np.round(rng.uniform(-180,180,n),1)
+    lat[:300], lon[:300] = rng.uniform(38,39,300), rng.uniform(-91,-90,300)
+    lat[300:310], lon[300:310] = 38., -90.
+    lon[310:320] = 180.
+    sdate = pd.Timestamp('1900-01-01') + pd.to_timedelta(rng.integers(0,40000,n),unit='D')
+    edate = sdate + pd.to_timedelta(rng.integers(0,30000,n),unit='D')
+    columns = {'name': np.array(['STN '+str(i) for i in range(n)],dtype=object), 'state': np.full(n,'MO',dtype=object),
+               'sids': np.array([str(100000+i) for i in range(n)],dtype=object), 'sids_code': np.full(n,2),
+               'sids_type': np.full(n,'COOP',dtype=object), 'lat': lat, 'lon': lon,
+               'sdate': np.array(sdate.strftime('%Y-%m-%d'),dtype=object),
+               'edate': np.array(edate.strftime('%Y-%m-%d'),dtype=object)}
+    return stncatalog.StationCatalog('maxt', columns)
+
+def brute_force(catalog, slat, nlat, wlon, elon, sdate, edate, date_match):
+    keep = (catalog.lat >= slat) & (catalog.lat <= nlat) & (catalog.lon >= wlon) & (catalog.lon <= elon)
+    s = None if sdate is None else np.datetime64(sdate,'D')
+    e = None if edate is None else np.datetime64(edate,'D')
+    first, last = (e, s) if date_match == 'overlaps' else (s, e)
+    if first is not None:
+     keep &= catalog.sdate <= first
+    if last is not None:
+     keep &= catalog.edate >= last
+    return np.flatnonzero(keep)
+
+def by_sids(metadata: pd.DataFrame):
+    # Catalog rows are in tile order, NOAA ACIS rows in its own order
+    return metadata.sort_values('sids',ignore_index=True)
+
+#======================================================================================================
+# Bounding box and date queries
+#======================================================================================================
+
+@pytest.mark.parametrize('cell', [1.0,0.3,7.0])
+@pytest.mark.parametrize('date_match', ['covers','overlaps'])
+def test_query_matches_brute_force(settings, cell, date_match):
+    stncatalog.configure_catalog(cell=cell)
+    catalog = random_catalog(1)
+    rng = np.random.default_rng(2)
+    boxes = [(-90,90,-180,180), (38,39,-91,-90), (38,38,-90,-90), (-10,10,170,180), (0,0.05,0,0.05)]
+    for _ in range(30):
+     slat, nlat = np.sort(rng.uniform(-90,90,2))
+     wlon, elon = np.sort(rng.uniform(-180,180,2))
+     boxes.append((slat,nlat,wlon,elon))
+    dates = [(None,None), ('1950-01-01',None), (None,'1990-06-30'), ('1950-01-01','1990-06-30'),
+             ('2000-02-29','2000-02-29')]
+    for box in boxes:
+     for sdate, edate in dates:
+      rows = catalog.query(*box, sdate=sdate, edate=edate, date_match=date_match)
+      np.testing.assert_array_equal(rows, brute_force(catalog,*box,sdate,edate,date_match))
+
+#======================================================================================================
+# Stations to check again with NOAA ACIS
+#======================================================================================================
+
+def test_stale_rows(settings):
+    stncatalog.configure_catalog(lag_days=3)
+    edates = ['2024-01-31','2024-01-30','2024-01-28','2024-01-27','1999-12-31']
+    n = len(edates)
+    catalog = stncatalog.StationCatalog('maxt', {'name': np.array(['S']*n,dtype=object), 'state': np.array(['MO']*n,dtype=object),
+                                                 'sids': np.array([str(i) for i in range(n)],dtype=object),
+                                                 'sids_code': np.full(n,2), 'sids_type': np.array(['COOP']*n,dtype=object),
+                                                 'lat': np.zeros(n), 'lon': np.zeros(n),
+                                                 'sdate': np.array(['1990-01-01']*n,dtype=object),
+                                                 'edate': np.array(edates,dtype=object)},
+                                        snapshot='2024-01-31')
+    rows = np.arange(n)
+
+    # Stations reporting on or after 2024-01-28 were active, they are stale once their edate is older
+    # than 3 days before today
+    np.testing.assert_array_equal(catalog.stale_rows(rows, today='2024-01-31'), [])
+    np.testing.assert_array_equal(catalog.stale_rows(rows, today='2024-02-02'), [2])
+    np.testing.assert_array_equal(catalog.stale_rows(rows, today='2024-02-10'), [0,1,2])
+    np.testing.assert_array_equal(catalog.stale_rows(np.array([1,3,4]), today='2024-02-10'), [1])
+
+#======================================================================================================
+# Saved catalogs
+#======================================================================================================
+
+def test_npz_round_trip(settings):
+    catalog = random_catalog(3)
+    catalog.columns['name'][5] = np.nan
+    path = str(settings/'maxt.npz')
+    catalog.save_npz(path)
+
+    read = stncatalog.StationCatalog.from_npz(path,'maxt')
+    pd.testing.assert_frame_equal(read.frame(), catalog.frame())
+    assert read.snapshot == catalog.snapshot
+    np.testing.assert_array_equal(read.by_cell, catalog.by_cell)
+
+    # Saved with another cell size, the index is built again for the current one. Catalogs already
+    # loaded keep the cell size of their index
+    stncatalog.configure_catalog(cell=0.5)
+    rebuilt = stncatalog.StationCatalog.from_npz(path,'maxt')
+    assert rebuilt.cell_deg == 0.5 and read.cell_deg == 1.0
+    assert not np.array_equal(rebuilt.cells, read.cells)
+    for box in [(38,39,-91,-90), (-45.3,12.8,-100.2,60.1)]:
+     np.testing.assert_array_equal(rebuilt.query(*box, sdate='1950-01-01'), read.query(*box, sdate='1950-01-01'))
+     np.testing.assert_array_equal(rebuilt.query(*box), brute_force(rebuilt,*box,None,None,'covers'))
+
+#======================================================================================================
+# Incremental builds
+#======================================================================================================
+
+def test_build_queries_only_changed_tiles(acis, settings, monkeypatch):
+    catalog = stncatalog.build_catalog(elems=('maxt',), tile_deg=0.25, region=region, print_results=False)['maxt']
+
+    # Every tile is queried in full, station 100004 on the edge of two tiles is kept once
+    assert sorted(catalog.columns['sids']) == ['100001','100002','100003','100004']
+    assert all(params['meta'] != 'uid' for endpoint, params in acis.calls)
+    assert acis.count('StnMeta') == 4
+    live = stnmeta.bbox_metadata('maxt','name,state,sids,ll,valid_daterange',*region)
+    rows = catalog.query(*region)
+    pd.testing.assert_frame_equal(by_sids(catalog.metadata(rows,'name,state,sids,ll,valid_daterange')), by_sids(live))
+
+    # Unchanged tiles are only checked with a query of station uids
+    acis.reset()
+    stncatalog.build_catalog(elems=('maxt',), tile_deg=0.25, region=region, print_results=False)
+    assert [params['meta'] for endpoint, params in acis.calls] == ['uid']*4
+
+    # A station added to one tile changes its fingerprint and only that tile is queried in full
+    added = {'uid': 5, 'name': 'STN E', 'state': 'IL', 'sids': ['100005 2'], 'll': [-89.85,38.85],
+             'valid_daterange': [['2000-01-01','2003-06-30']]}
+    monkeypatch.setattr(acis_stub,'stations',acis_stub.stations+[added])
+    acis.reset()
+    catalog = stncatalog.build_catalog(elems=('maxt',), tile_deg=0.25, region=region, print_results=False)['maxt']
+    full = [params['bbox'] for endpoint, params in acis.calls if params['meta'] != 'uid']
+    assert full == ['-90.05,38.65,-89.8,38.9']
+    assert sorted(catalog.columns['sids']) == ['100001','100002','100003','100004','100005']
+
+    # The saved catalog is read in place of the csv catalogs
+    stncatalog.configure_catalog(max_age=10**6)
+    pd.testing.assert_frame_equal(by_sids(stnmeta.bbox_metadata('maxt','name,state,sids,ll,valid_daterange',*region,
+                                                                source='catalog')),
+                                  by_sids(stnmeta.bbox_metadata('maxt','name,state,sids,ll,valid_daterange',*region)))
+
+def test_build_refreshes_old_tiles_and_keeps_failed_ones(acis, settings):
+    stncatalog.build_catalog(elems=('maxt',), tile_deg=0.25, region=region, print_results=False)
+
+    # Tiles older than 'refresh_days' are queried in full again
+    acis.reset()
+    stncatalog.build_catalog(elems=('maxt',), tile_deg=0.25, region=region, refresh_days=-1,
+                             print_results=False)
+    assert acis.count('StnMeta') == 4 and all(params['meta'] != 'uid' for endpoint, params in acis.calls)
+
+    # Tiles that cannot be queried keep their stations from the previous build
+    acis.reset()
+    acis.fail('StnMeta', 404)
+    catalog = stncatalog.build_catalog(elems=('maxt',), tile_deg=0.25, region=region, refresh_days=-1,
+                                       print_results=False)['maxt']
+    assert sorted(catalog.columns['sids']) == ['100001','100002','100003','100004']
+
+def test_built_catalog_is_current(acis, settings):
+    # Without a catalog, metadata queries with source='auto' go to NOAA ACIS
+    assert stncatalog.is_current('maxt') == False
+    stncatalog.build_catalog(elems=('maxt',), tile_deg=0.25, region=region, print_results=False)
+    assert stncatalog.is_current('maxt') == True
+    stncatalog.configure_catalog(max_age=-1)
+    assert stncatalog.is_current('maxt') == False
@@ -0,0 +1,90 @@
+#######################################################################################################
+#
+# Climatology cube: filter of days with few stations, and percentiles over windows of years against
+# np.nanpercentile()
+#
+#######################################################################################################
+
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_stnmatrix as stnmatrix
+from ClimateDataVisualizer.processing.bbox_dy import bbox_filter_dy
+from ClimateDataVisualizer.processing.bbox_climatology import ClimatologyCube
+
+@pytest.fixture(scope='module', params=[False,True], ids=['noleap','leap'])
+def cube(request):
+    # Three stations over 30 years with ties, a year without data and a day of the year without data
+    rng = np.random.default_rng(11)
+    dates = pd.date_range('1981-01-01','2010-12-31',freq='d')
+    values = rng.integers(0,40,size=(len(dates),3)).astype(np.float64)
+    values[rng.random(values.shape) < 0.3] = np.nan
+    values[dates.year == 1995] = np.nan
+    values[(dates.month == 3) & (dates.day == 10)] = np.nan
+    frame = pd.DataFrame(values,columns=['1: A, MO','2: B, MO','3: C, MO'])
+    frame.insert(0,'Date',dates)
+    return ClimatologyCube(frame, 1, request.param)
+
+def reference_percentiles(cube: ClimatologyCube, syr: int, eyr: int, q: list):
+    # np.nanpercentile() over the years of the window, NaN for days without data or an empty window
+    window = cube.values[:,cube.years.index(str(syr)):cube.years.index(str(eyr))+1]
+    with warnings.catch_warnings():
+     warnings.simplefilter('ignore',category=RuntimeWarning)
+     return list(np.nanpercentile(window,q,axis=1))
+
+#======================================================================================================
+# Days with fewer than num_stn stations
+#======================================================================================================
+
+@pytest.mark.parametrize('num_stn', [0,1,2,3,4])
+def test_filter_days_of_frame_and_segments(num_stn):
+    rng = np.random.default_rng(4)
+    spans = [('1990-01-01','1990-12-31'), ('1990-03-01','1991-06-30'), ('1990-06-15','1991-12-31')]
+    metadata = pd.DataFrame({'sids': pd.array(['1','2','3'],dtype='string'), 'name': ['A','B','C'],
+                             'state': ['MO']*3, 'sdate': pd.array([span[0] for span in spans],dtype='string'),
+                             'edate': pd.array([span[1] for span in spans],dtype='string')})
+    station_values = []
+    for sdate, edate in spans:
+     values = rng.normal(size=(pd.Timestamp(edate) - pd.Timestamp(sdate)).days+1).astype(np.float32)
+     values[rng.random(len(values)) < 0.3] = np.nan
+     station_values.append(values)
+    dates = pd.date_range('1990-01-01','1991-12-31',freq='d')
+    segments = stnmatrix.StationSegments.from_stations(metadata=metadata, station_values=station_values, dates=dates)
+    frame = segments.to_frame()
+
+    filtered = bbox_filter_dy(frame, num_stn)
+    expected = frame.copy()
+    expected.loc[frame.iloc[:,1:].count(axis=1) < num_stn, frame.columns[1:]] = np.nan
+    pd.testing.assert_frame_equal(filtered, expected)
+    pd.testing.assert_frame_equal(bbox_filter_dy(segments, num_stn).to_frame(), expected)
+
+    # Nothing is copied if no day is filtered out, and the input is never changed
+    assert (filtered is frame) == (num_stn <= 0)
+    assert (bbox_filter_dy(segments, num_stn) is segments) == (num_stn <= 0)
+    pd.testing.assert_frame_equal(segments.to_frame(), frame)
+
+#======================================================================================================
+# Percentiles over windows of years
+#======================================================================================================
+
+q = [0,5,33.3,50,95,100]
+
+def test_window_percentiles_match_nanpercentile(cube):
+    rng = np.random.default_rng(2)
+    windows = [(1981,2010), (1995,1995), (1994,1996), (2010,2010)]
+    windows += [tuple(sorted(rng.integers(1981,2011,size=2))) for _ in range(20)]
+    for syr, eyr in windows:
+     for value, reference in zip(cube.window_percentiles(syr,eyr,q), reference_percentiles(cube,syr,eyr,q)):
+      np.testing.assert_array_equal(value, reference)
+
+def test_window_percentiles_without_data(cube):
+    # Day of the year without data in any year, year without data, and start after the end
+    march_10 = np.flatnonzero((cube.frame['month'].to_numpy() == 3) & (cube.frame['day'].to_numpy() == 10))
+    for value in cube.window_percentiles(1981,2010,q):
+     assert np.isnan(value[march_10]).all()
+    for syr, eyr in [(1995,1995), (2000,1990), (1982,1981)]:
+     for value, reference in zip(cube.window_percentiles(syr,eyr,q), reference_percentiles(cube,syr,eyr,q)):
+      assert np.isnan(value).all()
+      np.testing.assert_array_equal(value, reference)
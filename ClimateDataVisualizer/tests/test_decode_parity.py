@@ -0,0 +1,249 @@
+#######################################################################################################
+#
+# Vectorized decode and station matrix / segments against the per-row implementation they replaced
+#
+#######################################################################################################
+
+import json, warnings
+import numpy as np
+import pandas as pd
+import pytest
+
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_stndata as stndata
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_stream as stream
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_stnmatrix as stnmatrix
+from ClimateDataVisualizer.processing.bbox_dy import bbox_avg_dy
+from ClimateDataVisualizer.processing.bbox_my import bbox_reduce_my
+from ClimateDataVisualizer.processing.bbox_climatology import ClimatologyCube
+
+#######################################################################################################
+#
+# REFERENCE IMPLEMENTATION
+#
+#######################################################################################################
+
+def baseline_decode(elem: str, rows: list, M: float = float('NaN'), T: float = 0.00001, mdr: int = 50,
+                    mdr_opt: str = 'avg', mdr_A: str = 'equal', mdr_S: str = '0'):
+
+    '''
+    Per-row decode of the StnData 'data' rows ([date, value]) as done by singlestn_daily() before the
+    vectorized singlestn_decode(), kept unchanged apart from the printing of multi-day events.
+    '''
+
+    Station = pd.DataFrame(rows,columns=['Date',elem])
+    Station[elem] = np.where(Station[elem] == 'M', M, Station[elem])
+
+    if elem == 'pcpn' or elem == 'snow' or elem == 'snwd':
+
+     Station[elem] = np.where(Station[elem] == 'T', T, Station[elem])
+
+     for sa in range(len(Station[elem])):
+      if Station[elem].iloc[sa] == 'S':
+       if (len(Station[elem]) - Station[elem].index[sa]) < mdr:
+        for x in range(len(Station[elem]) - Station[elem].index[sa]):
+         if ('A' in str(Station[elem].iloc[sa+x])) == True:
+          if mdr_opt == 'avg':
+           Station[elem].iloc[sa:sa+x+1] = float(Station[elem].iloc[sa+x].replace('A','')) / (x+1)
+          break
+       else:
+        for x in range(mdr):
+         if ('A' in str(Station[elem].iloc[sa+x])) == True:
+          if mdr_opt == 'avg':
+           Station[elem].iloc[sa:sa+x+1] = float(Station[elem].iloc[sa+x].replace('A','')) / (x+1)
+          break
+
+     if Station[elem].str.contains('A').any() == True:
+      if mdr_A == 'equal':
+         Aind = Station[elem].index[Station[elem].str.contains('A') == True].values
+         if len(Aind) > 0:
+          for Aelem in range(len(Aind)):
+           Station[elem][Aind[Aelem]] = np.float64(Station[elem][Aind[Aelem]].replace('A',''))
+
+     if Station[elem].str.contains('S').any() == True:
+      Sind = Station[elem].index[Station[elem].str.contains('S') == True].values
+      if len(Sind) > 0:
+       for Selem in range(len(Sind)):
+        Station[elem][Sind[Selem]] = 0
+
+    return np.float32(Station[elem])
+
+def baseline_frame(metadata: pd.DataFrame, station_values: list, dates: pd.DatetimeIndex):
+    # Station DataFrame assembled one column at a time as bbox_multistn_daily() did
+    STATIONS = pd.DataFrame({'Date': dates})
+    with warnings.catch_warnings():
+     warnings.simplefilter('ignore')
+     for i in range(len(metadata)):
+      name = str(metadata['sids'][i]+': '+metadata['name'][i]+', '+metadata['state'][i])
+      STATIONS[name] = float('NaN')
+      sdate_ind = STATIONS['Date'].index[STATIONS['Date'] == metadata['sdate'][i]][0]
+      edate_ind = STATIONS['Date'].index[STATIONS['Date'] == metadata['edate'][i]][0]
+      STATIONS[name].iloc[sdate_ind:edate_ind+1] = station_values[i]
+    return STATIONS
+
+#######################################################################################################
+#
+# DECODE
+#
+#######################################################################################################
+
+def raw_strings(seed: int, ndays: int, elem: str):
+    # Raw daily values with every special case: traces, missing days, S runs longer than mdr, standalone
+    # S and A, S runs interrupted by M or T, A right after A, and S left open at the end of the record
+    rng = np.random.default_rng(seed)
+    if elem not in ('pcpn','snow','snwd'):
+     return [('M' if rng.random() < 0.1 else str(rng.integers(-20,110))) for _ in range(ndays)]
+    tokens = rng.choice(['value','zero','M','T','S','A'],size=ndays,p=[0.45,0.15,0.08,0.08,0.16,0.08])
+    values = []
+    for token in tokens:
+     if token == 'value':
+      values.append('%.2f' % rng.uniform(0,3))
+     elif token == 'zero':
+      values.append('0.00')
+     elif token == 'A':
+      values.append('%.2fA' % rng.uniform(0,5))
+     else:
+      values.append(str(token))
+    # Long S runs reaching past mdr and an S run at the end of the record
+    start = rng.integers(0,max(1,ndays-80))
+    values[start:start+60] = ['S']*len(values[start:start+60])
+    values[-3:] = ['S','S','S'][:len(values[-3:])]
+    return values
+
+def dated_rows(values: list, sdate: str = '1999-12-30'):
+    dates = pd.date_range(sdate,periods=len(values),freq='D')
+    return [[str(date.date()),value] for date, value in zip(dates,values)]
+
+def stream_pieces(text: str, size: int):
+    # Response text cut into pieces that split days, numbers and keys
+    for i in range(0,len(text),size):
+     yield text[i:i+size]
+
+decode_options = [dict(),
+                  dict(mdr=1), dict(mdr=2), dict(mdr=5), dict(mdr=70),
+                  dict(M=-999.0), dict(T=0.0), dict(M=0.5, T=0.25),
+                  dict(mdr_opt='none'), dict(mdr_opt='none', mdr=3)]
+
+@pytest.mark.parametrize('elem', ['pcpn','snow','snwd','maxt'])
+@pytest.mark.parametrize('options', decode_options)
+@pytest.mark.parametrize('seed', [0,1,2])
+def test_decode_matches_baseline(elem, options, seed):
+    values = raw_strings(seed, 400, elem)
+    rows = dated_rows(values)
+    with warnings.catch_warnings():
+     warnings.simplefilter('ignore')
+     expected = baseline_decode(elem, rows, **options)
+
+    # Values of MultiStnData responses
+    decoded = stndata.singlestn_decode(elem, 'TEST', rows[0][0], rows[-1][0], stream.encode_values(values),
+                                       print_md=False, **options)
+    np.testing.assert_array_equal(decoded, expected)
+    assert decoded.dtype == np.float32
+
+    # StnData responses parsed while being read
+    text = json.dumps({'meta': {'name': 'TEST'}, 'data': rows})
+    raw = stream.parse_stndata(stream_pieces(text, 7), len(rows))
+    decoded = stndata.singlestn_decode(elem, 'TEST', rows[0][0], rows[-1][0], raw, print_md=False, **options)
+    np.testing.assert_array_equal(decoded, expected)
+
+@pytest.mark.parametrize('values', [['S'], ['1.50A'], ['S','1.50A'], ['S','S','S'], ['T','S','M','0.90A'],
+                                    ['0.30A','S','0.60A','1.00A'], ['S']*3+['0.80A']+['S']*2, []])
+def test_decode_edge_cases_match_baseline(values):
+    # A plain value first, the baseline fails on records without any string left after its S->A pass
+    values = ['0.10'] + values
+    rows = dated_rows(values)
+    for mdr in (1,2,3,50):
+     with warnings.catch_warnings():
+      warnings.simplefilter('ignore')
+      expected = baseline_decode('pcpn', rows, mdr=mdr)
+     decoded = stndata.singlestn_decode('pcpn', 'TEST', rows[0][0], rows[-1][0], stream.encode_values(values),
+                                        mdr=mdr, print_md=False)
+     np.testing.assert_array_equal(decoded, expected)
+
+#######################################################################################################
+#
+# STATION MATRIX AND SEGMENTS
+#
+#######################################################################################################
+
+@pytest.fixture(scope='module')
+def stations():
+    # Stations with overlapping, disjoint and single-day records across leap years, one with no data,
+    # and two sharing a name so the later one replaces the earlier one
+    rng = np.random.default_rng(3)
+    spans = [('1990-03-05','2001-12-31'), ('1995-01-01','2003-06-30'), ('1992-02-29','1996-12-31'),
+             ('1998-07-15','2003-06-30'), ('2003-06-30','2003-06-30'), ('1991-01-01','1991-12-31'),
+             ('1993-05-01','1994-05-01'), ('1990-03-05','1990-12-31')]
+    metadata = pd.DataFrame({'sids': pd.array(['1000'+str(i) for i in range(len(spans)-1)]+['10006'],dtype='string'),
+                             'name': ['STN '+str(i) for i in range(len(spans)-1)]+['STN 6'],
+                             'state': ['MO']*len(spans),
+                             'sdate': pd.array([span[0] for span in spans],dtype='string'),
+                             'edate': pd.array([span[1] for span in spans],dtype='string')})
+    station_values = []
+    for i, (sdate, edate) in enumerate(spans):
+     ndays = (pd.Timestamp(edate) - pd.Timestamp(sdate)).days+1
+     values = rng.normal(15,10,ndays).astype(np.float32)
+     values[rng.random(ndays) < 0.2] = np.nan
+     if i == 5:
+      values[:] = np.nan
+     station_values.append(values)
+    dates = pd.date_range(min(spans)[0],max(span[1] for span in spans),freq='d')
+    return metadata, station_values, dates
+
+def test_matrix_matches_baseline_frame(stations):
+    metadata, station_values, dates = stations
+    expected = baseline_frame(metadata, station_values, dates)
+    matrix = stnmatrix.StationMatrix.from_stations(metadata=metadata, station_values=station_values, dates=dates)
+
+    pd.testing.assert_frame_equal(matrix.to_frame(), expected)
+    pd.testing.assert_frame_equal(matrix.frame(), expected.astype({name: np.float32 for name in expected.columns[1:]}))
+
+def test_segments_match_baseline_frame(stations):
+    metadata, station_values, dates = stations
+    expected = baseline_frame(metadata, station_values, dates)
+    segments = stnmatrix.StationSegments.from_stations(metadata=metadata, station_values=station_values, dates=dates)
+
+    pd.testing.assert_frame_equal(segments.to_frame(), expected)
+    pd.testing.assert_frame_equal(segments.to_matrix().to_frame(), expected)
+    assert list(segments.columns) == list(expected.columns)
+
+@pytest.mark.parametrize('how', ['max','min','count','mean','sum'])
+def test_segments_reduce_matches_baseline_frame(stations, how):
+    metadata, station_values, dates = stations
+    expected = baseline_frame(metadata, station_values, dates).iloc[:,1:]
+    expected = getattr(expected,how)(axis=1, **({} if how == 'count' else {'min_count': 1} if how == 'sum' else {}))
+    segments = stnmatrix.StationSegments.from_stations(metadata=metadata, station_values=station_values, dates=dates)
+
+    np.testing.assert_allclose(segments.reduce(how), expected.to_numpy(dtype=np.float64), rtol=1e-12)
+
+@pytest.mark.parametrize('leap', [False,True])
+def test_segments_day_of_year_average_matches_baseline_frame(stations, leap):
+    metadata, station_values, dates = stations
+    frame = baseline_frame(metadata, station_values, dates)
+    segments = stnmatrix.StationSegments.from_stations(metadata=metadata, station_values=station_values, dates=dates)
+
+    pd.testing.assert_frame_equal(bbox_avg_dy(segments, leap=leap), bbox_avg_dy(frame, leap=leap), rtol=1e-12)
+
+@pytest.mark.parametrize('how', ['max','min','mean'])
+def test_segments_month_of_year_reduce_matches_baseline_frame(stations, how):
+    metadata, station_values, dates = stations
+    frame = baseline_frame(metadata, station_values, dates)
+    segments = stnmatrix.StationSegments.from_stations(metadata=metadata, station_values=station_values, dates=dates)
+
+    pd.testing.assert_frame_equal(bbox_reduce_my(segments, how=how), bbox_reduce_my(frame, how=how), rtol=1e-12)
+
+def test_segments_climatology_matches_baseline_frame(stations):
+    metadata, station_values, dates = stations
+    frame = baseline_frame(metadata, station_values, dates)
+    segments = stnmatrix.StationSegments.from_stations(metadata=metadata, station_values=station_values, dates=dates)
+    cube_frame, cube_segments = ClimatologyCube(frame, 2, False), ClimatologyCube(segments, 2, False)
+
+    pd.testing.assert_frame_equal(cube_segments.frame, cube_frame.frame, rtol=1e-12)
+
+    # Percentiles of every period equal np.nanpercentile() over the years of the period
+    period = cube_frame.values[:,cube_frame.years.index('1993'):cube_frame.years.index('2001')+1]
+    with warnings.catch_warnings():
+     warnings.simplefilter('ignore',category=RuntimeWarning)
+     expected = [np.nanpercentile(period,q,axis=1) for q in (100,95,5,0)] + [np.nanmean(period,axis=1)]
+    stats = cube_frame.stats('1993','2001')
+    for value, reference in zip([stats[0],stats[1],stats[3],stats[4],stats[2]], expected):
+     np.testing.assert_array_equal(value, reference)
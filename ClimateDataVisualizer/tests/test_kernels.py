@@ -0,0 +1,122 @@
+#######################################################################################################
+#
+# Reduction kernels against numpy references, on random values and a hand-built station layout
+#
+#######################################################################################################
+
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_stnmatrix as stnmatrix
+from ClimateDataVisualizer.processing import bbox_kernels
+
+def random_values(seed: int, ndays: int = 400, nstations: int = 9):
+    # Values with ties, a fraction of NaN, and days with no station or a single station with data
+    rng = np.random.default_rng(seed)
+    values = rng.integers(-5,6,size=(ndays,nstations)).astype(np.float64)
+    values[rng.random(values.shape) < 0.4] = np.nan
+    values[::17] = np.nan
+    values[5::23,1:] = np.nan
+    return values
+
+def reference_trim_mean(row: np.ndarray, proportion: float):
+    # scipy.stats.trim_mean of the values with data
+    ordered = np.sort(row[~np.isnan(row)])
+    k = int(proportion*len(ordered))
+    return ordered[k:len(ordered)-k].mean() if len(ordered)-2*k > 0 else np.nan
+
+#======================================================================================================
+# Median and trimmed mean
+#======================================================================================================
+
+@pytest.mark.parametrize('seed', range(4))
+@pytest.mark.parametrize('nstations', [1,2,9])
+def test_median_matches_nanmedian(seed, nstations):
+    values = random_values(seed, nstations=nstations)
+    with warnings.catch_warnings():
+     warnings.simplefilter('ignore',category=RuntimeWarning)
+     expected = np.nanmedian(values,axis=1)
+    np.testing.assert_array_equal(bbox_kernels.kernel_median(values), expected)
+
+def test_median_without_stations():
+    assert np.isnan(bbox_kernels.kernel_median(np.empty((3,0)))).all()
+
+@pytest.mark.parametrize('seed', range(4))
+@pytest.mark.parametrize('proportion', [0,0.1,0.25,0.49])
+def test_trimmed_mean_matches_reference(seed, proportion):
+    values = random_values(seed, nstations=12)
+    expected = np.array([reference_trim_mean(row,proportion) for row in values])
+    np.testing.assert_allclose(bbox_kernels.trimmed_mean(proportion)(values), expected, rtol=1e-12)
+
+@pytest.mark.parametrize('proportion', [-0.1,0.5])
+def test_trimmed_mean_rejects_proportion(proportion):
+    with pytest.raises(ValueError):
+     bbox_kernels.trimmed_mean(proportion)
+
+#======================================================================================================
+# Gridded declustering
+#======================================================================================================
+
+def test_gridded_mean_declusters_stations():
+    # Four stations in one 0.5 degree cell, one station in another, and one station without location
+    metadata = pd.DataFrame({'sids': ['1','2','3','4','5'], 'name': ['A','B','C','D','E'], 'state': 'MO',
+                             'lat': [38.1,38.2,38.3,38.4,40.2], 'lon': [-90.4,-90.3,-90.2,-90.1,-90.4]})
+    columns = ['1: A, MO','2: B, MO','3: C, MO','4: D, MO','5: E, MO','6: F, MO']
+    values = np.array([[10.,10.,10.,10.,20.,99.],
+                       [ 8.,np.nan,12.,np.nan,20.,99.],
+                       [np.nan,np.nan,np.nan,np.nan,20.,99.],
+                       [np.nan,np.nan,np.nan,np.nan,np.nan,99.]])
+
+    plain = bbox_kernels.gridded_mean(metadata, cell_deg=0.5, area=False)(values,columns)
+    np.testing.assert_allclose(plain[:3], [15.,15.,20.])
+    assert np.isnan(plain[3])
+
+    # Cells weighted by the cosine of the latitude of their center, 38.25 and 40.25
+    w = np.cos(np.deg2rad([38.25,40.25]))
+    area = bbox_kernels.gridded_mean(metadata, cell_deg=0.5, area=True)(values,columns)
+    np.testing.assert_allclose(area[:3], [(10*w[0]+20*w[1])/w.sum(),(10*w[0]+20*w[1])/w.sum(),20.])
+
+    # A cell covering every station gives the plain mean of the located stations
+    single = bbox_kernels.gridded_mean(metadata, cell_deg=45, area=False)(values,columns)
+    np.testing.assert_allclose(single[:3], [12.,40/3,20.])
+
+#======================================================================================================
+# Applying kernels to DataFrames and station segments
+#======================================================================================================
+
+def test_kernel_frame_of_segments_matches_frame(monkeypatch):
+    # Blocks of 97 days so station records start and end inside and across blocks
+    monkeypatch.setattr(bbox_kernels,'block_days',97)
+    rng = np.random.default_rng(5)
+    spans = [('1990-03-05','1991-12-31'), ('1990-06-01','1990-06-01'), ('1990-12-30','1992-01-05'),
+             ('1991-01-01','1991-12-31'), ('1990-01-01','1992-01-05')]
+    metadata = pd.DataFrame({'sids': pd.array(['1000'+str(i) for i in range(len(spans))],dtype='string'),
+                             'name': ['STN '+str(i) for i in range(len(spans))], 'state': ['MO']*len(spans),
+                             'sdate': pd.array([span[0] for span in spans],dtype='string'),
+                             'edate': pd.array([span[1] for span in spans],dtype='string'),
+                             'lat': rng.uniform(38,39,len(spans)), 'lon': rng.uniform(-91,-90,len(spans))})
+    station_values = []
+    for sdate, edate in spans:
+     values = rng.normal(15,10,(pd.Timestamp(edate) - pd.Timestamp(sdate)).days+1).astype(np.float32)
+     values[rng.random(len(values)) < 0.2] = np.nan
+     station_values.append(values)
+    dates = pd.date_range('1990-01-01','1992-01-05',freq='d')
+    segments = stnmatrix.StationSegments.from_stations(metadata=metadata, station_values=station_values, dates=dates)
+    frame = segments.to_frame()
+
+    kernels = [bbox_kernels.kernel_mean, bbox_kernels.kernel_count, bbox_kernels.kernel_median,
+               bbox_kernels.trimmed_mean(0.2), bbox_kernels.weighted_mean({frame.columns[1]: 2., frame.columns[3]: 1.}),
+               bbox_kernels.gridded_mean(metadata, cell_deg=0.25)]
+    for kernel in kernels:
+     pd.testing.assert_frame_equal(bbox_kernels.kernel_frame(segments,kernel), bbox_kernels.kernel_frame(frame,kernel))
+
+    # The mean kernel matches the mean of the dense frame
+    expected = frame.iloc[:,1:].astype(np.float64).mean(axis=1).to_numpy()
+    np.testing.assert_allclose(bbox_kernels.kernel_frame(frame,bbox_kernels.kernel_mean).iloc[:,1], expected, rtol=1e-12)
+
+def test_kernel_frame_rejects_monthly_values():
+    monthly = stnmatrix.StationMonthly.__new__(stnmatrix.StationMonthly)
+    with pytest.raises(ValueError):
+     bbox_kernels.kernel_frame(monthly, bbox_kernels.kernel_mean)
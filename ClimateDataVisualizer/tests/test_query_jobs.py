@@ -0,0 +1,109 @@
+#######################################################################################################
+#
+# Background query jobs: progress, cancellation and failures, against the local stub server
+#
+#######################################################################################################
+
+import threading
+import numpy as np
+import pytest
+
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_stndata as stndata
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_jobs as stnjobs
+
+# Bounding box holding every stub station
+bbox = dict(slat=38.4, nlat=38.8, wlon=-90.3, elon=-89.8)
+
+quiet = dict(print_results=False, print_md=False)
+
+#======================================================================================================
+# Progress
+#======================================================================================================
+
+def test_progress_counts_every_station_once(acis):
+    reports = []
+    jobs = stnjobs.JobQueue()
+    job = jobs.submit(stndata.bbox_multielem_daily, elems=('maxt','pcpn'), **bbox, chunk_size=1,
+                      listener=lambda job: reports.append((job.state,job.stations_done,
+                                                           job.stations_total,job.nbytes)), **quiet)
+    results = job.wait(timeout=30)
+
+    assert job.state == 'done' and job.fraction == 1.
+    assert set(results) == {'maxt','pcpn'}
+    # Running, one report per chunk of one station, then done
+    assert reports[0][0] == 'running' and reports[-1][0] == 'done'
+    progress = [report[1:] for report in reports if report[0] == 'running' and report[2] > 0]
+    assert [done for done, total, nbytes in progress] == [1,2,3,4]
+    assert all(total == 4 for done, total, nbytes in progress)
+    assert all(a[2] <= b[2] for a, b in zip(progress,progress[1:])) and progress[-1][2] > 0
+    assert acis.count('MultiStnData') == 4
+    assert job.status().startswith('bbox_multielem_daily: done, 4/4 stations')
+
+#======================================================================================================
+# Cancellation
+#======================================================================================================
+
+def test_cancelled_job_keeps_partial_results(acis):
+    full = stndata.bbox_multielem_daily(('maxt',), **bbox, **quiet)['maxt'][0]
+    acis.reset()
+
+    # Cancelled once the first of four chunks is done, chunks are sent one at a time
+    def cancel_after_first(job):
+     if job.stations_done == 1:
+      job.cancel()
+
+    job = stnjobs.JobQueue().submit(stndata.bbox_multielem_daily, elems=('maxt',), **bbox, chunk_size=1,
+                                    max_workers=1, listener=cancel_after_first, **quiet)
+    df, meta = job.wait(timeout=30)['maxt']
+
+    assert job.state == 'cancelled'
+    assert acis.count('MultiStnData') == 1
+    assert meta.attrs['failed_sids'] == ['100002','100003','100004']
+    np.testing.assert_array_equal(df.iloc[:,1].to_numpy(), full.iloc[:,1].to_numpy())
+    for i in range(2,5):
+     assert np.isnan(df.iloc[:,i].to_numpy()).all()
+
+def test_cancelled_queued_job_is_not_run(acis):
+    running, release = threading.Event(), threading.Event()
+    def blocking(progress, cancel):
+     running.set()
+     release.wait(10)
+     return 'first'
+
+    jobs = stnjobs.JobQueue()
+    first = jobs.submit(blocking)
+    assert running.wait(10)
+    second = jobs.submit(stndata.bbox_multielem_daily, elems=('maxt',), **bbox, **quiet)
+    assert jobs.queued() == [second]
+    second.cancel()
+    assert second.state == 'cancelled' and jobs.queued() == []
+    release.set()
+
+    assert first.wait(timeout=30) == 'first'
+    assert second.wait(timeout=30) is None
+    # Let the worker pick up the cancelled job before checking no request was sent
+    jobs.submit(lambda progress, cancel: None).wait(timeout=30)
+    assert second.started is None
+    assert acis.count('StnMeta') == 0 and acis.count('MultiStnData') == 0
+
+#======================================================================================================
+# Failures
+#======================================================================================================
+
+def test_failed_job_raises_its_error(acis):
+    job = stnjobs.JobQueue().submit(stndata.bbox_multielem_daily, elems=('maxt',), **bbox, stn_size=4,
+                                    **quiet)
+    with pytest.raises(SystemExit):
+     job.wait(timeout=30)
+
+    assert job.state == 'failed' and isinstance(job.error, SystemExit)
+    assert acis.count('MultiStnData') == 0
+
+def test_listener_errors_do_not_stop_the_job(acis):
+    def broken(job):
+     raise RuntimeError('listener')
+
+    job = stnjobs.JobQueue().submit(stndata.bbox_multielem_daily, elems=('maxt',), **bbox, listener=broken,
+                                    **quiet)
+    assert len(job.wait(timeout=30)['maxt'][1]) == 4
+    assert job.state == 'done'
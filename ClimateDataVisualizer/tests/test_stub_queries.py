@@ -0,0 +1,180 @@
+#######################################################################################################
+#
+# Multi station queries over StnData and MultiStnData against the local stub server
+#
+#######################################################################################################
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import acis_stub
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_stndata as stndata
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_stream as stream
+
+# Bounding box holding every stub station
+bbox = dict(slat=38.4, nlat=38.8, wlon=-90.3, elon=-89.8)
+
+quiet = dict(print_results=False, print_md=False)
+
+def expected_values(elem: str, sid: str, sdate: str, edate: str):
+    # Station values decoded straight from the stub's raw values, without any request
+    start = (pd.Timestamp(sdate) - pd.Timestamp(acis_stub.record_sdate)).days
+    end = (pd.Timestamp(edate) - pd.Timestamp(acis_stub.record_sdate)).days
+    raw = stream.encode_values(acis_stub.station_series(sid,elem)[start:end+1])
+    return stndata.singlestn_decode(elem=elem,sid=sid,sdate=sdate,edate=edate,values=raw,print_md=False)
+
+#======================================================================================================
+# StnData
+#======================================================================================================
+
+@pytest.mark.parametrize('elem', ['maxt','pcpn'])
+def test_bbox_stndata_matches_station_values(acis, elem):
+    df, meta = stndata.bbox_multistn_daily(elem, **bbox, **quiet)
+
+    assert list(meta['sids']) == ['100001','100002','100003','100004']
+    assert acis.count('StnData') == 4
+    assert meta.attrs['failed_sids'] == [] and df.attrs['failed_sids'] == []
+    assert df['Date'].iloc[0] == pd.Timestamp('1990-03-05')
+    assert df['Date'].iloc[-1] == pd.Timestamp('2003-06-30')
+
+    # Columns follow the metadata order whatever order the concurrent requests finish in
+    for i in range(len(meta)):
+     column = df.iloc[:,i+1].to_numpy()
+     expected = expected_values(elem,meta['sids'][i],meta['sdate'][i],meta['edate'][i])
+     inside = (df['Date'] >= pd.Timestamp(meta['sdate'][i])) & (df['Date'] <= pd.Timestamp(meta['edate'][i]))
+     np.testing.assert_array_equal(column[inside.to_numpy()], expected)
+     assert np.isnan(column[~inside.to_numpy()]).all()
+
+def test_bbox_stndata_same_for_any_number_of_workers(acis):
+    df1, meta1 = stndata.bbox_multistn_daily('pcpn', **bbox, max_workers=1, **quiet)
+    df8, meta8 = stndata.bbox_multistn_daily('pcpn', **bbox, max_workers=8, **quiet)
+    pd.testing.assert_frame_equal(df1, df8)
+    pd.testing.assert_frame_equal(meta1, meta8)
+
+#======================================================================================================
+# MultiStnData
+#======================================================================================================
+
+@pytest.mark.parametrize('elem', ['mint','snow'])
+@pytest.mark.parametrize('chunk_size', [1,3,50])
+def test_bbox_multistndata_matches_stndata(acis, elem, chunk_size):
+    df_stn, meta_stn = stndata.bbox_multistn_daily(elem, **bbox, **quiet)
+    acis.reset()
+    df_multi, meta_multi = stndata.bbox_multistn_daily(elem, **bbox, query_mode='multistndata',
+                                                        chunk_size=chunk_size, **quiet)
+
+    assert acis.count('StnData') == 0
+    assert acis.count('MultiStnData') == -(-4//chunk_size)
+    pd.testing.assert_frame_equal(df_stn, df_multi)
+
+def test_bbox_target_days_matches_stndata(acis):
+    df_stn, _ = stndata.bbox_multistn_daily('pcpn', **bbox, **quiet)
+    df_multi, _ = stndata.bbox_multistn_daily('pcpn', **bbox, target_days=5000, **quiet)
+    pd.testing.assert_frame_equal(df_stn, df_multi)
+
+def test_bbox_multielem_matches_single_elements(acis):
+    results = stndata.bbox_multielem_daily(('maxt','pcpn'), **bbox, **quiet)
+    for elem in ('maxt','pcpn'):
+     df, meta = stndata.bbox_multistn_daily(elem, **bbox, **quiet)
+     pd.testing.assert_frame_equal(results[elem][0], df)
+
+#======================================================================================================
+# Station ids
+#======================================================================================================
+
+@pytest.mark.parametrize('query_mode', ['stndata','multistndata'])
+def test_sids_query_keeps_order_of_sids(acis, query_mode):
+    df_bbox, _ = stndata.bbox_multistn_daily('maxt', **bbox, **quiet)
+    df, meta = stndata.sids_multistn_daily('maxt', ['100003','100001'], query_mode=query_mode, **quiet)
+
+    assert list(meta['sids']) == ['100003','100001']
+    dates = df_bbox['Date'].isin(df['Date']).to_numpy()
+    for c in range(2):
+     column = [name for name in df_bbox.columns if name.startswith(meta['sids'][c]+':')][0]
+     np.testing.assert_array_equal(df.iloc[:,c+1].to_numpy(), df_bbox[column].to_numpy()[dates])
+
+#======================================================================================================
+# On-disk cache
+#======================================================================================================
+
+def test_cached_stations_are_not_queried_again(acis):
+    df1, _ = stndata.bbox_multistn_daily('pcpn', **bbox, use_cache=True, **quiet)
+    acis.reset()
+    df2, _ = stndata.bbox_multistn_daily('pcpn', **bbox, use_cache=True, **quiet)
+
+    assert acis.count('StnData') == 0
+    pd.testing.assert_frame_equal(df1, df2)
+
+#======================================================================================================
+# Size of the query
+#======================================================================================================
+
+def test_query_split_by_target_days_is_limited_by_max_days(acis):
+    # The stub stations hold 4320+3103+1768+1812 = 11003 daily values of maxt
+    df, meta = stndata.bbox_multistn_daily('maxt', **bbox, target_days=5000, max_days=11003, **quiet)
+    assert len(meta) == 4
+    acis.reset()
+    with pytest.raises(SystemExit):
+     stndata.bbox_multistn_daily('maxt', **bbox, target_days=5000, max_days=11002, **quiet)
+    with pytest.raises(SystemExit):
+     stndata.bbox_multielem_daily(('maxt','pcpn'), **bbox, target_days=5000, max_days=11003, **quiet)
+    assert acis.count('StnData') == 0 and acis.count('MultiStnData') == 0
+
+def test_query_without_target_days_is_limited_by_stn_size(acis):
+    with pytest.raises(SystemExit):
+     stndata.bbox_multistn_daily('maxt', **bbox, stn_size=4, **quiet)
+    with pytest.raises(SystemExit):
+     stndata.bbox_multielem_daily(('maxt','pcpn'), **bbox, stn_size=4, **quiet)
+
+#======================================================================================================
+# Monthly values
+#======================================================================================================
+
+def test_monthly_max_matches_daily_values(acis):
+    monthly, meta = stndata.bbox_multistn_monthly('maxt', **bbox, print_results=False)
+    months = pd.date_range('1990-03-01','2003-06-01',freq='MS')
+
+    assert meta.attrs['failed_sids'] == []
+    for i in range(len(meta)):
+     daily = pd.Series(expected_values('maxt',meta['sids'][i],'1990-03-01','2003-06-30'),
+                       index=pd.date_range('1990-03-01','2003-06-30',freq='D'))
+     values, counts = stndata.multistn_fetch_monthly('maxt', meta.iloc[[i]].reset_index(drop=True), months,
+                                                     print_results=False)[:2]
+     np.testing.assert_array_equal(values[0], daily.resample('MS').max().to_numpy(dtype=np.float32))
+     np.testing.assert_array_equal(counts[0], daily.resample('MS').count().to_numpy())
+
+def test_monthly_multi_day_totals_are_missing(acis):
+    _, meta = stndata.bbox_multistn_monthly('pcpn', **bbox, print_results=False)
+    months = pd.date_range('1995-01-01','2003-06-01',freq='MS')
+    values, counts, failed = stndata.multistn_fetch_monthly('pcpn', meta, months, print_results=False)
+
+    series = acis_stub.station_series('100002','pcpn')
+    i = list(meta['sids']).index('100002')
+    accumulated = 0
+    for m, month in enumerate(months):
+     start = (month - pd.Timestamp(acis_stub.record_sdate)).days
+     days = [v for v in series[start:start+month.days_in_month] if v not in ('M','S')]
+     top = max(days, key=lambda v: 0.0 if v == 'T' else float(v.rstrip('A')))
+     assert counts[i][m] == len(days)
+     if top.endswith('A'):
+      accumulated += 1
+      assert np.isnan(values[i][m])
+     elif top != 'T':
+      assert values[i][m] == np.float32(top)
+    assert accumulated > 0
+
+def test_monthly_missing_and_failed_stations(acis):
+    _, meta = stndata.bbox_multistn_monthly('maxt', **bbox, print_results=False)
+    # Station 999999 is left out of the answer, station 100002 cannot be queried
+    extra = pd.DataFrame({'sids': ['999999'], 'name': ['STN X'], 'state': ['MO']})
+    meta = pd.concat([meta[['sids','name','state']],extra],ignore_index=True)
+    months = pd.date_range('1995-01-01','1995-12-01',freq='MS')
+    acis.fail('MultiStnData', 503, sid='100002')
+    values, counts, failed = stndata.multistn_fetch_monthly('maxt', meta, months, M=-999.0,
+                                                            print_results=False)
+
+    assert failed == ['100002']
+    assert np.isnan(values[1]).all()
+    assert (values[4] == -999.0).all() and (counts[4] == 0).all()
+    assert not np.isnan(values[0]).any()
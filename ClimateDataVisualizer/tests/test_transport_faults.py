@@ -0,0 +1,187 @@
+#######################################################################################################
+#
+# Retries of the shared transport and isolation of failed stations, with faults injected by the stub
+#
+#######################################################################################################
+
+import time, http.client, urllib.error
+import numpy as np
+import pandas as pd
+import pytest
+
+import acis_stub
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_transport as transport
+from ClimateDataVisualizer.dataquery import NOAA_ACIS_stndata as stndata
+
+# Bounding box holding every stub station
+bbox = dict(slat=38.4, nlat=38.8, wlon=-90.3, elon=-89.8)
+
+quiet = dict(print_results=False, print_md=False)
+
+meta_request = {'bbox': '-89.8,38.4,-90.3,38.8', 'elems': 'maxt', 'meta': 'sids'}
+
+#======================================================================================================
+# Transport retries
+#======================================================================================================
+
+@pytest.mark.parametrize('status', [429,500,502,503,504])
+def test_retry_status_is_sent_again(acis, status):
+    acis.fail('StnMeta', status, times=2)
+    assert len(transport.acis_request('StnMeta',meta_request)['meta']) == 4
+    assert acis.count('StnMeta') == 3
+
+def test_retry_after_is_honored_up_to_backoff_max(acis):
+    transport.configure_transport(backoff_s=0, backoff_max_s=0.3)
+    acis.fail('StnMeta', 429, times=1, retry_after='60')
+    start = time.perf_counter()
+    transport.acis_request('StnMeta',meta_request)
+    waited = time.perf_counter() - start
+    # Waits 'backoff_max' instead of the 60 seconds asked, but does wait although backoff is 0
+    assert 0.25 <= waited < 5
+    assert acis.count('StnMeta') == 2
+
+def test_dropped_connection_is_sent_again(acis):
+    acis.fail('StnMeta', 'drop', times=2)
+    assert len(transport.acis_request('StnMeta',meta_request)['meta']) == 4
+    assert acis.count('StnMeta') == 3
+
+def test_other_status_is_not_retried(acis):
+    acis.fail('StnMeta', 404)
+    with pytest.raises(urllib.error.HTTPError) as error:
+     transport.acis_request('StnMeta',meta_request)
+    assert error.value.code == 404
+    assert acis.count('StnMeta') == 1
+
+def test_error_is_raised_once_retries_are_used(acis):
+    acis.fail('StnMeta', 503)
+    with pytest.raises(urllib.error.HTTPError) as error:
+     transport.acis_request('StnMeta',meta_request)
+    assert error.value.code == 503
+    assert acis.count('StnMeta') == transport.retries+1
+
+def test_connection_error_is_raised_once_retries_are_used(acis):
+    acis.fail('StnMeta', 'drop')
+    with pytest.raises((OSError, http.client.HTTPException)):
+     transport.acis_request('StnMeta',meta_request)
+    assert acis.count('StnMeta') == transport.retries+1
+
+def test_streamed_response_is_retried(acis):
+    acis.fail('StnData', 503, times=1)
+    acis.fail('StnData', 'drop', times=1)
+    values = stndata.json_req_stndata('maxt','100001','1995-01-01','1995-12-31')
+    assert len(values) == 365
+    assert acis.count('StnData') == 3
+
+#======================================================================================================
+# Failed stations
+#======================================================================================================
+
+@pytest.mark.parametrize('query_mode', ['stndata','multistndata'])
+def test_failed_station_is_isolated(acis, query_mode):
+    df_ok, _ = stndata.bbox_multistn_daily('pcpn', **bbox, query_mode=query_mode, **quiet)
+    acis.reset()
+    acis.fail('StnData', 503, sid='100002')
+    acis.fail('MultiStnData', 503, sid='100002')
+    df, meta = stndata.bbox_multistn_daily('pcpn', **bbox, query_mode=query_mode, **quiet)
+
+    assert meta.attrs['failed_sids'] == ['100002'] and df.attrs['failed_sids'] == ['100002']
+    for i in range(len(meta)):
+     if meta['sids'][i] == '100002':
+      assert np.isnan(df.iloc[:,i+1].to_numpy()).all()
+     else:
+      np.testing.assert_array_equal(df.iloc[:,i+1].to_numpy(), df_ok.iloc[:,i+1].to_numpy())
+
+def test_failed_chunk_is_queried_station_by_station(acis):
+    df_ok, _ = stndata.bbox_multistn_daily('maxt', **bbox, **quiet)
+    acis.reset()
+    acis.fail('MultiStnData', 'drop')
+    df, meta = stndata.bbox_multistn_daily('maxt', **bbox, query_mode='multistndata', **quiet)
+
+    assert meta.attrs['failed_sids'] == []
+    assert acis.count('StnData') == 4
+    pd.testing.assert_frame_equal(df, df_ok)
+
+@pytest.mark.parametrize('query_mode', ['stndata','multistndata'])
+def test_failed_station_raises_if_asked(acis, query_mode):
+    acis.fail('StnData', 503, sid='100002')
+    acis.fail('MultiStnData', 503, sid='100002')
+    with pytest.raises(urllib.error.HTTPError):
+     stndata.bbox_multistn_daily('maxt', **bbox, query_mode=query_mode, on_error='raise', **quiet)
+
+#======================================================================================================
+# Refresh
+#======================================================================================================
+
+def previous_query(df: pd.DataFrame, meta: pd.DataFrame, edate: str, new_sid: str):
+    # Query as it was on 'edate', before station 'new_sid' was added to the bounding box
+    keep = [i for i in range(len(meta)) if meta['sids'][i] != new_sid]
+    old_meta = meta.iloc[keep].reset_index(drop=True)
+    old_meta['edate'] = pd.Series([min(str(e),edate) for e in old_meta['edate']],dtype='string')
+    old_df = df.loc[df['Date'] <= pd.Timestamp(edate), ['Date']+[df.columns[i+1] for i in keep]]
+    return old_df.reset_index(drop=True), old_meta
+
+@pytest.mark.parametrize('query_mode', ['stndata','multistndata'])
+def test_refresh_keeps_failed_stations_for_next_refresh(acis, query_mode):
+    df_full, meta_full = stndata.bbox_multistn_daily('maxt', **bbox, **quiet)
+    old_df, old_meta = previous_query(df_full, meta_full, '2000-12-31', new_sid='100004')
+
+    # Previously queried station 100001 and new station 100004 fail
+    acis.fail('StnData', 503, sid='100001')
+    acis.fail('StnData', 503, sid='100004')
+    acis.fail('MultiStnData', 503, sid='100001')
+    acis.fail('MultiStnData', 503, sid='100004')
+    df, meta = stndata.bbox_multistn_refresh('maxt', old_df, old_meta, **bbox, query_mode=query_mode, **quiet)
+
+    assert sorted(meta.attrs['failed_sids']) == ['100001','100004']
+    # Failed stations keep their previous metadata and data, or are not added
+    assert list(meta['sids']) == list(old_meta['sids'])
+    assert meta['edate'][0] == '2000-12-31'
+    assert meta['edate'][1] == meta_full['edate'][1]
+    column = df_full.columns[1]
+    np.testing.assert_array_equal(df.loc[df['Date'] <= pd.Timestamp('2000-12-31'), column].to_numpy(),
+                                  old_df[column].to_numpy())
+    assert np.isnan(df.loc[df['Date'] > pd.Timestamp('2000-12-31'), column].to_numpy()).all()
+
+    # The next refresh queries the missing days and adds the new station
+    acis.reset()
+    df, meta = stndata.bbox_multistn_refresh('maxt', df, meta, **bbox, query_mode=query_mode, **quiet)
+
+    assert meta.attrs['failed_sids'] == []
+    assert list(meta['sids']) == ['100001','100002','100003','100004']
+    pd.testing.assert_frame_equal(meta[list(meta_full.columns)], meta_full, check_like=True)
+    pd.testing.assert_series_equal(df['Date'], df_full['Date'])
+    for column in df_full.columns[1:]:
+     np.testing.assert_array_equal(df[column].to_numpy(), df_full[column].to_numpy())
+
+@pytest.mark.parametrize('query_mode', ['stndata','multistndata'])
+def test_refresh_averages_events_straddling_the_replaced_days(acis, query_mode):
+    # Previous edate chosen so the first of the replaced days falls inside a multi-day event of 100002,
+    # after its first S and on or before its A
+    mdr = 5
+    series = acis_stub.station_series('100002','pcpn')
+    start = (pd.Timestamp('1998-01-01') - pd.Timestamp(acis_stub.record_sdate)).days
+    s = next(d for d in range(start,len(series)) if series[d:d+2] == ['S','S'] and 'A' in series[d+2])
+    edate = str((pd.Timestamp(acis_stub.record_sdate) + pd.Timedelta(days=s+mdr)).date())
+
+    df_full, meta_full = stndata.bbox_multistn_daily('pcpn', **bbox, mdr=mdr, **quiet)
+    old_df, old_meta = previous_query(df_full, meta_full, edate, new_sid=None)
+    df, meta = stndata.bbox_multistn_refresh('pcpn', old_df, old_meta, **bbox, mdr=mdr, query_mode=query_mode,
+                                             **quiet)
+
+    pd.testing.assert_series_equal(df['Date'], df_full['Date'])
+    for column in df_full.columns[1:]:
+     np.testing.assert_array_equal(df[column].to_numpy(), df_full[column].to_numpy())
+
+@pytest.mark.parametrize('query_mode', ['stndata','multistndata'])
+def test_refresh_applies_the_prefilter_of_the_previous_query(acis, query_mode):
+    # Stations 100003 and 100004 have fewer than 3000 days and are left out by the prefilter
+    df_full, meta_full = stndata.bbox_multistn_daily('maxt', **bbox, min_days=3000, **quiet)
+    old_df, old_meta = previous_query(df_full, meta_full, '2000-12-31', new_sid=None)
+    acis.reset()
+    df, meta = stndata.bbox_multistn_refresh('maxt', old_df, old_meta, **bbox, min_days=3000,
+                                             query_mode=query_mode, **quiet)
+
+    assert list(meta['sids']) == ['100001','100002']
+    requested = {sid for call in acis.calls for sid in str(call[1].get('sid',call[1].get('sids',''))).split(',')}
+    assert requested.isdisjoint({'100003','100004'})
+    pd.testing.assert_frame_equal(df, df_full)